@@ -129,6 +129,8 @@ func RocketnotesStack(scope constructs.Construct, id string, props *RocketnotesS
 				awscdkapigatewayv2alpha.CorsHttpMethod_POST,
 				awscdkapigatewayv2alpha.CorsHttpMethod_DELETE,
 			},
+			// Semantic search returns the cursor of the next page in this header
+			ExposeHeaders: jsii.Strings("X-Next-Cursor"),
 		},
 	})
 
@@ -433,10 +435,12 @@ func RocketnotesStack(scope constructs.Construct, id string, props *RocketnotesS
 		}),
 		Events: &[]awslambda.IEventSource{
 			awslambdaeventsources.NewSqsEventSource(vectorQueue, &awslambdaeventsources.SqsEventSourceProps{
-				BatchSize: jsii.Number(1),
+				BatchSize:               jsii.Number(10),
+				MaxBatchingWindow:       awscdk.Duration_Seconds(jsii.Number(5)),
+				ReportBatchItemFailures: jsii.Bool(true),
 			}),
 		},
-		Environment: &map[string]*string{"BUCKET_NAME": bucket.BucketName()},
+		Environment: &map[string]*string{"BUCKET_NAME": bucket.BucketName(), "EMBEDDING_CACHE_BACKEND": jsii.String("s3")},
 		Role:        lambdaS3SqsDynamoDbRole,
 		MemorySize:  jsii.Number(1024),
 		Timeout:     awscdk.Duration_Seconds(jsii.Number(900)),
@@ -450,7 +454,7 @@ func RocketnotesStack(scope constructs.Construct, id string, props *RocketnotesS
 			File:     jsii.String("handler_semantic_search/Dockerfile"),
 			Platform: awsecrassets.Platform_LINUX_AMD64(),
 		}),
-		Environment: &map[string]*string{"BUCKET_NAME": bucket.BucketName()},
+		Environment: &map[string]*string{"BUCKET_NAME": bucket.BucketName(), "EMBEDDING_CACHE_BACKEND": jsii.String("s3")},
 		Role:        lambdaS3DynamoDbRole,
 		MemorySize:  jsii.Number(1024),
 		Timeout:     awscdk.Duration_Seconds(jsii.Number(900)),
@@ -471,7 +475,7 @@ func RocketnotesStack(scope constructs.Construct, id string, props *RocketnotesS
 			File:     jsii.String("handler_chat/Dockerfile"),
 			Platform: awsecrassets.Platform_LINUX_AMD64(),
 		}),
-		Environment: &map[string]*string{"BUCKET_NAME": bucket.BucketName()},
+		Environment: &map[string]*string{"BUCKET_NAME": bucket.BucketName(), "EMBEDDING_CACHE_BACKEND": jsii.String("s3")},
 		Role:        lambdaS3DynamoDbRole,
 		MemorySize:  jsii.Number(1024),
 		Timeout:     awscdk.Duration_Seconds(jsii.Number(900)),
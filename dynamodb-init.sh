@@ -31,6 +31,12 @@ aws dynamodb create-table --endpoint-url http://localhost:8041 --table-name tnn-
 --provisioned-throughput ReadCapacityUnits=2,WriteCapacityUnits=2 \
 > /dev/null 2>&1
 
+aws dynamodb create-table --endpoint-url http://localhost:8041 --table-name tnn-EmbeddingCache \
+--attribute-definitions AttributeName=id,AttributeType=S \
+--key-schema AttributeName=id,KeyType=HASH \
+--provisioned-throughput ReadCapacityUnits=2,WriteCapacityUnits=2 \
+> /dev/null 2>&1
+
 aws dynamodb create-table --endpoint-url http://localhost:8041 --table-name tnn-Zettelkasten \
 --attribute-definitions AttributeName=id,AttributeType=S AttributeName=userId,AttributeType=S \
 --key-schema AttributeName=id,KeyType=HASH \
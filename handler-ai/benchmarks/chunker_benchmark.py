@@ -0,0 +1,72 @@
+"""
+Compare header-only splitting with the token-bounded chunker.
+
+Prints chunk counts, token statistics and split latency for a synthetic corpus
+of markdown notes, or for the markdown files of a directory:
+
+    python -m benchmarks.chunker_benchmark [notes_dir] [embeddings_model]
+"""
+
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from langchain_text_splitters import MarkdownHeaderTextSplitter
+
+from rocketnotes_handler.lib.chunker import get_chunker, headers_to_split_on
+
+WORDS = "note idea vector markdown search index token header section text".split()
+
+
+def synthetic_notes(count=200, seed=0):
+    rng = random.Random(seed)
+    notes = []
+    for _ in range(count):
+        sections = []
+        for level in rng.choices([1, 2, 3], k=rng.randint(1, 12)):
+            words = rng.choice([3, 10, 50, 200, 1500])
+            text = " ".join(rng.choices(WORDS, k=words))
+            sections.append(f"{'#' * level} Heading\n{text}")
+        notes.append("\n".join(sections))
+    return notes
+
+
+def load_notes(directory):
+    return [path.read_text() for path in Path(directory).rglob("*.md")]
+
+
+def report(name, split, notes, count_tokens):
+    start = time.perf_counter()
+    chunks = [chunk for note in notes for chunk in split(note)]
+    elapsed = time.perf_counter() - start
+    tokens = [count_tokens(chunk) for chunk in chunks]
+    print(
+        f"{name:<12} chunks={len(chunks):>6} "
+        f"tokens min={min(tokens):>5} median={statistics.median(tokens):>7.1f} "
+        f"max={max(tokens):>6} "
+        f"latency={elapsed * 1000 / len(notes):.2f} ms/note"
+    )
+
+
+def main():
+    notes = load_notes(sys.argv[1]) if len(sys.argv) > 1 else synthetic_notes()
+    embeddings_model = sys.argv[2] if len(sys.argv) > 2 else None
+    chunker = get_chunker(embeddings_model)
+    header_splitter = MarkdownHeaderTextSplitter(
+        headers_to_split_on=headers_to_split_on, strip_headers=False
+    )
+
+    print(f"{len(notes)} notes, max {chunker.max_tokens} tokens per chunk")
+    report(
+        "header-only",
+        lambda note: [split.page_content for split in header_splitter.split_text(note)],
+        notes,
+        chunker.count_tokens,
+    )
+    report("chunker", chunker.split_text, notes, chunker.count_tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Reindex time of Ollama embeddings, one request per text against /api/embed batches.
+
+Embeds the same sections with the langchain OllamaEmbeddings (one /api/embeddings
+request per text) and with OllamaBatchEmbeddings at different batch sizes:
+
+    python -m benchmarks.ollama_embeddings_benchmark --base-url http://localhost:11434 --sections 2000
+
+Requires a running Ollama with the model pulled.
+"""
+
+import argparse
+import time
+
+from langchain_community.embeddings import OllamaEmbeddings
+
+from rocketnotes_handler.lib.ollama_embeddings import OllamaBatchEmbeddings
+
+
+def measure(name, embeddings, texts):
+    start = time.perf_counter()
+    embeddings.embed_documents(texts)
+    seconds = time.perf_counter() - start
+    print(f"{name:<24} {seconds:8.2f} s {len(texts) / seconds:8.1f} sections/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:11434")
+    parser.add_argument("--model", default="nomic-embed-text")
+    parser.add_argument("--sections", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--skip-single", action="store_true")
+    args = parser.parse_args()
+
+    texts = [
+        f"Section {i} of a note about vector search, chunking and embeddings. " * 4
+        for i in range(args.sections)
+    ]
+    # Loads the model, so neither client pays for it
+    OllamaBatchEmbeddings(args.model, base_url=args.base_url).embed_query("warm up")
+
+    if not args.skip_single:
+        measure(
+            "single /api/embeddings",
+            OllamaEmbeddings(base_url=args.base_url, model=args.model),
+            texts,
+        )
+    for batch_size in args.batch_sizes:
+        measure(
+            f"/api/embed batch={batch_size}",
+            OllamaBatchEmbeddings(
+                args.model, base_url=args.base_url, batch_size=batch_size
+            ),
+            texts,
+        )
+
+
+if __name__ == "__main__":
+    main()
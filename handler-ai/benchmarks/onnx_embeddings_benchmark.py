@@ -0,0 +1,103 @@
+"""
+Throughput, memory and agreement of the local embeddings backends.
+
+Embeds the same sections with PyTorch, ONNX Runtime and int8 quantized ONNX
+Runtime. Every backend runs in a fresh process, so the reported peak RSS covers
+loading the model and embedding. Agreement is the cosine similarity between
+the vectors of a backend and the PyTorch vectors of the same section:
+
+    python -m benchmarks.onnx_embeddings_benchmark --notes ~/notes --quantization avx2
+
+Requires sentence-transformers[onnx] and downloads the model on first use.
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+from pathlib import Path
+
+import numpy as np
+
+from rocketnotes_handler.lib.chunker import get_chunker
+from rocketnotes_handler.lib.local_embeddings import \
+    get_sentence_transformers_embeddings
+
+
+def load_sections(notes_dir: Path | None, count: int) -> list[str]:
+    if notes_dir is None:
+        return [
+            f"Section {i} of a note about vector search, chunking and embeddings."
+            for i in range(count)
+        ]
+    chunker = get_chunker("Sentence-Transformers")
+    texts = []
+    for path in sorted(notes_dir.rglob("*.md")):
+        for chunk in chunker.split_text(path.read_text(errors="ignore")):
+            if len(chunk.strip()) > 12:
+                texts.append(f"{path.stem}\n{chunk}")
+    return texts[:count]
+
+
+def run_backend(backend: str, quantization: str | None, texts: list[str], queue):
+    start = time.perf_counter()
+    embeddings = get_sentence_transformers_embeddings(backend, quantization)
+    load_ms = (time.perf_counter() - start) * 1000
+    embeddings.embed_query("warm up")
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((load_ms, len(texts) / seconds, peak_mb, vectors))
+
+
+def measure(backend: str, quantization: str | None, texts: list[str]):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=run_backend, args=(backend, quantization, texts, queue)
+    )
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=1) / (
+        np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=Path)
+    parser.add_argument("--sections", type=int, default=512)
+    parser.add_argument("--quantization", default="avx2")
+    args = parser.parse_args()
+
+    texts = load_sections(args.notes, args.sections)
+    print(f"{len(texts)} sections")
+
+    reference = None
+    for backend, quantization in [
+        ("torch", None),
+        ("onnx", None),
+        ("onnx", args.quantization),
+    ]:
+        load_ms, throughput, peak_mb, vectors = measure(backend, quantization, texts)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if reference is None:
+            reference = vectors
+        agreement = cosine(vectors, reference)
+        name = f"{backend} qint8 {quantization}" if quantization else backend
+        print(
+            f"{name:<20} load={load_ms:7.0f} ms {throughput:8.1f} sections/s "
+            f"peak={peak_mb:7.0f} MB "
+            f"cosine mean={agreement.mean():.4f} min={agreement.min():.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
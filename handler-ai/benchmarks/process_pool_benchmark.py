@@ -0,0 +1,61 @@
+"""
+Reindex throughput of local embeddings by number of worker processes.
+
+Embeds the same sections through the recreateIndex executor with the process
+pool at different sizes and reports sections per second and the speedup over a
+single worker. Worker start-up (loading the model) is excluded by warming the
+pool first:
+
+    python -m benchmarks.process_pool_benchmark --workers 1 2 4 8 --sections 4096
+
+Requires sentence-transformers, or a running Ollama with --model Ollama-nomic-embed-text.
+"""
+
+import argparse
+import time
+
+from rocketnotes_handler.lib.embedding_executor import EmbeddingExecutor
+from rocketnotes_handler.lib.process_pool_embeddings import ProcessPoolEmbeddings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="Sentence-Transformers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sections", type=int, default=2048)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--shard-size", type=int, default=16)
+    args = parser.parse_args()
+
+    texts = [
+        f"Section {i} of a note about vector search, chunking and embeddings. " * 4
+        for i in range(args.sections)
+    ]
+    batches = [
+        texts[start : start + args.batch_size]
+        for start in range(0, len(texts), args.batch_size)
+    ]
+
+    baseline = None
+    for workers in args.workers:
+        embeddings = ProcessPoolEmbeddings(
+            args.model, max_workers=workers, shard_size=args.shard_size
+        )
+        embeddings.embed_documents(["warm up"] * workers * args.shard_size)
+        executor = EmbeddingExecutor(
+            embeddings, provider="process-pool", max_concurrency=workers
+        )
+        start = time.perf_counter()
+        for _ in executor.map(batches, lambda batch: batch):
+            pass
+        throughput = len(texts) / (time.perf_counter() - start)
+        embeddings.close()
+        baseline = baseline or throughput
+        print(
+            f"workers={workers:<3} {throughput:8.1f} sections/s "
+            f"speedup={throughput / baseline:4.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Memory, query latency and recall@k of quantized search against exact search.
+
+Uses synthetic clustered vectors by default. For a real note corpus pass the
+vectors.npy of a user's numpy index (VECTOR_STORE_PATH/<userId>/vectors.npy),
+queries are then sampled from the notes themselves and perturbed:
+
+    python -m benchmarks.quantization_benchmark --count 50000 --dim 768
+    python -m benchmarks.quantization_benchmark --vectors /tmp/rocketnotes-vectors/<userId>/vectors.npy
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.vector_store_benchmark import (build, recall_at_k, search,
+                                               synthetic_vectors)
+from rocketnotes_handler.lib.numpy_vector_store import NumpyVectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", help="vectors.npy of a real note corpus")
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.count, args.dim)
+    rng = np.random.default_rng(1)
+    sample = vectors[rng.integers(0, len(vectors), args.queries)]
+    noise = rng.normal(size=sample.shape) * sample.std() * 0.5
+    queries = (sample + noise).astype(np.float32)
+
+    exact = NumpyVectorStore(None)
+    build(exact, vectors, batch_size=len(vectors))
+    exact_results, exact_ms = search(exact, queries, args.k)
+    exact_bytes = exact._vectors.nbytes
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, k={args.k}")
+    print(f"float32  memory={exact_bytes / 2**20:8.1f} MiB query={exact_ms:7.3f} ms")
+
+    for quantization in ("int8", "binary"):
+        store = NumpyVectorStore(None, quantization=quantization)
+        start = time.perf_counter()
+        build(store, vectors, batch_size=len(vectors))
+        build_seconds = time.perf_counter() - start
+        results, query_ms = search(store, queries, args.k)
+        code_bytes = store._quantized.nbytes
+        print(
+            f"{quantization:<8} memory={code_bytes / 2**20:8.1f} MiB "
+            f"({exact_bytes / code_bytes:4.1f}x smaller) "
+            f"query={query_ms:7.3f} ms ({exact_ms / query_ms:4.1f}x) "
+            f"recall@{args.k}={recall_at_k(results, exact_results, args.k):.3f} "
+            f"build={build_seconds:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Added latency and retrieval quality of the cross-encoder rerank stage.
+
+Splits a directory of markdown notes with the production chunker, embeds the
+sections with a Sentence-Transformers bi-encoder and uses one sentence of every
+section as a query for its own document. Reports hit@k and MRR of plain vector
+search and of vector search reranked over the top n candidates, plus the
+rerank latency per query:
+
+    python -m benchmarks.rerank_benchmark --notes ~/notes --top-n 10 20 40
+
+Requires sentence-transformers and downloads both models on first use.
+"""
+
+import argparse
+import random
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from rocketnotes_handler.lib.chunker import get_chunker
+from rocketnotes_handler.lib.numpy_vector_store import NumpyVectorStore
+from rocketnotes_handler.lib.rerank import CrossEncoderReranker
+
+
+def load_sections(notes_dir: Path):
+    chunker = get_chunker("Sentence-Transformers")
+    texts, metadatas = [], []
+    for path in sorted(notes_dir.rglob("*.md")):
+        for chunk in chunker.split_text(path.read_text(errors="ignore")):
+            if len(chunk.strip()) > 12:
+                texts.append(f"{path.stem}\n{chunk}")
+                metadatas.append({"documentId": str(path), "title": path.stem})
+    return texts, metadatas
+
+
+def sample_queries(texts, metadatas, count, seed=0):
+    """One sentence of a random section, the section's document is relevant"""
+    rng = random.Random(seed)
+    queries = []
+    for index in rng.sample(range(len(texts)), min(count, len(texts))):
+        sentences = [
+            sentence.strip()
+            for sentence in re.split(r"[.!?\n]", texts[index].split("\n", 1)[-1])
+            if len(sentence.split()) >= 4
+        ]
+        if sentences:
+            queries.append((rng.choice(sentences), metadatas[index]["documentId"]))
+    return queries
+
+
+def reciprocal_rank(documents, relevant, k):
+    for rank, document in enumerate(documents[:k], start=1):
+        if document.metadata["documentId"] == relevant:
+            return 1 / rank
+    return 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=Path, required=True)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--top-n", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument(
+        "--model", default="cross-encoder/ms-marco-MiniLM-L-6-v2"
+    )
+    args = parser.parse_args()
+
+    texts, metadatas = load_sections(args.notes)
+    queries = sample_queries(texts, metadatas, args.queries)
+    embeddings = HuggingFaceEmbeddings(model_kwargs={"device": "cpu"})
+    store = NumpyVectorStore(embeddings)
+    store.add_embeddings(texts, embeddings.embed_documents(texts), metadatas)
+    print(f"{len(texts)} sections, {len(queries)} queries, k={args.k}")
+
+    max_n = max(args.top_n)
+    candidates = [
+        store.similarity_search(query, k=max(max_n, args.k)) for query, _ in queries
+    ]
+    ranks = [
+        reciprocal_rank(documents, relevant, args.k)
+        for documents, (_, relevant) in zip(candidates, queries)
+    ]
+    print(
+        f"vector        hit@{args.k}={np.mean([r > 0 for r in ranks]):.3f} "
+        f"mrr={np.mean(ranks):.3f}"
+    )
+
+    reranker = CrossEncoderReranker(args.model, latency_budget_ms=float("inf"))
+    reranker.load()
+    for top_n in args.top_n:
+        ranks, latencies = [], []
+        for documents, (query, relevant) in zip(candidates, queries):
+            start = time.perf_counter()
+            reranked = reranker.rerank(
+                query, documents[:top_n], text_of=lambda document: document.page_content
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            ranks.append(reciprocal_rank(reranked, relevant, args.k))
+        print(
+            f"rerank n={top_n:<4} hit@{args.k}={np.mean([r > 0 for r in ranks]):.3f} "
+            f"mrr={np.mean(ranks):.3f} "
+            f"p50={np.percentile(latencies, 50):6.1f} ms "
+            f"p95={np.percentile(latencies, 95):6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Cold and warm latency of the process-wide Sentence-Transformers model.
+
+Measures loading the model (what every request paid before it was cached), the
+first query after loading, warm single queries and document throughput for
+different batch sizes and torch thread counts:
+
+    python -m benchmarks.sentence_transformers_benchmark --batch-sizes 8 32 64 --threads 1 2 4
+
+Requires sentence-transformers and downloads the model on first use.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from rocketnotes_handler.lib import local_embeddings
+from rocketnotes_handler.lib.local_embeddings import (
+    get_sentence_transformers_embeddings, set_torch_threads)
+
+SENTENCE = "Rocketnotes splits markdown notes into sections and embeds each of them."
+
+
+def milliseconds(start):
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--documents", type=int, default=256)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    embeddings = get_sentence_transformers_embeddings()
+    print(f"cold load      {milliseconds(start):8.1f} ms")
+
+    start = time.perf_counter()
+    embeddings.embed_query(SENTENCE)
+    print(f"first query    {milliseconds(start):8.1f} ms")
+
+    start = time.perf_counter()
+    assert get_sentence_transformers_embeddings() is embeddings
+    print(f"cached lookup  {milliseconds(start):8.3f} ms")
+
+    latencies = []
+    for i in range(args.queries):
+        start = time.perf_counter()
+        embeddings.embed_query(f"{SENTENCE} {i}")
+        latencies.append(milliseconds(start))
+    print(
+        f"warm query     p50={np.percentile(latencies, 50):6.1f} ms "
+        f"p95={np.percentile(latencies, 95):6.1f} ms"
+    )
+
+    documents = [f"{SENTENCE} Section {i}." * 4 for i in range(args.documents)]
+    for threads in args.threads:
+        set_torch_threads(threads)
+        for batch_size in args.batch_sizes:
+            embeddings.encode_kwargs = {"batch_size": batch_size}
+            start = time.perf_counter()
+            embeddings.embed_documents(documents)
+            seconds = milliseconds(start) / 1000
+            print(
+                f"threads={threads:<2} batch={batch_size:<4} "
+                f"{len(documents) / seconds:8.1f} documents/s"
+            )
+    print(f"model: {local_embeddings.sentence_transformers_model}")
+
+
+if __name__ == "__main__":
+    main()
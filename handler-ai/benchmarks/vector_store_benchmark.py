@@ -0,0 +1,91 @@
+"""
+Recall and latency of the approximate vector stores against exact search.
+
+Builds the numpy (exact) and HNSW stores over the same synthetic, clustered
+vectors and reports build time, query latency and recall@k:
+
+    python -m benchmarks.vector_store_benchmark --count 20000 --dim 384 --ef 64 --m 16
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from rocketnotes_handler.lib.hnsw_vector_store import (HNSWLIB_AVAILABLE,
+                                                       HnswVectorStore)
+from rocketnotes_handler.lib.numpy_vector_store import NumpyVectorStore
+
+
+def synthetic_vectors(count, dim, clusters=50, seed=0):
+    """Vectors around random centroids, closer to real embeddings than pure noise"""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(clusters, dim))
+    assignments = rng.integers(0, clusters, size=count)
+    vectors = centroids[assignments] + rng.normal(scale=0.6, size=(count, dim))
+    return vectors.astype(np.float32)
+
+
+def build(store, vectors, batch_size=1000):
+    ids = [str(i) for i in range(len(vectors))]
+    start = time.perf_counter()
+    for i in range(0, len(vectors), batch_size):
+        store.add_embeddings(
+            ids[i : i + batch_size],
+            vectors[i : i + batch_size],
+            ids=ids[i : i + batch_size],
+        )
+    return time.perf_counter() - start
+
+
+def search(store, queries, k):
+    start = time.perf_counter()
+    results = [
+        {document.id for document in store.similarity_search_by_vector(query, k=k)}
+        for query in queries
+    ]
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall_at_k(results, exact_results, k):
+    return np.mean(
+        [len(found & exact) / k for found, exact in zip(results, exact_results)]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--m", type=int, default=16)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.count, args.dim)
+    queries = synthetic_vectors(args.queries, args.dim, seed=1)
+
+    exact = NumpyVectorStore(None)
+    build_seconds = build(exact, vectors)
+    exact_results, exact_ms = search(exact, queries, args.k)
+    print(f"{args.count} vectors, dim {args.dim}, k={args.k}")
+    print(f"exact        build={build_seconds:6.2f}s query={exact_ms:7.3f} ms")
+
+    if not HNSWLIB_AVAILABLE:
+        print("hnswlib not installed, skipping HNSW")
+        return
+
+    hnsw = HnswVectorStore(None, m=args.m, exact_search_threshold=0)
+    build_seconds = build(hnsw, vectors)
+    for ef in args.ef:
+        hnsw.ef_search = ef
+        results, query_ms = search(hnsw, queries, args.k)
+        print(
+            f"hnsw ef={ef:<4} build={build_seconds:6.2f}s query={query_ms:7.3f} ms "
+            f"recall@{args.k}={recall_at_k(results, exact_results, args.k):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,18 @@ import os
 import boto3
 from langchain.chains import ConversationalRetrievalChain
 
+from rocketnotes_handler.lib.local_embeddings import preload_local_embeddings
+from rocketnotes_handler.lib.rerank import (RerankingRetriever, get_reranker,
+                                            remaining_budget_ms)
 from rocketnotes_handler.lib.util import (get_chat_model, get_embeddings_model,
-                                          get_user_config)
+                                          load_search_user_config)
 from rocketnotes_handler.lib.vector_store_factory import get_vector_store_factory
 
 is_local = os.environ.get("LOCAL", False)
 
+# Loads a local embeddings model during Lambda init if PRELOAD_EMBEDDINGS_MODEL is set
+preload_local_embeddings()
+
 def get_boto3_clients():
     """Get configured boto3 clients"""
     s3_args = {}
@@ -28,7 +34,6 @@ def get_boto3_clients():
 
     return s3, dynamodb
 
-userConfig_table_name = "tnn-UserConfig"
 
 
 
@@ -58,19 +63,14 @@ def handler(event, context):
     # Get boto3 clients
     s3, dynamodb = get_boto3_clients()
 
-    user_config_search_result = dynamodb.get_item(
-        TableName=userConfig_table_name,
-        Key={"id": {"S": userId}},
-    )
+    user_config = load_search_user_config(dynamodb, userId)
 
-    if "Item" not in user_config_search_result:
+    if user_config is None:
         return {
             "statusCode": 404,
             "body": json.dumps("User not found"),
         }
 
-    user_config = get_user_config(user_config_search_result)
-
     if user_config.embeddingsModel is None:
         return {
             "statusCode": 400,
@@ -88,9 +88,17 @@ def handler(event, context):
         llm = get_chat_model(user_config)
 
     # Get vector store for the user (S3 for prod, Chroma for local)
-    db = get_vector_store_factory(userId, embeddings)
+    db = get_vector_store_factory(
+        userId, embeddings, quantization=user_config.vectorQuantization
+    )
 
-    retriever = db.as_retriever(search_type="similarity", search_kwargs={"k": 3})
+    if get_reranker() is not None:
+        # Over-fetch and keep the 3 sections the cross-encoder scores best
+        retriever = RerankingRetriever(
+            vector_store=db, k=3, budget_ms=remaining_budget_ms(context)
+        )
+    else:
+        retriever = db.as_retriever(search_type="similarity", search_kwargs={"k": 3})
 
     qa = ConversationalRetrievalChain.from_llm(llm, retriever=retriever)
     result = qa({"question": prompt, "chat_history": []})
@@ -5,8 +5,10 @@ import re
 
 import boto3
 
+from rocketnotes_handler.lib.documents import batch_get_documents
+from rocketnotes_handler.lib.manifest import document_content_hash
 from rocketnotes_handler.lib.model import InsertSuggestion
-from rocketnotes_handler.lib.util import get_user_config
+from rocketnotes_handler.lib.util import load_user_config
 
 is_local = os.environ.get("LOCAL", False)
 s3_args = {}
@@ -22,7 +24,6 @@ dynamodb = boto3.client("dynamodb", **dynamodb_args)
 sqs = boto3.client("sqs", **sqs_args)
 
 documents_table_name = "tnn-Documents"
-userConfig_table_name = "tnn-UserConfig"
 zettel_table_name = "tnn-Zettelkasten"
 queue_url = os.environ["QUEUE_URL"]
 
@@ -43,30 +44,26 @@ def handler(event, context):
         for item in body
     ]
 
-    user_config_search_result = dynamodb.get_item(
-        TableName=userConfig_table_name,
-        Key={"id": {"S": user_id}},
-    )
+    user_config = load_user_config(dynamodb, user_id)
 
-    if "Item" not in user_config_search_result:
+    if user_config is None:
         return {
             "statusCode": 404,
             "body": json.dumps("User not found"),
         }
 
-    user_config = get_user_config(user_config_search_result)
+    documents = batch_get_documents(dynamodb, [item.documentId for item in input])
 
     zettel_ids_to_delete = []
+    content_hashes = {}
     for item in input:
-        document_search_result = dynamodb.get_item(
-            TableName=documents_table_name,
-            Key={"id": {"S": item.documentId}},
-        )
+        if item.documentId not in documents:
+            print(f"Document {item.documentId} not found, skipping insert")
+            continue
 
-        document_content = (
-            document_search_result["Item"].get("content", {}).get("S", None)
-        )
-        title = document_search_result["Item"].get("title", {}).get("S", None)
+        document = documents[item.documentId]
+        document_content = document.get("content", {}).get("S", None)
+        title = document.get("title", {}).get("S", None)
 
         if item.similaritySearchResult in document_content:
             for zettelIds in item.zettelIds:
@@ -108,10 +105,18 @@ def handler(event, context):
                 "body": json.dumps("Error updating document"),
             }
 
+        # Later suggestions for the same document build on this content
+        document["content"] = {"S": document_content}
+        content_hashes[item.documentId] = document_content_hash(
+            item.documentTitle, document_content
+        )
+
 
     message = {
         "userId": user_id,
-        "documentIds": [item.documentId for item in input],
+        "documentIds": list(content_hashes),
+        # Lets the embeddings worker skip messages for outdated document versions
+        "contentHashes": content_hashes,
     }
 
     try:
@@ -1,13 +1,24 @@
 
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+
 import boto3
 
-from rocketnotes_handler.lib.util import get_embeddings_model, get_user_config
+from rocketnotes_handler.lib.bm25 import load_bm25_index
+from rocketnotes_handler.lib.local_embeddings import preload_local_embeddings
+from rocketnotes_handler.lib.rerank import remaining_budget_ms
+from rocketnotes_handler.lib.search import (decode_cursor, encode_cursor,
+                                            search_documents, search_max_k)
+from rocketnotes_handler.lib.util import (get_embeddings_model,
+                                          load_search_user_config)
 from rocketnotes_handler.lib.vector_store_factory import get_vector_store_factory
 
 is_local = os.environ.get("LOCAL", False)
 
+# Loads a local embeddings model during Lambda init if PRELOAD_EMBEDDINGS_MODEL is set
+preload_local_embeddings()
+
 def get_boto3_clients():
     """Get configured boto3 clients"""
     s3_args = {}
@@ -27,9 +38,38 @@ def get_boto3_clients():
 
     return s3, dynamodb
 
-userConfig_table_name = "tnn-UserConfig"
 documents_table_name = "tnn-Documents"
 
+# Limits of batched searches with a list of searchStrings
+semantic_search_max_queries = int(os.environ.get("SEMANTIC_SEARCH_MAX_QUERIES", 20))
+semantic_search_max_concurrency = int(
+    os.environ.get("SEMANTIC_SEARCH_MAX_CONCURRENCY", 8)
+)
+
+
+class SearchParams:
+    """Optional paging and ranking parameters of a search request"""
+
+    def __init__(self, request_body: dict):
+        self.k: int = int(request_body.get("k", 3))
+        if not 1 <= self.k <= search_max_k:
+            raise ValueError(f"k must be between 1 and {search_max_k}")
+
+        if request_body.get("cursor"):
+            self.offset: int = decode_cursor(request_body["cursor"])
+        else:
+            self.offset = int(request_body.get("offset", 0))
+        if self.offset < 0:
+            raise ValueError("offset must not be negative")
+
+        # Relevance threshold of vector matches, BM25 only matches have no score
+        min_score = request_body.get("minScore")
+        self.min_score: float | None = float(min_score) if min_score is not None else None
+        self.mmr: bool = bool(request_body.get("mmr", False))
+        self.mmr_lambda: float = float(request_body.get("mmrLambda", 0.5))
+        if not 0 <= self.mmr_lambda <= 1:
+            raise ValueError("mmrLambda must be between 0 and 1")
+
 
 def handler(event, context):
     if "body" in event:
@@ -45,27 +85,41 @@ def handler(event, context):
     else:
         return {"statusCode": 400, "body": "userId is missing"}
 
-    if "searchString" in request_body:
+    # A list of searchStrings is searched in one batch
+    search_strings = request_body.get("searchStrings")
+    if search_strings is not None:
+        if (
+            not isinstance(search_strings, list)
+            or not search_strings
+            or not all(isinstance(query, str) for query in search_strings)
+        ):
+            return {"statusCode": 400, "body": "searchStrings must be a list of strings"}
+        if len(search_strings) > semantic_search_max_queries:
+            return {
+                "statusCode": 400,
+                "body": f"At most {semantic_search_max_queries} searchStrings are allowed",
+            }
+    elif "searchString" in request_body:
         search_string = request_body["searchString"]
     else:
         return {"statusCode": 400, "body": "search_string is missing"}
 
+    try:
+        params = SearchParams(request_body)
+    except (TypeError, ValueError) as e:
+        return {"statusCode": 400, "body": str(e)}
+
     # Get boto3 clients
     s3, dynamodb = get_boto3_clients()
 
-    user_config_search_result = dynamodb.get_item(
-        TableName=userConfig_table_name,
-        Key={"id": {"S": userId}},
-    )
+    user_config = load_search_user_config(dynamodb, userId)
 
-    if "Item" not in user_config_search_result:
+    if user_config is None:
         return {
             "statusCode": 404,
             "body": json.dumps("User not found"),
         }
 
-    user_config = get_user_config(user_config_search_result)
-
     if user_config.embeddingsModel is None:
         return {
             "statusCode": 400,
@@ -75,33 +129,74 @@ def handler(event, context):
         embeddings = get_embeddings_model(user_config)
 
     # Get vector store for the user (S3 for prod, Chroma for local)
-    db = get_vector_store_factory(userId, embeddings)
-
-    similarity_search_result = db.similarity_search(search_string, k=3)
-    response = []
-    for result in similarity_search_result:
-        document_id = result.metadata["documentId"]
-        title = result.metadata["title"]
-
-        # Extract original content from page_content by removing title prefix
-        # page_content format is: "{title}\n{original_content}"
-        page_content = result.page_content
-        if page_content.startswith(f"{title}\n"):
-            content = page_content[len(title) + 1:]  # +1 for the newline
-        else:
-            # Fallback if format is different
-            content = page_content
+    db = get_vector_store_factory(
+        userId, embeddings, quantization=user_config.vectorQuantization
+    )
 
-        response.append(
-            {
-                "documentId": document_id,
-                "title": title,
-                "content": content,
-            }
+    # Hybrid search once the user's BM25 index has been built by a reindex
+    bm25_index = load_bm25_index(userId)
+
+    def search(query):
+        return search_documents(
+            db,
+            embeddings,
+            query,
+            k=params.k,
+            offset=params.offset,
+            min_score=params.min_score,
+            mmr=params.mmr,
+            lambda_mult=params.mmr_lambda,
+            bm25_index=bm25_index,
+            budget_ms=remaining_budget_ms(context),
         )
 
+    if search_strings is not None:
+        return {
+            "statusCode": 200,
+            "body": json.dumps(
+                search_batch(embeddings, search_strings, search, params)
+            ),
+        }
+
+    results, has_more = search(search_string)
+
+    headers = {}
+    if has_more:
+        # The body stays a list of documents, the next page is requested with
+        # this cursor
+        headers["X-Next-Cursor"] = encode_cursor(params.offset + params.k)
+
     return {
         "statusCode": 200,
-        "body": json.dumps(response),
+        "headers": headers,
+        "body": json.dumps([result.to_dict() for result in results]),
     }
 
+
+def search_batch(embeddings, search_strings, search, params: SearchParams):
+    """
+    Run several searches of one user with a single embeddings call.
+
+    The queries are embedded together and cached, so the concurrent vector
+    store lookups find their query embeddings in the cache.
+    """
+    if hasattr(embeddings, "embed_queries"):
+        embeddings.embed_queries(search_strings)
+
+    with ThreadPoolExecutor(
+        max_workers=min(len(search_strings), semantic_search_max_concurrency)
+    ) as executor:
+        searches = list(executor.map(search, search_strings))
+
+    response = []
+    for query, (results, has_more) in zip(search_strings, searches):
+        response.append(
+            {
+                "searchString": query,
+                "results": [result.to_dict() for result in results],
+                "nextCursor": (
+                    encode_cursor(params.offset + params.k) if has_more else None
+                ),
+            }
+        )
+    return response
@@ -4,15 +4,43 @@ import os
 
 import boto3
 from langchain.schema import Document
-from langchain_text_splitters import MarkdownHeaderTextSplitter
 
-from rocketnotes_handler.lib.util import get_embeddings_model, get_user_config
+from rocketnotes_handler.lib.bm25 import (BM25IndexStore, bm25_index_cache,
+                                          get_bm25_store)
+from rocketnotes_handler.lib.chunker import MarkdownChunker, get_chunker
+from rocketnotes_handler.lib.documents import (batch_get_documents,
+                                               iter_user_documents)
+from rocketnotes_handler.lib.embedding import embed_in_batches
+from rocketnotes_handler.lib.embedding_cache import (CachedEmbeddings,
+                                                     get_embedding_store)
+from rocketnotes_handler.lib.embedding_executor import (
+    EmbeddingExecutor, get_embeddings_provider)
+from rocketnotes_handler.lib.local_embeddings import preload_local_embeddings
+from rocketnotes_handler.lib.manifest import (ChunkManifest, chunk_vector_id,
+                                              delete_chunk_manifest,
+                                              diff_chunk_manifest,
+                                              document_content_hash,
+                                              get_chunk_manifest,
+                                              get_indexed_embeddings_model,
+                                              hash_content, save_chunk_manifest,
+                                              save_indexed_embeddings_model)
+from rocketnotes_handler.lib.process_pool_embeddings import \
+    get_process_pool_embeddings
+from rocketnotes_handler.lib.util import (embeddings_model_versions,
+                                          get_embeddings_model,
+                                          invalidate_user_config,
+                                          load_user_config,
+                                          versioned_embeddings_model)
 from rocketnotes_handler.lib.vector_store_factory import (
-    create_vector_store_from_documents, delete_document_vectors,
-    get_vector_store_factory)
+    add_embedded_documents, clear_vector_store, delete_document_vectors,
+    delete_documents_vectors, flush_vector_store, get_vector_store_factory,
+    list_vector_document_ids)
 
 is_local = os.environ.get("LOCAL", False)
 
+# Loads a local embeddings model during Lambda init if PRELOAD_EMBEDDINGS_MODEL is set
+preload_local_embeddings()
+
 
 def get_boto3_clients():
     """Get configured boto3 clients"""
@@ -35,189 +63,334 @@ def get_boto3_clients():
 
 documents_table_name = "tnn-Documents"
 vector_table_name = "tnn-Vectors"
-userConfig_table_name = "tnn-UserConfig"
+
+# Number of sections embedded and written per vector store call during recreateIndex
+recreate_index_batch_size = int(os.environ.get("RECREATE_INDEX_BATCH_SIZE", 100))
+
+
+class EmbeddingJob:
+    """Coalesced work of all messages of one user within an SQS batch"""
+
+    def __init__(self):
+        self.recreate_index_message_ids: list[str] = []
+        # documentId -> ids of the messages that requested it
+        self.deletes: dict[str, list[str]] = {}
+        self.updates: dict[str, list[str]] = {}
+        # documentId -> document versions (contentHash) the messages were sent for,
+        # None stands for a message without a version
+        self.content_hashes: dict[str, set[str | None]] = {}
+
+    def message_ids(self) -> list[str]:
+        message_ids = list(self.recreate_index_message_ids)
+        for requests in (self.deletes, self.updates):
+            for document_message_ids in requests.values():
+                message_ids.extend(document_message_ids)
+        return list(dict.fromkeys(message_ids))
+
+    def is_stale(self, documentId, contentHash) -> bool:
+        """
+        True if every message for the document was sent for an older version.
+
+        A newer save has then enqueued its own message, so embedding can wait
+        for that one instead of re-embedding every version of an editing burst.
+        """
+        content_hashes = self.content_hashes.get(documentId, {None})
+        return None not in content_hashes and contentHash not in content_hashes
+
+    def update_message_ids(self) -> list[str]:
+        return list(
+            dict.fromkeys(
+                message_id
+                for document_message_ids in self.updates.values()
+                for message_id in document_message_ids
+            )
+        )
+
+
+def coalesce_messages(records) -> dict[str, EmbeddingJob]:
+    """Group the messages of an SQS batch per user and drop duplicate documentIds"""
+    jobs: dict[str, EmbeddingJob] = {}
+    for index, record in enumerate(records):
+        message_id = record.get("messageId", str(index))
+        message = record["body"]
+        if not is_local:
+            message = json.loads(message)
+
+        job = jobs.setdefault(message["userId"], EmbeddingJob())
+        documentId = message.get("documentId", None)
+        documentIds = message.get("documentIds", [])
+
+        if message.get("deleteVectors", False):
+            job.deletes.setdefault(documentId, []).append(message_id)
+        elif message.get("recreateIndex", False):
+            job.recreate_index_message_ids.append(message_id)
+        else:
+            content_hashes = message.get("contentHashes", {})
+            if documentId and message.get("contentHash"):
+                content_hashes = {documentId: message["contentHash"]}
+            for updated_document_id in ([documentId] if documentId else documentIds):
+                job.updates.setdefault(updated_document_id, []).append(message_id)
+                job.content_hashes.setdefault(updated_document_id, set()).add(
+                    content_hashes.get(updated_document_id)
+                )
+    return jobs
 
 
 def handler(event, context):
     if is_local:
         event = json.loads(event["body"])
-    message = event["Records"][0]["body"]
-    if not is_local:
-        message = json.loads(message)
-    userId = message["userId"]
-    documentId = message.get("documentId", None)
-    documentIds = message.get("documentIds", [])
-    recreateIndex = message.get("recreateIndex", False)
-    deleteVectors = message.get("deleteVectors", False)
 
     s3, dynamodb = get_boto3_clients()
 
-    user_config_search_result = dynamodb.get_item(
-        TableName=userConfig_table_name,
-        Key={"id": {"S": userId}},
+    response = None
+    batch_item_failures = []
+    for userId, job in coalesce_messages(event["Records"]).items():
+        user_response, failed_message_ids = process_embedding_job(
+            userId, job, dynamodb
+        )
+        batch_item_failures.extend(failed_message_ids)
+        if response is None or response["statusCode"] == 200:
+            response = user_response
+
+    if response is None:
+        response = success_response()
+
+    # Only failed messages are returned to the queue and redelivered
+    response["batchItemFailures"] = [
+        {"itemIdentifier": message_id} for message_id in batch_item_failures
+    ]
+    print("About to return response")
+    return response
+
+
+def create_reindex_executor(user_config, embeddings) -> EmbeddingExecutor:
+    """
+    Executor for recreateIndex, local models embed on the worker process pool.
+
+    One batch is in flight per worker, each batch is split into shards across
+    the pool, so all cores stay busy while embedded batches are written.
+    """
+    pool_embeddings = get_process_pool_embeddings(user_config.embeddingsModel)
+    if pool_embeddings is None:
+        return EmbeddingExecutor(
+            embeddings, get_embeddings_provider(user_config.embeddingsModel)
+        )
+    return EmbeddingExecutor(
+        CachedEmbeddings(
+            pool_embeddings,
+            model=versioned_embeddings_model(user_config.embeddingsModel),
+            store=get_embedding_store(),
+        ),
+        provider="process-pool",
+        max_concurrency=pool_embeddings.max_workers,
     )
 
-    if "Item" not in user_config_search_result:
+
+def is_index_outdated(dynamodb, userId, embeddingsModel) -> bool:
+    """
+    True if the user's index holds vectors of an older version of their model.
+
+    Only models listed in embeddings_model_versions are checked, the first job
+    of such a user after a version bump recreates the index.
+    """
+    if embeddingsModel not in embeddings_model_versions:
+        return False
+    indexed_model = get_indexed_embeddings_model(dynamodb, userId)
+    if indexed_model != versioned_embeddings_model(embeddingsModel):
+        print(f"Index of {userId} was built with {indexed_model}, recreating it")
+        return True
+    return False
+
+
+def success_response():
+    return {
+        "statusCode": 200,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*",
+        },
+        "body": json.dumps("Success"),
+    }
+
+
+def error_response(e):
+    print(f"Exception caught in handler: {str(e)}")
+    print(f"Exception type: {type(e).__name__}")
+    import traceback
+    print(f"Traceback: {traceback.format_exc()}")
+    return {
+        "statusCode": 500,
+        "headers": {
+            "Content-Type": "application/json",
+            "Access-Control-Allow-Origin": "*",
+        },
+        "body": json.dumps(f"Internal server error, {e}"),
+    }
+
+
+def process_embedding_job(userId, job: EmbeddingJob, dynamodb):
+    """
+    Apply all coalesced messages of a user.
+
+    The user's embeddings model and vector store are built once for the whole
+    job. Messages that cannot succeed on retry (unknown user, missing model or
+    API key) are not reported as failed.
+
+    Returns:
+        tuple: (response, ids of the messages that failed and should be retried)
+    """
+    # Index recreation is requested when the embeddings settings change
+    if job.recreate_index_message_ids:
+        invalidate_user_config(userId)
+
+    user_config = load_user_config(dynamodb, userId)
+
+    if user_config is None:
         return {
             "statusCode": 404,
             "body": json.dumps("User not found"),
-        }
-
-    user_config = get_user_config(user_config_search_result)
+        }, []
 
     if user_config.embeddingsModel is None:
         return {
             "statusCode": 400,
             "body": json.dumps("Embeddings model is missing"),
-        }
-    else:
+        }, []
+
+    try:
         embeddings = get_embeddings_model(user_config)
+    except ValueError as e:
+        # A missing API key or an unknown model cannot succeed on retry
+        print(f"Cannot embed documents of {userId}: {e}")
+        return {
+            "statusCode": 400,
+            "body": json.dumps(str(e)),
+        }, []
 
+    response = success_response()
+    failed_message_ids = []
     try:
+        recreate = bool(job.recreate_index_message_ids) or is_index_outdated(
+            dynamodb, userId, user_config.embeddingsModel
+        )
+        chunker = get_chunker(user_config.embeddingsModel)
         # Get vector store for the user (S3 for prod, Chroma for local)
-        vector_store = get_vector_store_factory(userId, embeddings)
-
-        if deleteVectors:
-            delete_document_vectors(documentId, vector_store)
-        # Update single document vectors
-        elif documentId and not recreateIndex:
-            try:
-                document = dynamodb.get_item(
-                    TableName="tnn-Documents",
-                    Key={"id": {"S": documentId}},
-                )
-                if "Item" not in document:
-                    return {
-                        "statusCode": 404,
-                        "body": json.dumps("Item not found in DynamoDB table"),
-                    }
-
-                document = document["Item"]
-                # Delete existing vectors for this document
-                delete_document_vectors(documentId, vector_store)
-                # Add updated vectors
-                save_document_vectors(document, vector_store)
-            except Exception as e:
-                print(f"Error updating document vectors: {e}")
-
-        # Update multiple document vectors
-        elif documentIds and not recreateIndex:
-            try:
-                for documentId in documentIds:
-                    document = dynamodb.get_item(
-                        TableName="tnn-Documents",
-                        Key={"id": {"S": documentId}},
-                    )
-                    if "Item" not in document:
-                        return {
-                            "statusCode": 404,
-                            "body": json.dumps("Item not found in DynamoDB table"),
-                        }
-
-                    document = document["Item"]
-                    # Delete existing vectors for this document
-                    delete_document_vectors(documentId, vector_store)
-                    # Add updated vectors
-                    save_document_vectors(document, vector_store)
-            except Exception as e:
-                print(f"Error updating document vectors: {e}")
-
-
-        # Recreate all vectors for all documents (or initial creation)
-        elif recreateIndex:
+        vector_store = get_vector_store_factory(
+            userId, embeddings, quantization=user_config.vectorQuantization
+        )
+    except Exception as e:
+        return error_response(e), job.message_ids()
+
+    # Lexical index for hybrid search, its changes are recorded during the job
+    # and saved once. It is secondary to the vectors, so its failures never
+    # fail a message.
+    bm25 = get_bm25_store(userId)
+
+    for documentId, message_ids in job.deletes.items():
+        try:
+            manifest = get_chunk_manifest(dynamodb, documentId)
+            # The manifest is only removed once its vectors are gone, a failed
+            # delete is retried with the same vector ids
+            delete_document_vectors(
+                documentId,
+                vector_store,
+                manifest.chunks.values() if manifest is not None else None,
+            )
+            delete_chunk_manifest(dynamodb, documentId)
+            bm25.remove_document(documentId)
+        except Exception as e:
+            response = error_response(e)
+            failed_message_ids.extend(message_ids)
+
+    # Recreate all vectors for all documents (or initial creation), this also
+    # covers every document update of the batch
+    if recreate:
+        try:
             print("Recreating index for userId: ", userId)
-            filter_expression = "userId = :user_value"
-            expression_attribute_values = {
-                ":user_value": {"S": userId},
-            }
-
-            # Execute the query
-            result = dynamodb.query(
-                TableName=documents_table_name,
-                IndexName="userId-index",
-                KeyConditionExpression=filter_expression,
-                ExpressionAttributeValues=expression_attribute_values,
+            executor = create_reindex_executor(user_config, embeddings)
+            recreate_index(
+                userId,
+                executor,
+                vector_store,
+                dynamodb,
+                chunker,
+                bm25,
+                versioned_embeddings_model(user_config.embeddingsModel),
+            )
+        except Exception as e:
+            response = error_response(e)
+            failed_message_ids.extend(job.recreate_index_message_ids)
+            failed_message_ids.extend(job.update_message_ids())
+
+    # Update document vectors
+    elif job.updates:
+        try:
+            updated_document_ids = [
+                documentId for documentId in job.updates if documentId not in job.deletes
+            ]
+            # Strongly consistent, an eventually consistent read can return the
+            # document before the write the message was sent for
+            loaded_documents = batch_get_documents(
+                dynamodb, updated_document_ids, consistent_read=True
             )
 
-            # Process the query results
-            documents = result.get("Items", [])
+            documents = []
+            for documentId in updated_document_ids:
+                document = loaded_documents.get(documentId)
+                if document is None:
+                    print(f"Document {documentId} not found, skipping update")
+                    continue
+                _, title, content = get_document_fields(document)
+                if job.is_stale(documentId, document_content_hash(title, content)):
+                    print(f"Skipping stale update for document {documentId}")
+                    continue
+                documents.append(document)
+
+            # Embed the changed sections of all documents in shared batches
             if documents:
-                split_documents = []
-                for document in documents:
-                    try:
-                        if document.get("deleted", {}).get("BOOL", False):
-                            continue
-                        elif document.get("content", {}).get("S") is None:
-                            continue
-                        elif len(document.get("content", {}).get("S").strip()) <= 12:
-                            continue
-                        else:
-                            content = document["content"]["S"]
-                            documentId = document["id"]["S"]
-                            title = document["title"]["S"]
-                            split_documents.extend(
-                                split_document(content, documentId, title)
-                            )
-                    except Exception as e:
-                        print(
-                            f"Error processing document {document['id']['S']}: ", str(e)
-                        )
-
-                # Create new vector store with all documents
-                if split_documents:
-                    print(f"About to create vector store with {len(split_documents)} documents")
-                    vector_store = create_vector_store_from_documents(
-                        split_documents, userId, embeddings
-                    )
-                    print(f"Successfully completed create_vector_store_from_documents")
-                else:
-                    print("No split_documents found, skipping vector store creation")
+                save_documents_vectors(
+                    documents, userId, embeddings, vector_store, dynamodb, chunker, bm25
+                )
+        except Exception as e:
+            print(f"Error updating document vectors: {e}")
+            response = error_response(e)
+            failed_message_ids.extend(job.update_message_ids())
 
+    # File-backed vector stores are written once per job
+    try:
+        flush_vector_store(vector_store)
     except Exception as e:
-        print(f"Exception caught in handler: {str(e)}")
-        print(f"Exception type: {type(e).__name__}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        return {
-            "statusCode": 500,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-            },
-            "body": json.dumps(f"Internal server error, {e}"),
-        }
-
-    print("About to return success response")
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-        },
-        "body": json.dumps("Success"),
-    }
-
-def split_document(document, documentId, title):
-    headers_to_split_on = [
-        ("#", "Header 1"),
-        ("##", "Header 2"),
-        ("###", "Header 3"),
-    ]
-    markdown_splitter = MarkdownHeaderTextSplitter(
-        headers_to_split_on=headers_to_split_on, strip_headers=False
-    )
-    md_header_splits = markdown_splitter.split_text(document)
+        response = error_response(e)
+        failed_message_ids.extend(job.message_ids())
+
+    # A recreate saves its segments as it goes
+    if bm25.has_changes or recreate:
+        try:
+            if not bm25.replaced and not bm25.exists():
+                # Users indexed before hybrid search have no BM25 index yet. It
+                # needs no embeddings, so it is built from their documents.
+                print(f"Building BM25 index for userId: {userId}")
+                rebuild_bm25_index(userId, dynamodb, bm25, chunker)
+            bm25.save()
+            bm25_index_cache.delete(userId)
+        except Exception as e:
+            print(f"Could not save BM25 index: {e}")
+
+    return response, list(dict.fromkeys(failed_message_ids))
+
+
+def split_document(document, documentId, title, chunker: MarkdownChunker = None):
+    """Split a markdown document into token-bounded sections prefixed with its title"""
+    if chunker is None:
+        chunker = get_chunker()
 
     documents = []
-    for splitted_document in md_header_splits:
-        if (
-            not splitted_document.page_content
-            or len(splitted_document.page_content.strip()) <= 12
-        ):
+    for chunk in chunker.split_text(document):
+        if len(chunk.strip()) <= 12:
             continue
 
         document = Document(
-            page_content=f"{title}\n{splitted_document.page_content}",
+            page_content=f"{title}\n{chunk}",
             metadata={
                 "documentId": documentId,
                 "title": title,
@@ -227,25 +400,288 @@ def split_document(document, documentId, title):
 
     return documents
 
-def save_document_vectors(document, vector_store):
-    """Add document vectors to vector store (works for both S3 and Chroma)"""
+class DocumentVectorsPlan:
+    """Sections of a document that must be embedded, and vectors to delete"""
+
+    def __init__(
+        self,
+        documentId: str,
+        contentHash: str,
+        splits: dict[str, Document],
+        chunks: dict[str, str],
+        removed_ids: list[str],
+        has_manifest: bool = True,
+    ):
+        self.documentId: str = documentId
+        self.contentHash: str = contentHash
+        # content hash -> section that has to be embedded
+        self.splits: dict[str, Document] = splits
+        # content hash -> vector id of every section after the update
+        self.chunks: dict[str, str] = chunks
+        self.removed_ids: list[str] = removed_ids
+        # False for documents indexed before chunk manifests, their vectors
+        # have random ids and are found by documentId
+        self.has_manifest: bool = has_manifest
+
+
+def get_document_fields(document):
     try:
-        content = document["content"]["S"]
-        documentId = document["id"]["S"]
-        title = document["title"]["S"]
-        print(f"Processing document: {documentId}, title: {title[:50]}...")
+        return document["id"]["S"], document["title"]["S"], document["content"]["S"]
     except Exception as e:
         print(f"Error extracting document data: {e}")
         raise Exception("Error getting content from DynamoDB")
 
-    document_splits = split_document(content, documentId, title)
-    if not document_splits:
+
+def split_document_by_hash(
+    content, documentId, title, chunker: MarkdownChunker = None
+) -> dict[str, Document]:
+    """Split a document and key its sections by content hash, dropping duplicates"""
+    splits_by_hash = {}
+    for document_split in split_document(content, documentId, title, chunker):
+        chunk_hash = hash_content(document_split.page_content)
+        splits_by_hash.setdefault(chunk_hash, document_split)
+    return splits_by_hash
+
+
+def iter_indexable_documents(documents, chunker: MarkdownChunker = None):
+    """Yield a DocumentVectorsPlan for every document with indexable content"""
+    for document in documents:
+        try:
+            if document.get("deleted", {}).get("BOOL", False):
+                continue
+            elif document.get("content", {}).get("S") is None:
+                continue
+            elif len(document.get("content", {}).get("S").strip()) <= 12:
+                continue
+
+            documentId, title, content = get_document_fields(document)
+            splits = split_document_by_hash(content, documentId, title, chunker)
+            yield DocumentVectorsPlan(
+                documentId=documentId,
+                contentHash=document_content_hash(title, content),
+                splits=splits,
+                chunks={
+                    chunk_hash: chunk_vector_id(documentId, chunk_hash)
+                    for chunk_hash in splits
+                },
+                removed_ids=[],
+            )
+        except Exception as e:
+            print(f"Error processing document {document['id']['S']}: ", str(e))
+
+
+def iter_index_batches(plans, batch_size):
+    """Group whole documents into batches of at least batch_size sections"""
+    batch = []
+    batch_sections = 0
+    for plan in plans:
+        batch.append(plan)
+        batch_sections += len(plan.splits)
+        if batch_sections >= batch_size:
+            yield batch
+            batch = []
+            batch_sections = 0
+    if batch:
+        yield batch
+
+
+def recreate_index(
+    userId,
+    executor: EmbeddingExecutor,
+    vector_store,
+    dynamodb,
+    chunker: MarkdownChunker = None,
+    bm25: BM25IndexStore = None,
+    embeddingsModel: str | None = None,
+):
+    """
+    Rebuild the vector index of a user from all of their documents.
+
+    Documents are streamed page by page from DynamoDB and split into bounded
+    batches. Batches are embedded in parallel by the executor while the batches
+    that are already embedded are written, so memory stays flat regardless of
+    corpus size. The BM25 index is rebuilt from the same sections and saved
+    a segment per batch.
+
+    When the index was built with another (versioned) embeddings model it is
+    cleared first, its vectors may have another dimension. Otherwise vectors
+    are upserted in place and every vector that was not rewritten (removed
+    sections, deleted documents, legacy random ids) is deleted at the end.
+    """
+    if embeddingsModel is not None and (
+        get_indexed_embeddings_model(dynamodb, userId) != embeddingsModel
+    ):
+        print(f"Clearing index of {userId} for embeddings model {embeddingsModel}")
+        clear_vector_store(vector_store)
+        previous_ids = set()
+    else:
+        previous_ids = set(list_vector_document_ids(vector_store))
+
+    if bm25 is not None:
+        bm25.start_rebuild()
+
+    total_sections = 0
+    written_ids = set()
+    documents = iter_user_documents(dynamodb, userId)
+    batches = iter_index_batches(
+        iter_indexable_documents(documents, chunker), recreate_index_batch_size
+    )
+    embedded_batches = executor.map(
+        batches,
+        lambda batch: [
+            split.page_content for plan in batch for split in plan.splits.values()
+        ],
+    )
+    for batch, vectors in embedded_batches:
+        split_documents = [split for plan in batch for split in plan.splits.values()]
+        ids = [plan.chunks[chunk_hash] for plan in batch for chunk_hash in plan.splits]
+        add_embedded_documents(vector_store, split_documents, vectors, ids)
+        written_ids.update(ids)
+        if bm25 is not None:
+            for split, vector_id in zip(split_documents, ids):
+                bm25.add(vector_id, split.page_content, split.metadata)
+            bm25.save()
+
+        for plan in batch:
+            save_chunk_manifest(
+                dynamodb, plan.documentId, userId, plan.chunks, plan.contentHash
+            )
+
+        total_sections += len(split_documents)
+        print(f"Indexed {total_sections} sections for userId: {userId}")
+
+    if total_sections == 0:
+        print("No split_documents found, skipping vector store creation")
+
+    stale_ids = previous_ids - written_ids
+    if stale_ids:
+        print(f"Deleting {len(stale_ids)} vectors that were not rewritten")
+        vector_store.delete(ids=list(stale_ids))
+
+    if embeddingsModel is not None:
+        save_indexed_embeddings_model(dynamodb, userId, embeddingsModel)
+
+    if bm25 is not None:
+        bm25.finish_rebuild(written_ids)
+
+
+def rebuild_bm25_index(
+    userId, dynamodb, bm25: BM25IndexStore, chunker: MarkdownChunker = None
+):
+    """Rebuild the BM25 index of a user from all of their documents, in batches"""
+    bm25.start_rebuild()
+    written_ids = set()
+    documents = iter_user_documents(dynamodb, userId)
+    for batch in iter_index_batches(
+        iter_indexable_documents(documents, chunker), recreate_index_batch_size
+    ):
+        for plan in batch:
+            for chunk_hash, split in plan.splits.items():
+                bm25.add(plan.chunks[chunk_hash], split.page_content, split.metadata)
+                written_ids.add(plan.chunks[chunk_hash])
+        bm25.save()
+    bm25.finish_rebuild(written_ids)
+
+
+def plan_document_vectors(
+    document, dynamodb, chunker: MarkdownChunker = None
+) -> DocumentVectorsPlan:
+    """
+    Work out which sections of a document must be embedded or deleted.
+
+    Sections are compared by content hash against the document's chunk manifest.
+    Nothing is split when the manifest already holds the current document version.
+    """
+    documentId, title, content = get_document_fields(document)
+    print(f"Processing document: {documentId}, title: {title[:50]}...")
+    contentHash = document_content_hash(title, content)
+
+    manifest = get_chunk_manifest(dynamodb, documentId)
+    if manifest is not None and manifest.contentHash == contentHash:
+        print(f"Document {documentId} is already indexed at its current version")
+        return DocumentVectorsPlan(documentId, contentHash, {}, manifest.chunks, [])
+
+    splits_by_hash = split_document_by_hash(content, documentId, title, chunker)
+    if not splits_by_hash:
         raise Exception("Error splitting document")
 
-    print(f"Adding {len(document_splits)} document splits to vector store")
-    # Add documents to vector store (works for both S3 and Chroma)
-    vector_store.add_documents(document_splits)
-    print(f"Successfully added document vectors for: {documentId}")
+    has_manifest = manifest is not None
+    if manifest is None:
+        # Document was indexed without a manifest, start from a clean slate
+        manifest = ChunkManifest(chunks={})
+
+    added, removed = diff_chunk_manifest(manifest.chunks, list(splits_by_hash))
+    print(
+        f"Document {documentId}: {len(added)} new or changed sections, "
+        f"{len(removed)} removed, {len(splits_by_hash) - len(added)} unchanged"
+    )
+
+    chunks = {
+        chunk_hash: vector_id
+        for chunk_hash, vector_id in manifest.chunks.items()
+        if chunk_hash in splits_by_hash
+    }
+    for chunk_hash in added:
+        chunks[chunk_hash] = chunk_vector_id(documentId, chunk_hash)
+
+    return DocumentVectorsPlan(
+        documentId=documentId,
+        contentHash=contentHash,
+        splits={chunk_hash: splits_by_hash[chunk_hash] for chunk_hash in added},
+        chunks=chunks,
+        removed_ids=[manifest.chunks[chunk_hash] for chunk_hash in removed],
+        has_manifest=has_manifest,
+    )
+
 
+def save_documents_vectors(
+    documents,
+    userId,
+    embeddings,
+    vector_store,
+    dynamodb,
+    chunker: MarkdownChunker = None,
+    bm25: BM25IndexStore = None,
+):
+    """
+    Sync the vectors of one or more documents with the vector store.
+
+    Only sections missing from a document's chunk manifest are embedded, and the
+    changed sections of all documents share token-bounded embed_documents calls
+    and a single bulk upsert. Sections that no longer exist are deleted. The
+    same changes are recorded in the BM25 index store.
+    """
+    plans = [
+        plan_document_vectors(document, dynamodb, chunker)
+        for document in documents
+    ]
 
+    # Vectors of documents without a manifest are looked up in one pass
+    delete_documents_vectors(
+        [plan.documentId for plan in plans if not plan.has_manifest], vector_store
+    )
 
+    removed_ids = [vector_id for plan in plans for vector_id in plan.removed_ids]
+    if removed_ids:
+        vector_store.delete(ids=removed_ids)
+
+    added_splits = [split for plan in plans for split in plan.splits.values()]
+    added_ids = [plan.chunks[chunk_hash] for plan in plans for chunk_hash in plan.splits]
+    if added_splits:
+        print(f"Embedding {len(added_splits)} sections of {len(plans)} documents")
+        vectors = embed_in_batches(
+            embeddings, [split.page_content for split in added_splits]
+        )
+        add_embedded_documents(vector_store, added_splits, vectors, added_ids)
+
+    if bm25 is not None:
+        for vector_id in removed_ids:
+            bm25.remove(vector_id)
+        for split, vector_id in zip(added_splits, added_ids):
+            bm25.add(vector_id, split.page_content, split.metadata)
+
+    for plan in plans:
+        save_chunk_manifest(
+            dynamodb, plan.documentId, userId, plan.chunks, plan.contentHash
+        )
+        print(f"Successfully updated document vectors for: {plan.documentId}")
@@ -7,14 +7,19 @@ from rocketnotes_handler.lib.graph import (
     create_clustering_workflow,
     run_clustering_workflow,
 )
+from rocketnotes_handler.lib.local_embeddings import preload_local_embeddings
 from rocketnotes_handler.lib.model import NoteSnippet, Zettel
 from rocketnotes_handler.lib.util import (
     get_chat_model,
     get_embeddings_model,
-    get_user_config,
+    load_user_config,
 )
 
 is_local = os.environ.get("LOCAL", False)
+
+# Loads a local embeddings model during Lambda init if PRELOAD_EMBEDDINGS_MODEL is set
+preload_local_embeddings()
+
 s3_args = {}
 dynamodb_args = {}
 
@@ -27,7 +32,6 @@ dynamodb = boto3.client("dynamodb", **dynamodb_args)
 
 documents_table_name = "tnn-Documents"
 vector_table_name = "tnn-Vectors"
-userConfig_table_name = "tnn-UserConfig"
 zettel_table_name = "tnn-Zettelkasten"
 
 graph = create_clustering_workflow()
@@ -40,19 +44,14 @@ def handler(event, context):
     else:
         return {"statusCode": 400, "body": "userId is missing in the URL path"}
 
-    user_config_search_result = dynamodb.get_item(
-        TableName=userConfig_table_name,
-        Key={"id": {"S": user_id}},
-    )
+    user_config = load_user_config(dynamodb, user_id)
 
-    if "Item" not in user_config_search_result:
+    if user_config is None:
         return {
             "statusCode": 404,
             "body": json.dumps("User not found"),
         }
 
-    user_config = get_user_config(user_config_search_result)
-
     if user_config.embeddingsModel is None:
         return {
             "statusCode": 400,
@@ -0,0 +1,482 @@
+import gzip
+import json
+import math
+import os
+import re
+import time
+import uuid
+from collections import Counter
+
+import boto3
+from botocore.exceptions import ClientError
+
+from langchain_core.documents import Document
+
+from .cache import TTLCache
+
+is_local = os.environ.get("LOCAL", False)
+
+# Indexes are stored next to the embeddings in prod and on disk locally
+bm25_bucket_name = os.environ.get("BUCKET_NAME")
+bm25_index_path = os.environ.get("BM25_INDEX_PATH", "/tmp/rocketnotes-bm25")
+bm25_load_max_retries = 5
+# Change segments folded into a new snapshot once this many have been written
+bm25_compact_segments = int(os.environ.get("BM25_COMPACT_SEGMENTS", 32))
+# Candidates taken from each ranking before fusion
+hybrid_search_fetch_k = int(os.environ.get("HYBRID_SEARCH_FETCH_K", 20))
+rrf_k = int(os.environ.get("RRF_K", 60))
+
+token_pattern = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens, identifiers like snake_case stay one token"""
+    return token_pattern.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 index over the chunks of a user's documents, keyed by vector id.
+
+    Chunks carry their text and metadata so lexical hits can be returned
+    without a vector store lookup.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # vector id -> {"text", "metadata", "length"}
+        self.chunks: dict[str, dict] = {}
+        # term -> {vector id: term frequency}
+        self.postings: dict[str, dict[str, int]] = {}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def add(self, vector_id: str, text: str, metadata: dict):
+        if vector_id in self.chunks:
+            self.remove(vector_id)
+        terms = Counter(tokenize(text))
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[vector_id] = frequency
+        length = sum(terms.values())
+        self.chunks[vector_id] = {"text": text, "metadata": metadata, "length": length}
+        self.total_length += length
+
+    def remove(self, vector_id: str):
+        chunk = self.chunks.pop(vector_id, None)
+        if chunk is None:
+            return
+        self.total_length -= chunk["length"]
+        for term in set(tokenize(chunk["text"])):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(vector_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def search(self, query: str, k: int = 10) -> list[tuple[str, float]]:
+        """Vector ids and BM25 scores of the best matching chunks"""
+        if not self.chunks:
+            return []
+        average_length = self.total_length / len(self.chunks) or 1
+        scores: dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (len(self.chunks) - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for vector_id, frequency in postings.items():
+                length = self.chunks[vector_id]["length"]
+                scores[vector_id] = scores.get(vector_id, 0) + idf * (
+                    frequency
+                    * (self.k1 + 1)
+                    / (
+                        frequency
+                        + self.k1 * (1 - self.b + self.b * length / average_length)
+                    )
+                )
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def remove_document(self, documentId: str):
+        for vector_id, chunk in list(self.chunks.items()):
+            if chunk["metadata"].get("documentId") == documentId:
+                self.remove(vector_id)
+
+    def retain(self, vector_ids):
+        """Remove every chunk that is not one of vector_ids"""
+        vector_ids = set(vector_ids)
+        for vector_id in [v for v in self.chunks if v not in vector_ids]:
+            self.remove(vector_id)
+
+    def to_dict(self) -> dict:
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "chunks": self.chunks,
+            "postings": self.postings,
+            "total_length": self.total_length,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BM25Index":
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        if "postings" in data:
+            index.chunks = data["chunks"]
+            index.postings = data["postings"]
+            index.total_length = data["total_length"]
+            return index
+        # Indexes saved before postings were persisted are tokenized again
+        for vector_id, chunk in data.get("chunks", {}).items():
+            index.add(vector_id, chunk["text"], chunk["metadata"])
+        return index
+
+    def apply(self, changes: list):
+        """Apply changes recorded by a BM25IndexStore, in order"""
+        for change in changes:
+            if change[0] == "add":
+                self.add(change[1], change[2], change[3])
+            elif change[0] == "remove":
+                self.remove(change[1])
+            elif change[0] == "remove_document":
+                self.remove_document(change[1])
+            elif change[0] == "retain":
+                self.retain(change[1])
+
+
+class SegmentMissing(Exception):
+    pass
+
+
+class BM25IndexStore:
+    """
+    Loads and saves the BM25 index of a user, in S3 or on local disk.
+
+    The index is a snapshot plus a log of change segments. Incremental updates
+    never read the index, a save writes the changes of a job as one small
+    segment, so its cost does not grow with the corpus. Readers apply the
+    segments that are not part of the snapshot yet, and once there are
+    bm25_compact_segments of them a save folds them into a new snapshot.
+
+    Full reindexes are written the same way: start_rebuild, then a save per
+    batch of chunks, and finish_rebuild drops every chunk that was not
+    rewritten. Readers keep the previous index until the chunks are rewritten.
+    """
+
+    def __init__(self, userId: str, s3=None):
+        self.userId = userId
+        self.s3 = s3
+        self.index = BM25Index()
+        self._changes = []
+        self._replaced = False
+        self._rebuilding = False
+
+    def _snapshot_key(self):
+        return f"bm25/{self.userId}.json.gz"
+
+    def _segment_prefix(self):
+        return f"bm25/{self.userId}/changes/"
+
+    def _path(self, key):
+        return os.path.join(bm25_index_path, key.removeprefix("bm25/"))
+
+    def _read_object(self, key) -> tuple[dict | list | None, str | None]:
+        if self.s3 is None:
+            if not os.path.exists(self._path(key)):
+                return None, None
+            with gzip.open(self._path(key), "rt") as f:
+                return json.load(f), None
+        try:
+            response = self.s3.get_object(Bucket=bm25_bucket_name, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None, None
+            raise
+        return json.loads(gzip.decompress(response["Body"].read())), response.get(
+            "ETag"
+        )
+
+    def _write_object(self, key, data, **condition):
+        if self.s3 is None:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(f"{path}.tmp", "wt") as f:
+                json.dump(data, f)
+            os.replace(f"{path}.tmp", path)
+            return
+        self.s3.put_object(
+            Bucket=bm25_bucket_name,
+            Key=key,
+            Body=gzip.compress(json.dumps(data).encode()),
+            **condition,
+        )
+
+    def _list_segments(self) -> list[str]:
+        """Keys of the change segments, oldest first"""
+        prefix = self._segment_prefix()
+        if self.s3 is None:
+            directory = self._path(prefix)
+            if not os.path.isdir(directory):
+                return []
+            return sorted(
+                f"{prefix}{name}"
+                for name in os.listdir(directory)
+                if name.endswith(".json.gz")
+            )
+        keys = []
+        paginator = self.s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bm25_bucket_name, Prefix=prefix):
+            keys.extend(item["Key"] for item in page.get("Contents", []))
+        return sorted(keys)
+
+    def _delete_objects(self, keys: list[str]):
+        if self.s3 is None:
+            for key in keys:
+                try:
+                    os.remove(self._path(key))
+                except FileNotFoundError:
+                    pass
+            return
+        for start in range(0, len(keys), 1000):
+            self.s3.delete_objects(
+                Bucket=bm25_bucket_name,
+                Delete={
+                    "Objects": [{"Key": key} for key in keys[start : start + 1000]],
+                    "Quiet": True,
+                },
+            )
+
+    def exists(self) -> bool:
+        """Whether the user has an index, without loading it"""
+        if self.s3 is None:
+            return os.path.exists(self._path(self._snapshot_key()))
+        try:
+            self.s3.head_object(Bucket=bm25_bucket_name, Key=self._snapshot_key())
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return False
+            raise
+        return True
+
+    def load(self) -> BM25Index:
+        self.index, _, _ = self._read()
+        self._changes = []
+        self._replaced = False
+        return self.index
+
+    def _read(self) -> tuple[BM25Index, str | None, list[str]]:
+        """The current index, the etag of its snapshot and the segments applied"""
+        for _ in range(bm25_load_max_retries):
+            # Segments are listed before the snapshot is read, a compaction in
+            # between is seen in the segments the snapshot already contains
+            segments = self._list_segments()
+            data, etag = self._read_object(self._snapshot_key())
+            if data is None:
+                return BM25Index(), None, []
+            index = BM25Index.from_dict(data)
+            compacted = set(data.get("segments", []))
+            try:
+                for key in segments:
+                    if key in compacted:
+                        continue
+                    changes, _ = self._read_object(key)
+                    if changes is None:
+                        raise SegmentMissing(key)
+                    index.apply(changes)
+            except SegmentMissing:
+                print(f"BM25 index of {self.userId} compacted concurrently, retrying")
+                continue
+            return index, etag, segments
+        raise Exception(f"Could not load BM25 index of {self.userId}")
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self._changes) or self._replaced
+
+    @property
+    def replaced(self) -> bool:
+        return self._replaced
+
+    def add(self, vector_id: str, text: str, metadata: dict):
+        self.index.add(vector_id, text, metadata)
+        self._changes.append(("add", vector_id, text, metadata))
+
+    def remove(self, vector_id: str):
+        self.index.remove(vector_id)
+        self._changes.append(("remove", vector_id))
+
+    def remove_document(self, documentId: str):
+        """Remove every chunk of a document, for documents without a manifest"""
+        self.index.remove_document(documentId)
+        self._changes.append(("remove_document", documentId))
+
+    def retain(self, vector_ids):
+        """Remove every chunk that is not one of vector_ids"""
+        vector_ids = sorted(vector_ids)
+        self.index.retain(vector_ids)
+        self._changes.append(("retain", vector_ids))
+
+    def start_rebuild(self):
+        """
+        Start a full reindex that is saved in segments, so it is never held in
+        memory. Saves do not compact until finish_rebuild.
+        """
+        if not self.exists():
+            # Segments are only read on top of a snapshot
+            changes = self._changes
+            self.replace(BM25Index())
+            self.save()
+            self._changes = changes
+        self._rebuilding = True
+
+    def finish_rebuild(self, vector_ids):
+        """Save the last chunks of a rebuild, vector_ids are all chunks written"""
+        self.retain(vector_ids)
+        self._rebuilding = False
+        self.save()
+
+    def replace(self, index: BM25Index):
+        """Overwrite the stored index unconditionally, used by full reindexes"""
+        self.index = index
+        self._changes = []
+        self._replaced = True
+
+    def save(self):
+        if self._replaced:
+            # The new snapshot supersedes every segment written so far
+            segments = self._list_segments()
+            data = self.index.to_dict()
+            data["segments"] = segments
+            self._write_object(self._snapshot_key(), data)
+            self._delete_objects(segments)
+        elif self._changes:
+            key = (
+                f"{self._segment_prefix()}{time.time_ns():020d}-"
+                f"{uuid.uuid4().hex[:8]}.json.gz"
+            )
+            self._write_object(key, self._changes)
+            # Saved changes are not kept in memory, a rebuild saves every batch
+            self.index = BM25Index()
+            if (
+                not self._rebuilding
+                and len(self._list_segments()) >= bm25_compact_segments
+            ):
+                self.compact()
+        self._changes = []
+        self._replaced = False
+
+    def compact(self):
+        """Fold the change segments into a new snapshot"""
+        if not self.exists():
+            return
+        index, etag, segments = self._read()
+        data = index.to_dict()
+        data["segments"] = segments
+        try:
+            self._write_object(
+                self._snapshot_key(),
+                data,
+                **({"IfMatch": etag} if etag else {}),
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in (
+                "PreconditionFailed",
+                "ConditionalRequestConflict",
+            ):
+                raise
+            print(f"BM25 index of {self.userId} compacted concurrently, skipping")
+            return
+        self._delete_objects(segments)
+        print(f"Compacted {len(segments)} BM25 segments of {self.userId}")
+
+
+def get_bm25_store(userId: str) -> BM25IndexStore:
+    """BM25 index store of a user, in S3 unless running locally"""
+    if is_local or not bm25_bucket_name:
+        return BM25IndexStore(userId)
+    return BM25IndexStore(userId, s3=get_s3_client())
+
+
+_s3_client = None
+
+
+def get_s3_client():
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client("s3")
+    return _s3_client
+
+
+# Search handlers keep indexes of warm users for a short time
+bm25_index_cache = TTLCache(
+    max_entries=int(os.environ.get("BM25_CACHE_MAX_ENTRIES", 16)),
+    ttl_seconds=float(os.environ.get("BM25_CACHE_TTL_SECONDS", 60)),
+)
+
+
+def load_bm25_index(userId: str) -> BM25Index:
+    """Load the BM25 index of a user for searching, an empty index if unavailable"""
+    index = bm25_index_cache.get(userId)
+    if index is not None:
+        return index
+    try:
+        index = get_bm25_store(userId).load()
+    except Exception as e:
+        print(f"BM25 index of {userId} not available: {e}")
+        index = BM25Index()
+    bm25_index_cache.set(userId, index)
+    return index
+
+
+def reciprocal_rank_fusion(rankings: list[list], k: int = rrf_k) -> list:
+    """Fuse ranked lists of ids, each id scores sum(1 / (k + rank))"""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0) + 1 / (k + rank)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
+
+
+def fuse_bm25_results(
+    vector_results: list[tuple[Document, float]],
+    bm25_index: BM25Index,
+    query: str,
+    fetch_k: int = hybrid_search_fetch_k,
+) -> list[tuple[Document, float | None]]:
+    """
+    Fuse scored vector results with BM25 results by reciprocal rank fusion.
+
+    Chunks are matched across both rankings by documentId and content, since
+    not every vector store returns ids with its results. Chunks only found by
+    BM25 keep a score of None.
+    """
+    documents = {}
+    scores = {}
+
+    vector_ranking = []
+    for document, score in vector_results:
+        key = (document.metadata.get("documentId"), document.page_content)
+        documents.setdefault(key, document)
+        scores.setdefault(key, score)
+        vector_ranking.append(key)
+
+    bm25_ranking = []
+    for vector_id, _ in bm25_index.search(query, k=fetch_k):
+        chunk = bm25_index.chunks[vector_id]
+        key = (chunk["metadata"].get("documentId"), chunk["text"])
+        documents.setdefault(
+            key,
+            Document(
+                id=vector_id,
+                page_content=chunk["text"],
+                metadata=dict(chunk["metadata"]),
+            ),
+        )
+        bm25_ranking.append(key)
+
+    fused = reciprocal_rank_fusion([vector_ranking, bm25_ranking])
+    return [(documents[key], scores.get(key)) for key in fused]
+
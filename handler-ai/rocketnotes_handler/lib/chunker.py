@@ -0,0 +1,129 @@
+import os
+from functools import lru_cache
+from typing import Callable
+
+from langchain_text_splitters import (MarkdownHeaderTextSplitter,
+                                      RecursiveCharacterTextSplitter)
+
+from .embedding import estimate_tokens
+
+chunk_target_tokens = int(os.environ.get("CHUNK_TARGET_TOKENS", 256))
+chunk_max_tokens = int(os.environ.get("CHUNK_MAX_TOKENS", 512))
+chunk_overlap_tokens = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 0))
+chunk_min_tokens = int(os.environ.get("CHUNK_MIN_TOKENS", 32))
+
+# Input limits of the embeddings models, longer chunks are truncated by the model
+embeddings_model_max_tokens = {
+    "text-embedding-ada-002": 8191,
+    "text-embedding-3-small": 8191,
+    "voyage-2": 4000,
+    "voyage-3": 32000,
+    "Sentence-Transformers": 384,
+    "Ollama-nomic-embed-text": 2048,
+    "together-m2-bert-80M": 8192,
+}
+
+headers_to_split_on = [
+    ("#", "Header 1"),
+    ("##", "Header 2"),
+    ("###", "Header 3"),
+]
+
+
+def get_token_counter(embeddingsModel: str | None) -> Callable[[str], int]:
+    """
+    Token counter for the tokenizer of an embeddings model.
+
+    Uses tiktoken for OpenAI models and the Hugging Face tokenizer for
+    Sentence-Transformers when available, otherwise falls back to an estimate.
+    """
+    try:
+        if embeddingsModel and embeddingsModel.startswith("text-embedding-"):
+            import tiktoken
+
+            encoding = tiktoken.encoding_for_model(embeddingsModel)
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+        elif embeddingsModel == "Sentence-Transformers":
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(
+                "sentence-transformers/all-mpnet-base-v2"
+            )
+            return lambda text: len(
+                tokenizer.encode(text, add_special_tokens=False, verbose=False)
+            )
+    except Exception as e:
+        print(f"Tokenizer for {embeddingsModel} not available, estimating tokens: {e}")
+    return estimate_tokens
+
+
+class MarkdownChunker:
+    """
+    Splits markdown into chunks of a bounded token size.
+
+    Documents are split on headers first. Tiny adjacent sections are merged up to
+    the target size and sections above the maximum size are split further on
+    paragraphs, lines and sentences, with an optional token overlap.
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+        target_tokens: int = chunk_target_tokens,
+        max_tokens: int = chunk_max_tokens,
+        overlap_tokens: int = chunk_overlap_tokens,
+        min_tokens: int = chunk_min_tokens,
+    ):
+        self.count_tokens = count_tokens
+        self.target_tokens = min(target_tokens, max_tokens)
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+        self._header_splitter = MarkdownHeaderTextSplitter(
+            headers_to_split_on=headers_to_split_on, strip_headers=False
+        )
+        self._section_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.target_tokens,
+            chunk_overlap=min(overlap_tokens, self.target_tokens // 2),
+            length_function=count_tokens,
+            separators=["\n\n", "\n", ". ", " ", ""],
+        )
+
+    def split_text(self, text: str) -> list[str]:
+        sections = [
+            section.page_content
+            for section in self._header_splitter.split_text(text)
+            if section.page_content and section.page_content.strip()
+        ]
+
+        chunks = []
+        chunk_tokens = []
+        for section in sections:
+            tokens = self.count_tokens(section)
+            if tokens > self.max_tokens:
+                for piece in self._section_splitter.split_text(section):
+                    chunks.append(piece)
+                    chunk_tokens.append(self.count_tokens(piece))
+            elif (
+                chunks
+                and min(chunk_tokens[-1], tokens) < self.min_tokens
+                and chunk_tokens[-1] + tokens <= self.target_tokens
+            ):
+                chunks[-1] = f"{chunks[-1]}\n\n{section}"
+                chunk_tokens[-1] += tokens
+            else:
+                chunks.append(section)
+                chunk_tokens.append(tokens)
+        return chunks
+
+
+@lru_cache(maxsize=16)
+def get_chunker(embeddingsModel: str | None = None) -> MarkdownChunker:
+    """Chunker for an embeddings model, built once per process"""
+    max_tokens = min(
+        chunk_max_tokens,
+        embeddings_model_max_tokens.get(embeddingsModel, chunk_max_tokens),
+    )
+    return MarkdownChunker(
+        count_tokens=get_token_counter(embeddingsModel),
+        max_tokens=max_tokens,
+    )
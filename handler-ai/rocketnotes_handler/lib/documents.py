@@ -0,0 +1,78 @@
+import time
+
+documents_table_name = "tnn-Documents"
+
+
+def iter_user_documents(dynamodb, userId, page_size=None):
+    """
+    Yield every document of a user from the userId-index.
+
+    Follows LastEvaluatedKey so users with more than one page (1 MB) of notes
+    are read completely, while only one page is held in memory at a time.
+    """
+    pagination_config = {"PageSize": page_size} if page_size else {}
+    paginator = dynamodb.get_paginator("query")
+    pages = paginator.paginate(
+        TableName=documents_table_name,
+        IndexName="userId-index",
+        KeyConditionExpression="userId = :user_value",
+        ExpressionAttributeValues={
+            ":user_value": {"S": userId},
+        },
+        PaginationConfig=pagination_config,
+    )
+    for page in pages:
+        yield from page.get("Items", [])
+
+
+# DynamoDB BatchGetItem accepts at most 100 keys per request
+batch_get_max_keys = 100
+batch_get_max_retries = 8
+
+
+def batch_get_documents(
+    dynamodb,
+    documentIds,
+    attributes=("id", "title", "content", "deleted"),
+    consistent_read=False,
+) -> dict:
+    """
+    Load documents by id with BatchGetItem in chunks of 100 keys.
+
+    Only the given attributes are projected. UnprocessedKeys are retried with
+    exponential backoff. With consistent_read the documents include every write
+    acknowledged before the request, so they are not older than the message
+    that triggered the read.
+
+    Returns:
+        dict: documentId -> DynamoDB item, documents that do not exist are missing.
+    """
+    attribute_names = {f"#{attribute}": attribute for attribute in attributes}
+    documentIds = list(dict.fromkeys(documentIds))
+
+    documents = {}
+    for i in range(0, len(documentIds), batch_get_max_keys):
+        request = {
+            documents_table_name: {
+                "Keys": [
+                    {"id": {"S": documentId}}
+                    for documentId in documentIds[i : i + batch_get_max_keys]
+                ],
+                "ProjectionExpression": ", ".join(attribute_names),
+                "ExpressionAttributeNames": attribute_names,
+                "ConsistentRead": consistent_read,
+            }
+        }
+        for attempt in range(batch_get_max_retries + 1):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response.get("Responses", {}).get(documents_table_name, []):
+                documents[item["id"]["S"]] = item
+
+            request = response.get("UnprocessedKeys")
+            if not request:
+                break
+            if attempt == batch_get_max_retries:
+                raise Exception("Could not load all documents, retries exhausted")
+            time.sleep(min(0.05 * 2**attempt, 2))
+
+    return documents
@@ -0,0 +1,49 @@
+import os
+
+from langchain.embeddings.base import Embeddings
+
+# Upper bounds for a single embed_documents request
+embedding_batch_max_tokens = int(os.environ.get("EMBEDDING_BATCH_MAX_TOKENS", 100000))
+embedding_batch_max_texts = int(os.environ.get("EMBEDDING_BATCH_MAX_TEXTS", 128))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def iter_token_batches(
+    texts: list[str],
+    max_tokens: int = embedding_batch_max_tokens,
+    max_texts: int = embedding_batch_max_texts,
+):
+    """
+    Group texts into consecutive batches that stay within the token and size limits.
+
+    A single text larger than max_tokens is yielded as a batch of its own.
+
+    Yields:
+        list of int: Indices of the texts in each batch.
+    """
+    batch = []
+    batch_tokens = 0
+    for index, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if batch and (
+            batch_tokens + tokens > max_tokens or len(batch) >= max_texts
+        ):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(index)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def embed_in_batches(embeddings: Embeddings, texts: list[str]) -> list[list[float]]:
+    """Embed texts with as few token-bounded embed_documents calls as possible"""
+    vectors = []
+    for batch in iter_token_batches(texts):
+        vectors.extend(embeddings.embed_documents([texts[index] for index in batch]))
+    return vectors
@@ -0,0 +1,474 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+from langchain.embeddings.base import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from langchain_together import TogetherEmbeddings
+
+from .cache import TTLCache
+
+is_local = os.environ.get("LOCAL", False)
+
+# Vectors are persisted next to the embeddings in prod
+embedding_cache_bucket = os.environ.get("EMBEDDING_CACHE_BUCKET") or os.environ.get(
+    "BUCKET_NAME"
+)
+# "sqlite", "s3", "dynamodb" or "memory"; local development defaults to sqlite,
+# prod to s3 when a bucket is configured
+embedding_cache_backend = os.environ.get(
+    "EMBEDDING_CACHE_BACKEND",
+    "sqlite" if is_local else "s3" if embedding_cache_bucket else "memory",
+)
+embedding_cache_path = os.environ.get(
+    "EMBEDDING_CACHE_PATH", "/tmp/rocketnotes-embeddings.sqlite"
+)
+# Parallel requests of the S3 store, one object per vector
+embedding_cache_s3_concurrency = int(os.environ.get("EMBEDDING_CACHE_S3_CONCURRENCY", 32))
+embedding_cache_table = os.environ.get("EMBEDDING_CACHE_TABLE", "tnn-EmbeddingCache")
+# Memory held by cached document vectors, stored as float32 (6 KB per 1536
+# dimensional vector) to stay well within the 1024 MB of the Lambdas
+embedding_cache_max_bytes = int(
+    os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+)
+# Query embeddings are cached separately with a TTL, the shared tier is optional
+query_embedding_cache_max_entries = int(
+    os.environ.get("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", 1000)
+)
+query_embedding_cache_ttl_seconds = float(
+    os.environ.get("QUERY_EMBEDDING_CACHE_TTL_SECONDS", 3600)
+)
+query_embedding_cache_backend = os.environ.get("QUERY_EMBEDDING_CACHE_BACKEND")
+# Clients whose embed_query returns the same vector as embed_documents for the
+# same text. Other clients can declare it with a symmetric_queries attribute.
+symmetric_query_embeddings = (OpenAIEmbeddings, TogetherEmbeddings)
+
+
+def has_symmetric_queries(embeddings: Embeddings) -> bool:
+    """True if queries may be embedded in a batch with embed_documents"""
+    if isinstance(embeddings, symmetric_query_embeddings):
+        return True
+    return getattr(embeddings, "symmetric_queries", False) is True
+
+
+def encode_vector(vector: list[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def decode_vector(data: bytes) -> list[float]:
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache that evicts the least recently used entries.
+
+    The cache is bounded by number of entries, by the bytes held by keys and
+    values (as measured by sys.getsizeof), or both.
+    """
+
+    def __init__(self, max_entries: int | None = None, max_bytes: int | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            if self.max_bytes is not None:
+                size = sys.getsizeof(key) + sys.getsizeof(value)
+                self.size_bytes += size - self._sizes.get(key, 0)
+                self._sizes[key] = size
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while self._entries and self._is_full():
+                evicted, _ = self._entries.popitem(last=False)
+                self.size_bytes -= self._sizes.pop(evicted, 0)
+
+    def _is_full(self) -> bool:
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.size_bytes > self.max_bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self.size_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class EmbeddingStore(ABC):
+    """Persistent key -> vector store backing the embedding cache"""
+
+    @abstractmethod
+    def get_many(self, keys: list[str]) -> dict[str, list[float]]:
+        pass
+
+    @abstractmethod
+    def set_many(self, vectors: dict[str, list[float]]):
+        pass
+
+
+class SQLiteEmbeddingStore(EmbeddingStore):
+    """Embedding store in a local SQLite file, used for development"""
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        result = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                rows = self._connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                )
+                result.update({key: decode_vector(vector) for key, vector in rows})
+        return result
+
+    def set_many(self, vectors):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, encode_vector(vector)) for key, vector in vectors.items()],
+            )
+
+
+class S3EmbeddingStore(EmbeddingStore):
+    """
+    Embedding store with one S3 object per vector.
+
+    Objects are read and written in parallel, so a batch costs about one round
+    trip instead of one per vector.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "embedding-cache/",
+        concurrency: int = embedding_cache_s3_concurrency,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.concurrency = concurrency
+        self._s3 = boto3.client(
+            "s3", config=Config(max_pool_connections=concurrency)
+        )
+        self._pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def _get(self, key: str) -> list[float] | None:
+        try:
+            response = self._s3.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except self._s3.exceptions.NoSuchKey:
+            return None
+        return decode_vector(response["Body"].read())
+
+    def _put(self, item: tuple[str, list[float]]):
+        key, vector = item
+        self._s3.put_object(
+            Bucket=self.bucket, Key=self.prefix + key, Body=encode_vector(vector)
+        )
+
+    def get_many(self, keys):
+        return {
+            key: vector
+            for key, vector in zip(keys, self._pool.map(self._get, keys))
+            if vector is not None
+        }
+
+    def set_many(self, vectors):
+        list(self._pool.map(self._put, vectors.items()))
+
+
+class DynamoDBEmbeddingStore(EmbeddingStore):
+    """Embedding store in a DynamoDB table with a string hash key "id\""""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self._dynamodb = boto3.client("dynamodb")
+
+    def get_many(self, keys):
+        result = {}
+        for i in range(0, len(keys), 100):
+            request = {
+                self.table_name: {
+                    "Keys": [{"id": {"S": key}} for key in keys[i : i + 100]],
+                    "ProjectionExpression": "id, vector",
+                }
+            }
+            while request:
+                response = self._dynamodb.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table_name, []):
+                    result[item["id"]["S"]] = decode_vector(item["vector"]["B"])
+                request = response.get("UnprocessedKeys")
+        return result
+
+    def set_many(self, vectors):
+        items = list(vectors.items())
+        for i in range(0, len(items), 25):
+            request = {
+                self.table_name: [
+                    {
+                        "PutRequest": {
+                            "Item": {
+                                "id": {"S": key},
+                                "vector": {"B": encode_vector(vector)},
+                            }
+                        }
+                    }
+                    for key, vector in items[i : i + 25]
+                ]
+            }
+            while request:
+                response = self._dynamodb.batch_write_item(RequestItems=request)
+                request = response.get("UnprocessedItems")
+
+
+def create_embedding_store(backend: str = embedding_cache_backend) -> EmbeddingStore | None:
+    """Create the persistent embedding store configured for this environment"""
+    try:
+        if backend == "sqlite":
+            return SQLiteEmbeddingStore(embedding_cache_path)
+        elif backend == "s3" and embedding_cache_bucket:
+            return S3EmbeddingStore(embedding_cache_bucket)
+        elif backend == "dynamodb":
+            return DynamoDBEmbeddingStore(embedding_cache_table)
+    except Exception as e:
+        print(f"Embedding cache store '{backend}' not available: {e}")
+    return None
+
+
+# Shared by all CachedEmbeddings of this process, keys include the model name
+memory_cache = LRUCache(max_bytes=embedding_cache_max_bytes)
+_embedding_store = None
+_embedding_store_lock = threading.Lock()
+
+
+def get_embedding_store() -> EmbeddingStore | None:
+    """Return the process-wide persistent embedding store"""
+    global _embedding_store
+    with _embedding_store_lock:
+        if _embedding_store is None:
+            _embedding_store = create_embedding_store() or False
+    return _embedding_store or None
+
+
+def normalize_query(text: str) -> str:
+    """Queries differing only in case or whitespace share one embedding"""
+    return " ".join(text.split()).lower()
+
+
+class QueryEmbeddingCache:
+    """
+    Cache of query embeddings, in memory with a TTL and optionally in a shared
+    embedding store so that other warm Lambdas benefit as well.
+    """
+
+    def __init__(self, cache: TTLCache, store: EmbeddingStore | None = None):
+        self.cache = cache
+        self.store = store
+        self.shared_hits = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> list[float] | None:
+        vector = self.cache.get(key)
+        if vector is not None:
+            return vector.tolist()
+        if self.store is None:
+            return None
+        try:
+            vector = self.store.get_many([key]).get(key)
+        except Exception as e:
+            print(f"Error reading query embedding cache: {e}")
+            return None
+        if vector is not None:
+            with self._lock:
+                self.shared_hits += 1
+            self.cache.set(key, array("f", vector))
+        return vector
+
+    def set(self, key: str, vector: list[float]):
+        self.cache.set(key, array("f", vector))
+        if self.store is not None:
+            try:
+                self.store.set_many({key: vector})
+            except Exception as e:
+                print(f"Error writing query embedding cache: {e}")
+
+    def metrics(self) -> dict:
+        """Hit counts of both tiers since the process started"""
+        hits = self.cache.hits + self.shared_hits
+        misses = self.cache.misses - self.shared_hits
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "sharedHits": self.shared_hits,
+            "misses": misses,
+            "hitRate": hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        self.cache.clear()
+        with self._lock:
+            self.shared_hits = 0
+        self.cache.hits = 0
+        self.cache.misses = 0
+
+
+_query_cache = None
+
+
+def get_query_cache() -> QueryEmbeddingCache:
+    """Return the process-wide query embedding cache"""
+    global _query_cache
+    with _embedding_store_lock:
+        if _query_cache is None:
+            _query_cache = QueryEmbeddingCache(
+                TTLCache(
+                    query_embedding_cache_max_entries,
+                    query_embedding_cache_ttl_seconds,
+                ),
+                create_embedding_store(query_embedding_cache_backend)
+                if query_embedding_cache_backend
+                else None,
+            )
+    return _query_cache
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches vectors by (embeddings model, sha256(text)).
+
+    Lookups go to the in-memory LRU first, then to the persistent store, and only
+    texts missing from both are sent to the underlying embeddings model. The LRU
+    holds float32 arrays, vectors are converted to lists when returned. Queries
+    are normalized and go through the query embedding cache instead.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model: str,
+        store: EmbeddingStore | None = None,
+        cache: LRUCache | None = None,
+        query_cache: QueryEmbeddingCache | None = None,
+    ):
+        self.underlying = underlying
+        self.model = model
+        self.store = store
+        self.cache = cache if cache is not None else memory_cache
+        self.query_cache = query_cache if query_cache is not None else get_query_cache()
+
+    def _key(self, text: str, kind: str) -> str:
+        return hashlib.sha256(f"{self.model}:{kind}:{text}".encode("utf-8")).hexdigest()
+
+    def _embed(self, texts: list[str], kind: str, embed) -> list[list[float]]:
+        keys = [self._key(text, kind) for text in texts]
+        vectors = {}
+        for key in keys:
+            vector = self.cache.get(key)
+            if vector is not None:
+                vectors[key] = vector.tolist()
+
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing and self.store is not None:
+            try:
+                stored = self.store.get_many(missing)
+            except Exception as e:
+                print(f"Error reading embedding cache: {e}")
+                stored = {}
+            for key, vector in stored.items():
+                self.cache.set(key, array("f", vector))
+            vectors.update(stored)
+
+        missing_texts = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing_texts[key] = text
+        if missing_texts:
+            embedded = dict(zip(missing_texts, embed(list(missing_texts.values()))))
+            for key, vector in embedded.items():
+                self.cache.set(key, array("f", vector))
+            if self.store is not None:
+                try:
+                    self.store.set_many(embedded)
+                except Exception as e:
+                    print(f"Error writing embedding cache: {e}")
+            vectors.update(embedded)
+
+        print(
+            f"Embedding cache: {len(texts) - len(missing_texts)} hits, "
+            f"{len(missing_texts)} misses"
+        )
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, "document", self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> list[float]:
+        # Some providers embed queries differently, so they get their own keys
+        key = self._key(normalize_query(text), "query")
+        vector = self.query_cache.get(key)
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self.query_cache.set(key, vector)
+        self._print_query_metrics()
+        return vector
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed several queries with one provider call and cache them.
+
+        Later embed_query calls for the same queries, e.g. inside a vector
+        store search, are served from the query embedding cache.
+        """
+        keys = [self._key(normalize_query(text), "query") for text in texts]
+        vectors = {key: self.query_cache.get(key) for key in keys}
+        missing = {key: text for key, text in zip(keys, texts) if vectors[key] is None}
+        if missing:
+            if has_symmetric_queries(self.underlying):
+                embedded = self.underlying.embed_documents(list(missing.values()))
+            else:
+                # Query prefixes or input types differ from documents
+                embedded = [self.underlying.embed_query(text) for text in missing.values()]
+            for key, vector in zip(missing, embedded):
+                self.query_cache.set(key, vector)
+                vectors[key] = vector
+        self._print_query_metrics()
+        return [vectors[key] for key in keys]
+
+    def _print_query_metrics(self):
+        metrics = self.query_cache.metrics()
+        print(
+            f"Query embedding cache: hit rate {metrics['hitRate']:.0%} "
+            f"({metrics['hits']} hits, {metrics['sharedHits']} shared, "
+            f"{metrics['misses']} misses)"
+        )
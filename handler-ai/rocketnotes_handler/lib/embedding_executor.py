@@ -0,0 +1,219 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from langchain.embeddings.base import Embeddings
+
+from .embedding import estimate_tokens, iter_token_batches
+
+embedding_max_concurrency = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", 4))
+embedding_max_retries = int(os.environ.get("EMBEDDING_MAX_RETRIES", 5))
+
+# Tokens per minute allowed per provider, 0 disables the limiter
+provider_tokens_per_minute = {
+    "openai": int(os.environ.get("OPENAI_EMBEDDING_TPM", 1000000)),
+    "voyage": int(os.environ.get("VOYAGE_EMBEDDING_TPM", 1000000)),
+    "together": int(os.environ.get("TOGETHER_EMBEDDING_TPM", 1000000)),
+    "ollama": int(os.environ.get("OLLAMA_EMBEDDING_TPM", 0)),
+}
+
+# Local models gain nothing from many parallel requests
+provider_max_concurrency = {
+    "ollama": int(os.environ.get("OLLAMA_EMBEDDING_CONCURRENCY", 2)),
+    "local": 1,
+}
+
+
+def get_embeddings_provider(embeddingsModel: str | None) -> str:
+    """Provider whose rate limits apply to an embeddings model"""
+    if embeddingsModel is None:
+        return "local"
+    elif embeddingsModel.startswith("text-embedding-"):
+        return "openai"
+    elif embeddingsModel.startswith("voyage-"):
+        return "voyage"
+    elif embeddingsModel.startswith("together-"):
+        return "together"
+    elif embeddingsModel.startswith("Ollama-"):
+        return "ollama"
+    return "local"
+
+
+class TokenBucket:
+    """Thread-safe token bucket that refills continuously at a fixed rate"""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        """Block until the tokens are available and take them"""
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_seconds = (tokens - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+    def drain(self):
+        """Empty the bucket, e.g. after the provider answered with a 429"""
+        with self._lock:
+            self._tokens = 0
+            self._updated = time.monotonic()
+
+
+# Shared by all executors of this process, keyed by provider
+_token_buckets: dict[str, TokenBucket] = {}
+_token_buckets_lock = threading.Lock()
+
+
+def get_token_bucket(provider: str) -> TokenBucket | None:
+    tokens_per_minute = provider_tokens_per_minute.get(provider, 0)
+    if tokens_per_minute <= 0:
+        return None
+    with _token_buckets_lock:
+        if provider not in _token_buckets:
+            _token_buckets[provider] = TokenBucket(tokens_per_minute)
+        return _token_buckets[provider]
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit that halves on rate limit errors and grows back by one
+    after each successful call.
+    """
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = self.max_concurrency
+        self._active = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self._active >= self.limit:
+                self._condition.wait()
+            self._active += 1
+        return self
+
+    def __exit__(self, *args):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self.limit = min(self.max_concurrency, self.limit + 1)
+            self._condition.notify_all()
+
+    def on_rate_limit(self):
+        with self._condition:
+            self.limit = max(1, self.limit // 2)
+            print(f"Rate limited, reducing embedding concurrency to {self.limit}")
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """True for HTTP 429 errors of any of the provider SDKs"""
+    status_code = getattr(e, "status_code", None)
+    if status_code is None and getattr(e, "response", None) is not None:
+        status_code = getattr(e.response, "status_code", None)
+    if status_code == 429:
+        return True
+    message = str(e).lower()
+    return any(
+        pattern in message for pattern in ("429", "rate limit", "too many requests")
+    )
+
+
+class EmbeddingExecutor:
+    """
+    Embeds token-bounded batches of texts on a bounded thread pool.
+
+    Calls are throttled by the provider's token bucket and the number of parallel
+    requests adapts to 429 responses, which are retried with backoff.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        provider: str = "local",
+        max_concurrency: int = embedding_max_concurrency,
+        max_retries: int = embedding_max_retries,
+    ):
+        self.embeddings = embeddings
+        self.provider = provider
+        self.max_retries = max_retries
+        self.token_bucket = get_token_bucket(provider)
+        max_concurrency = min(
+            max_concurrency, provider_max_concurrency.get(provider, max_concurrency)
+        )
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """Embed one batch, waiting for the rate limiter and retrying on 429"""
+        if not texts:
+            return []
+        tokens = sum(estimate_tokens(text) for text in texts)
+        for attempt in range(self.max_retries + 1):
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(tokens)
+            try:
+                with self.concurrency:
+                    vectors = self.embeddings.embed_documents(texts)
+                self.concurrency.on_success()
+                return vectors
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self.concurrency.on_rate_limit()
+                if self.token_bucket is not None:
+                    self.token_bucket.drain()
+                time.sleep(min(0.5 * 2**attempt, 20))
+
+    def map(self, items, texts_of, max_pending: int | None = None):
+        """
+        Embed the texts of each item in parallel.
+
+        Results are yielded as soon as a batch is embedded, so the caller can
+        write vectors while later batches are still being embedded. At most
+        max_pending batches are queued, which keeps memory bounded when items
+        are streamed.
+
+        Yields:
+            tuple: (item, vectors of texts_of(item)) in completion order.
+        """
+        max_pending = max_pending or self.concurrency.max_concurrency * 2
+        with ThreadPoolExecutor(max_workers=self.concurrency.max_concurrency) as pool:
+            pending = {}
+            for item in items:
+                pending[pool.submit(self.embed, texts_of(item))] = item
+                while len(pending) >= max_pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed texts in parallel token-bounded batches, keeping their order"""
+        vectors = [None] * len(texts)
+        batches = iter_token_batches(texts)
+        for batch, batch_vectors in self.map(
+            batches, lambda batch: [texts[index] for index in batch]
+        ):
+            for index, vector in zip(batch, batch_vectors):
+                vectors[index] = vector
+        return vectors
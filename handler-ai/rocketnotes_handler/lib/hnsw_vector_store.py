@@ -0,0 +1,174 @@
+import json
+import os
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from .numpy_vector_store import NumpyVectorStore, normalize
+
+# hnswlib is optional, without it the numpy backend is used
+try:
+    import hnswlib
+
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    hnswlib = None
+    HNSWLIB_AVAILABLE = False
+
+hnsw_m = int(os.environ.get("HNSW_M", 16))
+hnsw_ef_construction = int(os.environ.get("HNSW_EF_CONSTRUCTION", 200))
+hnsw_ef_search = int(os.environ.get("HNSW_EF_SEARCH", 64))
+# Below this many vectors an exact scan is both faster and exact
+hnsw_exact_search_threshold = int(os.environ.get("HNSW_EXACT_SEARCH_THRESHOLD", 2000))
+
+
+class HnswVectorStore(NumpyVectorStore):
+    """
+    Numpy vector store with an HNSW graph for approximate nearest neighbours.
+
+    The full vectors, texts and metadata are kept by NumpyVectorStore, the graph
+    (hnswlib, inner product on normalized vectors) only maps queries to
+    candidate rows. Vectors are inserted and deleted incrementally by id and the
+    graph is persisted next to the numpy index whenever it is flushed.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        path: str | None = None,
+        quantization: str | None = None,
+        m: int = hnsw_m,
+        ef_construction: int = hnsw_ef_construction,
+        ef_search: int = hnsw_ef_search,
+        exact_search_threshold: int = hnsw_exact_search_threshold,
+        auto_flush: bool = True,
+    ):
+        if not HNSWLIB_AVAILABLE:
+            raise ImportError("hnswlib is required for the HNSW vector store")
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.exact_search_threshold = exact_search_threshold
+        self._index = None
+        # vector id -> label in the graph, slots of deleted vectors are reused
+        self._labels: dict[str, int] = {}
+        self._label_ids: dict[int, str] = {}
+        super().__init__(
+            embedding, path=path, quantization=quantization, auto_flush=auto_flush
+        )
+
+    def _index_path(self):
+        return os.path.join(self.path, "hnsw.bin")
+
+    def _labels_path(self):
+        return os.path.join(self.path, "hnsw-labels.json")
+
+    def _load(self):
+        super()._load()
+        if len(self._ids) == 0:
+            return
+        if os.path.exists(self._index_path()) and os.path.exists(self._labels_path()):
+            with open(self._labels_path()) as f:
+                labels = json.load(f)
+            if set(labels) == set(self._ids):
+                self._index = hnswlib.Index(space="ip", dim=self._vectors.shape[1])
+                self._index.load_index(self._index_path(), allow_replace_deleted=True)
+                self._set_labels(labels)
+                return
+        print("HNSW index missing or outdated, rebuilding from vectors")
+        self._rebuild_index()
+
+    def _set_labels(self, labels: dict[str, int]):
+        self._labels = labels
+        self._label_ids = {label: vector_id for vector_id, label in labels.items()}
+
+    def _rebuild_index(self):
+        self._index = None
+        self._set_labels({})
+        if len(self._ids) > 0:
+            self._insert(self._ids, np.asarray(self._vectors))
+        self._save_index()
+
+    def _create_index(self, dim: int, max_elements: int):
+        index = hnswlib.Index(space="ip", dim=dim)
+        index.init_index(
+            max_elements=max_elements,
+            ef_construction=self.ef_construction,
+            M=self.m,
+            allow_replace_deleted=True,
+        )
+        return index
+
+    def _insert(self, ids: list[str], vectors: np.ndarray):
+        if self._index is None:
+            self._index = self._create_index(vectors.shape[1], max(len(ids), 1024))
+        new_ids = [vector_id for vector_id in ids if vector_id not in self._labels]
+        required = self._index.get_current_count() + len(new_ids)
+        if required > self._index.get_max_elements():
+            self._index.resize_index(max(required, self._index.get_max_elements() * 2))
+
+        labels = []
+        next_label = max(self._label_ids, default=-1) + 1
+        for vector_id in ids:
+            if vector_id not in self._labels:
+                self._labels[vector_id] = next_label
+                self._label_ids[next_label] = vector_id
+                next_label += 1
+            labels.append(self._labels[vector_id])
+        # Existing labels are updated in place, new ones reuse deleted slots
+        self._index.add_items(vectors, np.asarray(labels), replace_deleted=True)
+
+    def _save_index(self):
+        if self.path is None or self._index is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self._index.save_index(f"{self._index_path()}.tmp")
+        with open(f"{self._labels_path()}.tmp", "w") as f:
+            json.dump(self._labels, f)
+        os.replace(f"{self._index_path()}.tmp", self._index_path())
+        os.replace(f"{self._labels_path()}.tmp", self._labels_path())
+
+    def _save(self):
+        # The graph is written before the records, so a reader that sees the
+        # new records also finds the matching graph
+        self._save_index()
+        super()._save()
+
+    def _on_upsert(self, ids: list[str], vectors: np.ndarray):
+        self._insert(ids, vectors)
+
+    def _on_delete(self, ids: list[str]):
+        if self._index is None:
+            return
+        if not self._ids:
+            # An empty store starts a new graph, possibly of another dimension
+            self._index = None
+            self._set_labels({})
+            return
+        for vector_id in ids:
+            label = self._labels.pop(vector_id, None)
+            if label is not None:
+                self._label_ids.pop(label)
+                self._index.mark_deleted(label)
+
+    def _search(self, embedding: list[float], k: int, filter: dict | None = None):
+        with self._lock:
+            # Metadata filters select a few rows (one document), which are
+            # scanned exactly instead of searching the whole graph
+            if (
+                self._index is None
+                or filter
+                or len(self._ids) <= self.exact_search_threshold
+                or k <= 0
+            ):
+                return super()._search(embedding, k, filter)
+
+            k = min(k, len(self._ids))
+            self._index.set_ef(max(self.ef_search, k))
+            query = normalize(np.asarray(embedding)[None, :])
+            labels, distances = self._index.knn_query(query, k=k)
+            rows = np.array(
+                [self._rows[self._label_ids[label]] for label in labels[0]],
+                dtype=np.int64,
+            )
+            # Inner product space: distance = 1 - cosine similarity
+            return rows, (1 - distances[0]).astype(np.float32)
@@ -5,6 +5,7 @@ from langchain.embeddings.base import Embeddings
 from langchain_core.language_models import BaseChatModel
 
 from .model import InsertSuggestion, NoteSnippet, UserConfig
+from .rerank import fetch_k_for_rerank, rerank_candidates
 from .vector_store_factory import get_vector_store_factory
 
 is_local = os.environ.get("LOCAL", False)
@@ -24,11 +25,15 @@ def find_insert_position(
 ) -> list[InsertSuggestion]:
 
     # Get vector store for the user (S3 for prod, Chroma for local)
-    db = get_vector_store_factory(user_config.id, embeddings)
+    db = get_vector_store_factory(
+        user_config.id, embeddings, quantization=user_config.vectorQuantization
+    )
 
     result: list[InsertSuggestion] = []
     for note in notes:
-        similarity_search_result = db.similarity_search(note.text, k=5)
+        similarity_search_result = rerank_candidates(
+            note.text, db.similarity_search(note.text, k=fetch_k_for_rerank(5))
+        )[:5]
         search_result = []
         for item in similarity_search_result:
             document_id = item.metadata["documentId"]
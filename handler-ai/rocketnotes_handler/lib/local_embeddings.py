@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+sentence_transformers_model = os.environ.get(
+    "SENTENCE_TRANSFORMERS_MODEL", "sentence-transformers/all-mpnet-base-v2"
+)
+sentence_transformers_batch_size = int(
+    os.environ.get("SENTENCE_TRANSFORMERS_BATCH_SIZE", 32)
+)
+# Torch intra-op threads, unset keeps torch's default of one per core
+sentence_transformers_threads = os.environ.get("SENTENCE_TRANSFORMERS_THREADS")
+# "torch" runs the model with PyTorch, "onnx" with ONNX Runtime. The ONNX
+# backend needs sentence-transformers[onnx]. sentence-transformers still imports
+# torch, so the image keeps it, but the forward pass runs in ONNX Runtime.
+sentence_transformers_backend = os.environ.get("SENTENCE_TRANSFORMERS_BACKEND", "torch")
+# int8 dynamic quantization of the ONNX model, one of arm64, avx2, avx512 or
+# avx512_vnni. Unset runs the fp32 export.
+onnx_quantization = os.environ.get("SENTENCE_TRANSFORMERS_ONNX_QUANTIZATION")
+onnx_quantization_configs = ["arm64", "avx2", "avx512", "avx512_vnni"]
+# Set to "Sentence-Transformers" to load the model during Lambda init or
+# container start instead of on the first request
+preload_embeddings_model = os.environ.get("PRELOAD_EMBEDDINGS_MODEL")
+
+_sentence_transformers: dict[tuple[str, str | None], HuggingFaceEmbeddings] = {}
+_sentence_transformers_lock = threading.Lock()
+
+
+def set_torch_threads(threads: int):
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def onnx_file_name(quantization: str | None) -> str:
+    """ONNX export inside the model repository, as published by sentence-transformers"""
+    if quantization is None:
+        return "onnx/model.onnx"
+    if quantization not in onnx_quantization_configs:
+        raise ValueError(f"ONNX quantization '{quantization}' not supported")
+    return f"onnx/model_qint8_{quantization}.onnx"
+
+
+def sentence_transformers_model_kwargs(
+    backend: str, quantization: str | None = None
+) -> dict:
+    if backend == "torch":
+        return {"device": "cpu"}
+    elif backend == "onnx":
+        return {
+            "device": "cpu",
+            "backend": "onnx",
+            "model_kwargs": {
+                "file_name": onnx_file_name(quantization),
+                "provider": "CPUExecutionProvider",
+            },
+        }
+    else:
+        raise ValueError(f"Sentence-Transformers backend '{backend}' not found")
+
+
+def resolve_sentence_transformers_backend(
+    backend: str | None = None, quantization: str | None = None
+) -> tuple[str, str | None]:
+    """Backend and ONNX quantization to run, the configured ones by default"""
+    backend = backend or sentence_transformers_backend
+    if backend == "onnx":
+        return backend, quantization or onnx_quantization
+    return backend, None
+
+
+def sentence_transformers_variant(
+    backend: str | None = None, quantization: str | None = None
+) -> str | None:
+    """
+    Backend and quantization the vectors are computed with, None for torch.
+
+    int8 vectors differ from fp32 ones, so they are cached and indexed apart.
+    """
+    backend, quantization = resolve_sentence_transformers_backend(
+        backend, quantization
+    )
+    if backend == "torch":
+        return None
+    return f"{backend}-qint8-{quantization}" if quantization else backend
+
+
+def get_sentence_transformers_embeddings(
+    backend: str | None = None, quantization: str | None = None
+) -> HuggingFaceEmbeddings:
+    """
+    Process-wide Sentence-Transformers model, shared by all users.
+
+    The weights are loaded from disk once per backend, every later call returns
+    the same model.
+    """
+    key = resolve_sentence_transformers_backend(backend, quantization)
+    backend, quantization = key
+    with _sentence_transformers_lock:
+        if key not in _sentence_transformers:
+            start = time.perf_counter()
+            if sentence_transformers_threads and backend == "torch":
+                set_torch_threads(int(sentence_transformers_threads))
+            _sentence_transformers[key] = HuggingFaceEmbeddings(
+                model_name=sentence_transformers_model,
+                model_kwargs=sentence_transformers_model_kwargs(backend, quantization),
+                encode_kwargs={"batch_size": sentence_transformers_batch_size},
+            )
+            print(
+                f"Loaded {sentence_transformers_model} ({backend}"
+                f"{f' qint8 {quantization}' if quantization else ''}) in "
+                f"{(time.perf_counter() - start) * 1000:.0f} ms"
+            )
+    return _sentence_transformers[key]
+
+
+def preload_local_embeddings():
+    """Load the configured local embeddings model ahead of the first request"""
+    if preload_embeddings_model != "Sentence-Transformers":
+        return
+    try:
+        # Embedding once also initializes the tokenizer and torch kernels
+        get_sentence_transformers_embeddings().embed_query("warm up")
+    except Exception as e:
+        print(f"Could not preload {preload_embeddings_model}: {e}")
@@ -0,0 +1,123 @@
+import hashlib
+
+vector_table_name = "tnn-Vectors"
+
+
+def hash_content(text: str) -> str:
+    """Return the sha256 hex digest used to identify a chunk or document version"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_vector_id(documentId: str, chunk_hash: str) -> str:
+    """
+    Deterministic vector id of a document section.
+
+    Writing the same section again overwrites its vector instead of adding a
+    duplicate.
+    """
+    return f"{documentId}-{chunk_hash[:32]}"
+
+
+def document_content_hash(title: str, content: str) -> str:
+    """
+    Version of a document as indexed, sent along with embedding messages.
+
+    Must match the hash computed by the producers in handler-crud.
+    """
+    return hash_content(f"{title}\n{content}")
+
+
+class ChunkManifest:
+    def __init__(self, chunks: dict[str, str], contentHash: str | None = None):
+        # content hash of a section -> id of its vector in the vector store
+        self.chunks: dict[str, str] = chunks
+        # document_content_hash of the indexed document version
+        self.contentHash: str | None = contentHash
+
+
+def get_chunk_manifest(dynamodb, documentId) -> ChunkManifest | None:
+    """
+    Load the chunk manifest of a document.
+
+    Returns:
+        ChunkManifest, or None if the document has never been indexed with a
+        manifest.
+    """
+    result = dynamodb.get_item(
+        TableName=vector_table_name,
+        Key={"id": {"S": documentId}},
+    )
+    if "Item" not in result:
+        return None
+
+    chunks = result["Item"].get("chunks", {}).get("M", {})
+    return ChunkManifest(
+        chunks={chunk_hash: value["S"] for chunk_hash, value in chunks.items()},
+        contentHash=result["Item"].get("contentHash", {}).get("S", None),
+    )
+
+
+def save_chunk_manifest(
+    dynamodb, documentId, userId, chunks: dict[str, str], contentHash=None
+):
+    """Store the chunk manifest (content hash -> vector id) of a document"""
+    item = {
+        "id": {"S": documentId},
+        "userId": {"S": userId},
+        "chunks": {
+            "M": {
+                chunk_hash: {"S": vector_id}
+                for chunk_hash, vector_id in chunks.items()
+            }
+        },
+    }
+    if contentHash:
+        item["contentHash"] = {"S": contentHash}
+    dynamodb.put_item(TableName=vector_table_name, Item=item)
+
+
+def delete_chunk_manifest(dynamodb, documentId):
+    """Remove the chunk manifest of a document"""
+    dynamodb.delete_item(
+        TableName=vector_table_name,
+        Key={"id": {"S": documentId}},
+    )
+
+
+def get_indexed_embeddings_model(dynamodb, userId) -> str | None:
+    """Versioned embeddings model the user's index was last recreated with"""
+    result = dynamodb.get_item(
+        TableName=vector_table_name,
+        Key={"id": {"S": f"index#{userId}"}},
+    )
+    return result.get("Item", {}).get("embeddingsModel", {}).get("S", None)
+
+
+def save_indexed_embeddings_model(dynamodb, userId, embeddingsModel: str):
+    """Record the versioned embeddings model of a recreated index"""
+    dynamodb.put_item(
+        TableName=vector_table_name,
+        Item={
+            "id": {"S": f"index#{userId}"},
+            "embeddingsModel": {"S": embeddingsModel},
+        },
+    )
+
+
+def diff_chunk_manifest(
+    manifest: dict[str, str], chunk_hashes: list[str]
+) -> tuple[list[str], list[str]]:
+    """
+    Compare a stored manifest with the section hashes of the current content.
+
+    Returns:
+        tuple: (hashes that need to be embedded, hashes whose vectors must be deleted)
+    """
+    current = set(chunk_hashes)
+    added = [
+        chunk_hash
+        for chunk_hash in dict.fromkeys(chunk_hashes)
+        if chunk_hash not in manifest
+    ]
+    removed = [chunk_hash for chunk_hash in manifest if chunk_hash not in current]
+    return added, removed
@@ -20,6 +20,7 @@ class UserConfig:
         anthropicApiKey: str | None = None,
         voyageApiKey: str | None = None,
         togetherApiKey: str | None = None,
+        vectorQuantization: str | None = None,
     ):
         self.id: str = id
         self.embeddingsModel: str | None = embeddingsModel
@@ -28,6 +29,8 @@ class UserConfig:
         self.anthropicApiKey: str | None = anthropicApiKey
         self.voyageApiKey: str | None = voyageApiKey
         self.togetherApiKey: str | None = togetherApiKey
+        # "int8" or "binary" to quantize the local vector index, None for float32
+        self.vectorQuantization: str | None = vectorQuantization
 
 
 class Zettel:
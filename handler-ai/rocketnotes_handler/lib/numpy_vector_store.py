@@ -0,0 +1,442 @@
+import json
+import os
+import threading
+import uuid
+from typing import Any, Iterable
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+from .quantization import QuantizedIndex
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so cosine similarity becomes a dot product"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1
+    return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+
+def top_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    rows = np.argpartition(-scores, k - 1)[:k]
+    return rows[np.argsort(-scores[rows])]
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store backed by a contiguous float32 NumPy matrix.
+
+    Vectors are normalized on insert and searched with a single matrix-vector
+    product, scores are cosine similarities. When a path is given the matrix is
+    persisted as a .npy file, which is memory-mapped on load, next to a JSON file
+    with ids, texts and metadata.
+
+    With quantization ("int8" or "binary") queries scan compact codes held in
+    memory and only the best candidates are re-scored with the full vectors.
+
+    Writes go to an in-memory buffer that grows geometrically, so upserts and
+    deletes only touch the affected rows. With auto_flush disabled the files
+    are written once by flush, e.g. at the end of an embedding job, instead of
+    after every call.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        path: str | None = None,
+        quantization: str | None = None,
+        auto_flush: bool = True,
+    ):
+        self._embedding = embedding
+        self.path = path
+        self.auto_flush = auto_flush
+        self._quantized = (
+            QuantizedIndex(quantization)
+            if quantization and quantization != "none"
+            else None
+        )
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        # Writable rows with spare capacity, None while the memory-mapped file
+        # backs self._vectors
+        self._buffer: np.ndarray | None = None
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+        self._rows: dict[str, int] = {}
+        # documentId of every row for vectorized filtering, built on demand
+        self._document_ids: np.ndarray | None = None
+        self._quantized_stale = False
+        self._dirty = False
+        # records.json version this store was loaded from or last wrote
+        self._loaded_version: tuple | None = None
+        if path is not None:
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _vectors_path(self):
+        return os.path.join(self.path, "vectors.npy")
+
+    def _records_path(self):
+        return os.path.join(self.path, "records.json")
+
+    def _records_version(self) -> tuple | None:
+        """Identity of records.json, every save replaces it with a new inode"""
+        try:
+            stat = os.stat(self._records_path())
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        version = self._records_version()
+        if version is None:
+            return
+        with open(self._records_path()) as f:
+            records = json.load(f)
+        vectors = np.load(self._vectors_path(), mmap_mode="r")
+        if vectors.shape[0] != len(records["ids"]):
+            # Another process is between replacing the two files
+            print("Vector index files are being replaced, keeping the loaded index")
+            return
+        self._loaded_version = version
+        self._vectors = vectors
+        self._buffer = None
+        self._ids = records["ids"]
+        self._texts = records["texts"]
+        self._metadatas = records["metadatas"]
+        self._reindex_rows()
+
+    def _save(self):
+        if self.path is None:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        # Write to temporary files first so readers never see a partial index
+        vectors_path = self._vectors_path()
+        with open(f"{vectors_path}.tmp", "wb") as f:
+            np.save(f, self._vectors)
+        with open(f"{self._records_path()}.tmp", "w") as f:
+            json.dump(
+                {"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas},
+                f,
+            )
+        os.replace(f"{vectors_path}.tmp", vectors_path)
+        os.replace(f"{self._records_path()}.tmp", self._records_path())
+        self._vectors = np.load(vectors_path, mmap_mode="r")
+        self._buffer = None
+        self._loaded_version = self._records_version()
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the index when another process has written it since it was loaded.
+
+        Stores with unflushed writes are kept as they are.
+        """
+        if self.path is None:
+            return False
+        with self._lock:
+            if self._dirty:
+                return False
+            version = self._records_version()
+            if version is None or version == self._loaded_version:
+                return False
+            print("Vector index changed on disk, reloading")
+            self._load()
+            return True
+
+    def flush(self):
+        """Persist pending upserts and deletes"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+                self._dirty = False
+
+    def _reindex_rows(self):
+        self._rows = {vector_id: row for row, vector_id in enumerate(self._ids)}
+        self._document_ids = None
+        if self._quantized is not None:
+            self._quantized.build(self._vectors)
+        self._quantized_stale = False
+
+    def _changed(self):
+        self._vectors = self._buffer[: len(self._ids)]
+        self._document_ids = None
+        self._quantized_stale = True
+        self._dirty = True
+        if self.auto_flush:
+            self.flush()
+
+    def _reserve(self, rows: int, dim: int):
+        """Make the vectors writable with room for rows more of them"""
+        count = len(self._ids)
+        if (
+            self._buffer is not None
+            and self._buffer.shape[1] == dim
+            and self._buffer.shape[0] >= count + rows
+        ):
+            return
+        capacity = max(count + rows, 2 * count, 64)
+        buffer = np.zeros((capacity, dim), dtype=np.float32)
+        if count > 0:
+            buffer[:count] = self._vectors[:count]
+        self._buffer = buffer
+
+    def _on_upsert(self, ids: list[str], vectors: np.ndarray):
+        """Called with the normalized vectors of every upsert, before flushing"""
+
+    def _on_delete(self, ids: list[str]):
+        """Called with the ids removed by a delete, before flushing"""
+
+    def add_embeddings(
+        self,
+        texts: list[str],
+        embeddings: list[list[float]],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+    ) -> list[str]:
+        """Upsert texts with precomputed embeddings, existing ids are overwritten"""
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = normalize(embeddings)
+
+        with self._lock:
+            if len(self._ids) > 0 and self._vectors.shape[1] != vectors.shape[1]:
+                raise ValueError(
+                    f"Vector dimension {vectors.shape[1]} does not match "
+                    f"index dimension {self._vectors.shape[1]}"
+                )
+            self._reserve(len(texts), vectors.shape[1])
+            for vector, text, metadata, vector_id in zip(vectors, texts, metadatas, ids):
+                row = self._rows.get(vector_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._rows[vector_id] = row
+                    self._ids.append(vector_id)
+                    self._texts.append(text)
+                    self._metadatas.append(metadata)
+                else:
+                    self._texts[row] = text
+                    self._metadatas[row] = metadata
+                self._buffer[row] = vector
+            self._on_upsert(ids, vectors)
+            self._changed()
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        return self.add_embeddings(
+            texts, self._embedding.embed_documents(texts), metadatas, ids
+        )
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        """Delete vectors by id. Without ids nothing is deleted."""
+        if not ids:
+            return False
+        with self._lock:
+            deleted = [vector_id for vector_id in dict.fromkeys(ids) if vector_id in self._rows]
+            if not deleted:
+                return True
+            self._reserve(0, self._vectors.shape[1])
+            for vector_id in deleted:
+                # The last row moves into the gap, rows have no meaningful order
+                row = self._rows.pop(vector_id)
+                last = len(self._ids) - 1
+                if row != last:
+                    self._buffer[row] = self._buffer[last]
+                    self._ids[row] = self._ids[last]
+                    self._texts[row] = self._texts[last]
+                    self._metadatas[row] = self._metadatas[last]
+                    self._rows[self._ids[row]] = row
+                self._ids.pop()
+                self._texts.pop()
+                self._metadatas.pop()
+            self._on_delete(deleted)
+            self._changed()
+        return True
+
+    def clear(self):
+        """Delete every vector, the next write may use another dimension"""
+        with self._lock:
+            self.delete(ids=list(self._ids))
+
+    def get_ids_by_metadata(self, filter: dict) -> list[str]:
+        """Ids of all vectors whose metadata matches the filter"""
+        with self._lock:
+            return [self._ids[row] for row in np.flatnonzero(self._filter_mask(filter))]
+
+    def _filter_mask(self, filter: dict | None) -> np.ndarray:
+        mask = np.ones(len(self._ids), dtype=bool)
+        for key, value in (filter or {}).items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            if key == "documentId":
+                if self._document_ids is None:
+                    self._document_ids = np.array(
+                        [metadata.get("documentId") for metadata in self._metadatas],
+                        dtype=object,
+                    )
+                mask &= np.isin(self._document_ids, list(values))
+            else:
+                mask &= np.array(
+                    [metadata.get(key) in values for metadata in self._metadatas],
+                    dtype=bool,
+                )
+        return mask
+
+    def _search(self, embedding: list[float], k: int, filter: dict | None = None):
+        """Rows and cosine similarities of the k nearest vectors, best first"""
+        with self._lock:
+            vectors = self._vectors
+            if len(self._ids) == 0 or k <= 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            query = normalize(np.asarray(embedding)[None, :])[0]
+            quantized = self._quantized is not None and (
+                len(self._ids) > k * self._quantized.rerank_factor
+            )
+            if quantized and self._quantized_stale:
+                # Codes are rebuilt once per batch of writes, on the next query
+                self._quantized.build(vectors)
+                self._quantized_stale = False
+            scores = self._quantized.scores(query) if quantized else vectors @ query
+            if filter:
+                mask = self._filter_mask(filter)
+                scores = np.where(mask, scores, -np.inf)
+                k = min(k, int(mask.sum()))
+            k = min(k, len(scores))
+            if k == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+            if quantized:
+                # Re-score the best candidates of the quantized scan exactly
+                candidates = min(k * self._quantized.rerank_factor, len(scores))
+                rows = top_rows(scores, candidates)
+                # Sorted rows read the memory-mapped vectors sequentially
+                rows = np.sort(rows[np.isfinite(scores[rows])])
+                scores = np.asarray(vectors[rows]) @ query
+                best = top_rows(scores, min(k, len(rows)))
+                return rows[best], scores[best]
+
+            rows = top_rows(scores, k)
+            return rows, scores[rows]
+
+    def _document(self, row: int) -> Document:
+        return Document(
+            id=self._ids[row],
+            page_content=self._texts[row],
+            metadata=dict(self._metadatas[row]),
+        )
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, filter: dict | None = None, **kwargs
+    ) -> list[tuple[Document, float]]:
+        rows, scores = self._search(embedding, k, filter)
+        return [(self._document(row), float(score)) for row, score in zip(rows, scores)]
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, filter: dict | None = None, **kwargs
+    ) -> list[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score_by_vector(
+                embedding, k, filter
+            )
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: dict | None = None, **kwargs
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self._embedding.embed_query(query), k, filter
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: dict | None = None, **kwargs
+    ) -> list[Document]:
+        return self.similarity_search_by_vector(
+            self._embedding.embed_query(query), k, filter
+        )
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1) / 2
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: dict | None = None,
+        **kwargs,
+    ) -> list[Document]:
+        rows, _ = self._search(embedding, fetch_k, filter)
+        if len(rows) == 0:
+            return []
+        selected = maximal_marginal_relevance(
+            np.asarray(embedding, dtype=np.float32),
+            np.asarray(self._vectors[rows]),
+            lambda_mult=lambda_mult,
+            k=k,
+        )
+        return [self._document(rows[index]) for index in selected]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter: dict | None = None,
+        **kwargs,
+    ) -> list[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding.embed_query(query), k, fetch_k, lambda_mult, filter
+        )
+
+    def get_vectors_by_ids(self, ids) -> dict[str, list[float]]:
+        """Stored (normalized) vectors of the given ids, unknown ids are skipped"""
+        with self._lock:
+            return {
+                i: self._vectors[self._rows[i]].tolist() for i in ids if i in self._rows
+            }
+
+    def get_by_ids(self, ids) -> list[Document]:
+        with self._lock:
+            return [self._document(self._rows[i]) for i in ids if i in self._rows]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        path: str | None = None,
+        quantization: str | None = None,
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        vector_store = cls(embedding, path=path, quantization=quantization)
+        vector_store.add_texts(texts, metadatas, ids=ids)
+        return vector_store
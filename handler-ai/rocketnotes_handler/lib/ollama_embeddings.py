@@ -0,0 +1,107 @@
+import os
+import threading
+
+import httpx
+from langchain.embeddings.base import Embeddings
+
+from .embedding import iter_token_batches
+
+ollama_base_url = os.environ.get("OLLAMA_BASE_URL", "http://ollama:11434")
+# Texts and estimated tokens sent per /api/embed request
+ollama_embed_batch_size = int(os.environ.get("OLLAMA_EMBED_BATCH_SIZE", 64))
+ollama_embed_batch_max_tokens = int(
+    os.environ.get("OLLAMA_EMBED_BATCH_MAX_TOKENS", 32000)
+)
+# How long Ollama keeps the model loaded after a request, e.g. "30m" or "-1"
+ollama_keep_alive = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+ollama_timeout_seconds = float(os.environ.get("OLLAMA_TIMEOUT_SECONDS", 120))
+
+_ollama_http_client = None
+_ollama_http_client_lock = threading.Lock()
+
+
+def get_ollama_http_client() -> httpx.Client:
+    """Keep-alive connection pool shared by all Ollama embeddings clients"""
+    global _ollama_http_client
+    with _ollama_http_client_lock:
+        if _ollama_http_client is None:
+            _ollama_http_client = httpx.Client(
+                timeout=ollama_timeout_seconds,
+                limits=httpx.Limits(
+                    max_connections=16,
+                    max_keepalive_connections=8,
+                    keepalive_expiry=300,
+                ),
+            )
+    return _ollama_http_client
+
+
+class OllamaBatchEmbeddings(Embeddings):
+    """
+    Ollama embeddings that send many texts per request to /api/embed.
+
+    Texts are chunked by count and estimated tokens, every chunk is one request
+    on a pooled keep-alive connection. keep_alive is sent with every request,
+    so the model stays loaded between the batches of a reindex. Texts get the
+    same passage/query prefixes as the langchain OllamaEmbeddings. Unlike
+    /api/embeddings, /api/embed returns L2 normalized vectors, which is why
+    the model is versioned in util.embeddings_model_versions.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        base_url: str = ollama_base_url,
+        batch_size: int = ollama_embed_batch_size,
+        batch_max_tokens: int = ollama_embed_batch_max_tokens,
+        keep_alive: str = ollama_keep_alive,
+        embed_instruction: str = "passage: ",
+        query_instruction: str = "query: ",
+        client: httpx.Client | None = None,
+    ):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = max(1, batch_size)
+        self.batch_max_tokens = batch_max_tokens
+        self.keep_alive = keep_alive
+        self.embed_instruction = embed_instruction
+        self.query_instruction = query_instruction
+        self.client = client if client is not None else get_ollama_http_client()
+
+    @property
+    def symmetric_queries(self) -> bool:
+        return self.embed_instruction == self.query_instruction
+
+    def _embed_batch(self, inputs: list[str]) -> list[list[float]]:
+        response = self.client.post(
+            f"{self.base_url}/api/embed",
+            json={
+                "model": self.model,
+                "input": inputs,
+                "keep_alive": self.keep_alive,
+                "truncate": True,
+            },
+        )
+        response.raise_for_status()
+        embeddings = response.json()["embeddings"]
+        if len(embeddings) != len(inputs):
+            raise ValueError(
+                f"Ollama returned {len(embeddings)} embeddings for {len(inputs)} texts"
+            )
+        return embeddings
+
+    def _embed(self, inputs: list[str]) -> list[list[float]]:
+        vectors = []
+        for batch in iter_token_batches(
+            inputs, max_tokens=self.batch_max_tokens, max_texts=self.batch_size
+        ):
+            vectors.extend(self._embed_batch([inputs[index] for index in batch]))
+        return vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return self._embed([f"{self.embed_instruction}{text}" for text in texts])
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed([f"{self.query_instruction}{text}"])[0]
@@ -0,0 +1,172 @@
+import multiprocessing
+import os
+import resource
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from langchain.embeddings.base import Embeddings
+
+# Worker processes used to embed recreateIndex jobs of local models, 0 embeds
+# in the handler process. Needs /dev/shm, which Lambda does not provide, so
+# this is meant for self-hosted nodes.
+reindex_pool_workers = int(os.environ.get("REINDEX_POOL_WORKERS", 0))
+# Texts embedded per task, every batch of a reindex is split into shards
+reindex_pool_shard_size = int(os.environ.get("REINDEX_POOL_SHARD_SIZE", 16))
+# Address space limit per worker, a worker exceeding it fails the shard with a
+# MemoryError instead of taking down the node. 0 disables the limit.
+reindex_pool_memory_limit_mb = int(os.environ.get("REINDEX_POOL_MEMORY_LIMIT_MB", 0))
+# Workers are replaced after this many shards to return fragmented memory,
+# 0 keeps them for the lifetime of the pool
+reindex_pool_max_tasks_per_worker = int(
+    os.environ.get("REINDEX_POOL_MAX_TASKS_PER_WORKER", 0)
+)
+
+# Models that run on this node and gain from more cores
+process_pool_models = ["Sentence-Transformers", "Ollama-nomic-embed-text"]
+
+# Embeddings model of a worker process, loaded once by the pool initializer
+_worker_embeddings: Embeddings | None = None
+
+
+def create_worker_embeddings(embeddingsModel: str) -> Embeddings:
+    from rocketnotes_handler.lib.model import UserConfig
+    from rocketnotes_handler.lib.util import create_embeddings_model
+
+    return create_embeddings_model(UserConfig(id="", embeddingsModel=embeddingsModel))
+
+
+def _init_worker(embeddingsModel: str, create, memory_limit_mb: int, threads: int):
+    global _worker_embeddings
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    _worker_embeddings = create(embeddingsModel)
+    try:
+        import torch
+
+        # Workers share the cores instead of each starting one thread per core
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _embed_shard(texts: list[str]) -> list[list[float]]:
+    return _worker_embeddings.embed_documents(texts)
+
+
+def _embed_query(text: str) -> list[float]:
+    return _worker_embeddings.embed_query(text)
+
+
+class ProcessPoolEmbeddings(Embeddings):
+    """
+    Embeds texts on a pool of worker processes that each hold the model once.
+
+    embed_documents splits its texts into shards that are embedded in parallel
+    and returns the vectors in the order of the texts. Calls from several
+    threads share the pool, so consecutive batches of a reindex keep all
+    workers busy. Workers are spawned on first use and kept until close.
+    """
+
+    def __init__(
+        self,
+        embeddingsModel: str,
+        max_workers: int = reindex_pool_workers,
+        shard_size: int = reindex_pool_shard_size,
+        memory_limit_mb: int = reindex_pool_memory_limit_mb,
+        max_tasks_per_worker: int = reindex_pool_max_tasks_per_worker,
+        create=create_worker_embeddings,
+    ):
+        self.embeddingsModel = embeddingsModel
+        self.max_workers = max(1, max_workers)
+        self.shard_size = max(1, shard_size)
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_worker = max_tasks_per_worker or None
+        self.create = create
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                threads = max(1, (os.cpu_count() or 1) // self.max_workers)
+                # Forked workers would inherit the parent's torch threads and
+                # locks, spawned ones load the model cleanly
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(
+                        self.embeddingsModel,
+                        self.create,
+                        self.memory_limit_mb,
+                        threads,
+                    ),
+                    max_tasks_per_child=self.max_tasks_per_worker,
+                )
+                print(
+                    f"Started {self.max_workers} embedding workers for "
+                    f"{self.embeddingsModel}"
+                )
+            return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        pool = self._get_pool()
+        futures = [
+            pool.submit(_embed_shard, texts[start : start + self.shard_size])
+            for start in range(0, len(texts), self.shard_size)
+        ]
+        vectors = []
+        try:
+            for future in futures:
+                vectors.extend(future.result())
+        except BrokenProcessPool:
+            # A worker died, e.g. killed by the OOM killer. The next call
+            # starts a new pool, this one fails and its message is retried.
+            print("Embedding worker died, restarting the pool")
+            self._reset_pool(pool)
+            raise
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        pool = self._get_pool()
+        try:
+            return pool.submit(_embed_query, text).result()
+        except BrokenProcessPool:
+            self._reset_pool(pool)
+            raise
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+_process_pool_embeddings: dict[str, ProcessPoolEmbeddings] = {}
+_process_pool_embeddings_lock = threading.Lock()
+
+
+def get_process_pool_embeddings(embeddingsModel: str) -> ProcessPoolEmbeddings | None:
+    """
+    Process-wide worker pool for an embeddings model.
+
+    None when the pool is disabled or the model is not run locally.
+    """
+    if reindex_pool_workers <= 0 or embeddingsModel not in process_pool_models:
+        return None
+    with _process_pool_embeddings_lock:
+        if embeddingsModel not in _process_pool_embeddings:
+            _process_pool_embeddings[embeddingsModel] = ProcessPoolEmbeddings(
+                embeddingsModel, max_workers=reindex_pool_workers
+            )
+        return _process_pool_embeddings[embeddingsModel]
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+
+# Quantized scans only pick candidates, which are re-scored with the full vectors
+quantization_rerank_factor = {
+    "int8": int(os.environ.get("INT8_RERANK_FACTOR", 4)),
+    "binary": int(os.environ.get("BINARY_RERANK_FACTOR", 40)),
+}
+
+# Set bits of every byte value, for numpy versions without bitwise_count
+_popcount_table = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _popcount_table[values]
+
+
+def quantize_int8(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Scalar quantization with one scale per vector.
+
+    Returns:
+        tuple: (int8 codes, float32 scale of every row)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """Sign bit of every dimension, packed into uint8 (32x smaller than float32)"""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+class QuantizedIndex:
+    """
+    Quantized copy of a vector matrix used to pre-select search candidates.
+
+    int8 codes approximate the dot product, binary codes rank by hamming
+    distance between sign bits.
+    """
+
+    def __init__(self, method: str):
+        if method not in quantization_rerank_factor:
+            raise ValueError(
+                f"Unknown vector quantization '{method}', use int8 or binary"
+            )
+        self.method = method
+        self.rerank_factor = quantization_rerank_factor[method]
+        self.codes = None
+        self.scales = None
+        # Binary codes take the sign relative to the mean vector, embeddings are
+        # rarely centered around zero
+        self.center = None
+
+    def build(self, vectors: np.ndarray):
+        if len(vectors) == 0:
+            self.codes = None
+            self.scales = None
+        elif self.method == "int8":
+            self.codes, self.scales = quantize_int8(vectors)
+        else:
+            self.center = np.asarray(vectors).mean(axis=0, dtype=np.float32)
+            self.codes = quantize_binary(np.asarray(vectors) - self.center)
+
+    @property
+    def nbytes(self) -> int:
+        if self.codes is None:
+            return 0
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate similarity of the query to every row, higher is closer"""
+        if self.codes is None:
+            return np.zeros(0, dtype=np.float32)
+        if self.method == "int8":
+            # Integer dot products with int32 accumulation, no float copy of codes
+            query_codes, query_scales = quantize_int8(query[None, :])
+            dots = np.einsum("ij,j->i", self.codes, query_codes[0], dtype=np.int32)
+            return dots * (self.scales * query_scales[0])
+        query_bits = quantize_binary((query - self.center)[None, :])[0]
+        distances = popcount(np.bitwise_xor(self.codes, query_bits)).sum(
+            axis=1, dtype=np.int32
+        )
+        return -distances.astype(np.float32)
@@ -0,0 +1,191 @@
+import importlib.util
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, TypeVar
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# sentence-transformers is optional, without it results keep their vector order.
+# It is only imported once a reranker loads, importing it pulls in torch.
+CROSS_ENCODER_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+
+# Reranking is enabled by setting a cross-encoder model, e.g.
+# cross-encoder/ms-marco-MiniLM-L-6-v2
+rerank_model = os.environ.get("RERANK_MODEL")
+# Candidates fetched from the vector store and scored by the cross-encoder
+rerank_top_n = int(os.environ.get("RERANK_TOP_N", 20))
+rerank_batch_size = int(os.environ.get("RERANK_BATCH_SIZE", 32))
+rerank_max_length = int(os.environ.get("RERANK_MAX_LENGTH", 512))
+# Reranking is skipped when its estimated duration exceeds the budget
+rerank_latency_budget_ms = float(os.environ.get("RERANK_LATENCY_BUDGET_MS", 500))
+# Time a Lambda keeps for everything after reranking
+rerank_safety_margin_ms = float(os.environ.get("RERANK_SAFETY_MARGIN_MS", 3000))
+
+T = TypeVar("T")
+
+
+def create_cross_encoder(model_name: str, max_length: int):
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, passage) pairs with a CPU cross-encoder.
+
+    The model is loaded on first use and kept for the lifetime of the process.
+    The cost per pair is tracked, so a rerank that would not fit the latency
+    budget is skipped instead of delaying the response.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = rerank_batch_size,
+        max_length: int = rerank_max_length,
+        latency_budget_ms: float = rerank_latency_budget_ms,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.latency_budget_ms = latency_budget_ms
+        self.model = None
+        # Exponential moving average of the scoring time per pair
+        self.ms_per_pair: float | None = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.model is None:
+                start = time.perf_counter()
+                self.model = create_cross_encoder(self.model_name, self.max_length)
+                print(
+                    f"Loaded cross-encoder {self.model_name} in "
+                    f"{(time.perf_counter() - start) * 1000:.0f} ms"
+                )
+        return self.model
+
+    def estimate_ms(self, pairs: int) -> float:
+        if self.ms_per_pair is None:
+            return 0.0
+        return self.ms_per_pair * pairs
+
+    def score(self, query: str, texts: list[str]) -> list[float]:
+        model = self.load()
+        start = time.perf_counter()
+        scores = model.predict(
+            [(query, text) for text in texts],
+            batch_size=self.batch_size,
+            show_progress_bar=False,
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        ms_per_pair = elapsed_ms / max(len(texts), 1)
+        self.ms_per_pair = (
+            ms_per_pair
+            if self.ms_per_pair is None
+            else 0.8 * self.ms_per_pair + 0.2 * ms_per_pair
+        )
+        print(f"Reranked {len(texts)} candidates in {elapsed_ms:.0f} ms")
+        return [float(score) for score in scores]
+
+    def rerank(
+        self,
+        query: str,
+        candidates: list[T],
+        text_of: Callable[[T], str],
+        budget_ms: float | None = None,
+    ) -> list[T]:
+        """
+        Order candidates by cross-encoder score.
+
+        Returns the candidates unchanged when the estimated duration exceeds
+        the budget or scoring fails.
+        """
+        if len(candidates) <= 1:
+            return candidates
+        budget_ms = (
+            self.latency_budget_ms
+            if budget_ms is None
+            else min(budget_ms, self.latency_budget_ms)
+        )
+        estimate_ms = self.estimate_ms(len(candidates))
+        if budget_ms <= 0 or estimate_ms > budget_ms:
+            print(
+                f"Skipping rerank, estimated {estimate_ms:.0f} ms exceeds "
+                f"budget of {budget_ms:.0f} ms"
+            )
+            return candidates
+        try:
+            scores = self.score(query, [text_of(candidate) for candidate in candidates])
+        except Exception as e:
+            print(f"Rerank failed, keeping vector order: {e}")
+            return candidates
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order]
+
+
+@lru_cache
+def get_reranker(model_name: str | None = None) -> CrossEncoderReranker | None:
+    """Process-wide reranker, None when reranking is disabled or unavailable"""
+    model_name = model_name or rerank_model
+    if not model_name:
+        return None
+    if not CROSS_ENCODER_AVAILABLE:
+        print("sentence-transformers is not installed, reranking is disabled")
+        return None
+    return CrossEncoderReranker(model_name)
+
+
+def remaining_budget_ms(context) -> float | None:
+    """Time left for reranking within a Lambda invocation, None outside Lambda"""
+    get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining_time is None:
+        return None
+    return get_remaining_time() - rerank_safety_margin_ms
+
+
+def rerank_candidates(
+    query: str,
+    candidates: list[T],
+    text_of: Callable[[T], str] = lambda document: document.page_content,
+    top_n: int = rerank_top_n,
+    budget_ms: float | None = None,
+) -> list[T]:
+    """
+    Rerank the first top_n candidates, the remaining ones keep their order.
+
+    Candidates are returned unchanged when reranking is disabled.
+    """
+    reranker = get_reranker()
+    if reranker is None:
+        return candidates
+    return (
+        reranker.rerank(query, candidates[:top_n], text_of, budget_ms)
+        + candidates[top_n:]
+    )
+
+
+def fetch_k_for_rerank(k: int) -> int:
+    """Number of vector results to fetch so the reranker has candidates to pick"""
+    return max(k, rerank_top_n) if get_reranker() is not None else k
+
+
+class RerankingRetriever(BaseRetriever):
+    """Retriever that over-fetches from a vector store and keeps the k best reranked"""
+
+    vector_store: object
+    k: int = 3
+    budget_ms: float | None = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        documents = self.vector_store.similarity_search(
+            query, k=fetch_k_for_rerank(self.k)
+        )
+        return rerank_candidates(query, documents, budget_ms=self.budget_ms)[: self.k]
@@ -0,0 +1,188 @@
+import base64
+import json
+import os
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain_core.documents import Document
+from langchain_core.vectorstores.utils import maximal_marginal_relevance
+
+from .bm25 import BM25Index, fuse_bm25_results
+from .rerank import fetch_k_for_rerank, rerank_candidates
+from .vector_store_factory import get_stored_vectors
+
+# Chunks fetched per requested document, several chunks often share a document
+chunks_per_document = int(os.environ.get("SEARCH_CHUNKS_PER_DOCUMENT", 4))
+search_max_k = int(os.environ.get("SEARCH_MAX_K", 50))
+search_max_fetch_k = int(os.environ.get("SEARCH_MAX_FETCH_K", 200))
+
+
+def strip_title(page_content: str, title: str) -> str:
+    """Original section content, page_content format is "{title}\n{content}\""""
+    if page_content.startswith(f"{title}\n"):
+        return page_content[len(title) + 1 :]
+    return page_content
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+
+class SearchResult:
+    """Best matching sections of one document"""
+
+    def __init__(self, documentId: str, title: str):
+        self.documentId: str = documentId
+        self.title: str = title
+        # (content, score) of every matching section, best first. The score is
+        # None for sections that were only found by the BM25 index.
+        self.chunks: list[tuple[str, float | None]] = []
+
+    @property
+    def score(self) -> float | None:
+        return self.chunks[0][1]
+
+    def to_dict(self) -> dict:
+        return {
+            "documentId": self.documentId,
+            "title": self.title,
+            "content": self.chunks[0][0],
+            "score": self.score,
+            "chunks": [
+                {"content": content, "score": score} for content, score in self.chunks
+            ],
+        }
+
+
+def relevance_scores(vector_store, results: list[tuple[Document, float]]):
+    """
+    Map raw scores of similarity_search_with_score to [0, 1], higher is better.
+
+    Stores return distances or similarities depending on their metric, this is
+    the same conversion similarity_search_with_relevance_scores applies.
+    """
+    try:
+        relevance = vector_store._select_relevance_score_fn()
+    except NotImplementedError:
+        return results
+    return [(document, relevance(score)) for document, score in results]
+
+
+def mmr_order(
+    embeddings: Embeddings,
+    query: str,
+    candidates: list[tuple[Document, float | None]],
+    lambda_mult: float,
+    vector_store=None,
+) -> list[tuple[Document, float | None]]:
+    """
+    Order candidates by maximal marginal relevance to diversify results.
+
+    Candidate vectors are read from the vector store, only sections it does not
+    return (e.g. BM25 matches without an id) are embedded.
+    """
+    if len(candidates) <= 1:
+        return candidates
+    stored = {}
+    if vector_store is not None:
+        ids = list(
+            dict.fromkeys(document.id for document, _ in candidates if document.id)
+        )
+        try:
+            stored = get_stored_vectors(vector_store, ids)
+        except Exception as e:
+            print(f"Could not read stored vectors, embedding candidates: {e}")
+    missing = [
+        document.page_content for document, _ in candidates if document.id not in stored
+    ]
+    embedded = iter(embeddings.embed_documents(missing) if missing else [])
+    candidate_embeddings = np.asarray(
+        [
+            stored[document.id] if document.id in stored else next(embedded)
+            for document, _ in candidates
+        ],
+        dtype=np.float32,
+    )
+    order = maximal_marginal_relevance(
+        np.asarray(embeddings.embed_query(query), dtype=np.float32),
+        candidate_embeddings,
+        lambda_mult=lambda_mult,
+        k=len(candidates),
+    )
+    return [candidates[index] for index in order]
+
+
+def group_by_document(
+    candidates: list[tuple[Document, float | None]],
+) -> list[SearchResult]:
+    """Group sections per documentId, documents keep the rank of their best section"""
+    results: dict[str, SearchResult] = {}
+    for document, score in candidates:
+        documentId = document.metadata["documentId"]
+        title = document.metadata["title"]
+        result = results.setdefault(documentId, SearchResult(documentId, title))
+        result.chunks.append((strip_title(document.page_content, title), score))
+    return list(results.values())
+
+
+def search_documents(
+    vector_store,
+    embeddings: Embeddings,
+    query: str,
+    k: int = 3,
+    offset: int = 0,
+    min_score: float | None = None,
+    mmr: bool = False,
+    lambda_mult: float = 0.5,
+    bm25_index: BM25Index | None = None,
+    budget_ms: float | None = None,
+) -> tuple[list[SearchResult], bool]:
+    """
+    Search the sections of a user's documents and group them per document.
+
+    Enough sections are fetched to fill offset + k documents. Sections below
+    min_score are dropped, lexical matches of the BM25 index are fused in, the
+    best candidates are reranked by the cross-encoder if one is configured and
+    the candidates are optionally diversified with MMR before grouping.
+
+    min_score applies to the relevance of vector matches only. Sections found
+    by the BM25 index alone contain the query terms but have no relevance
+    score, they are kept with a score of None.
+
+    Returns:
+        tuple: (the documents of the requested page, whether more documents follow)
+    """
+    fetch_k = min((offset + k + 1) * chunks_per_document, search_max_fetch_k)
+    fetch_k = max(fetch_k, fetch_k_for_rerank(k))
+    candidates = relevance_scores(
+        vector_store, vector_store.similarity_search_with_score(query, k=fetch_k)
+    )
+    if min_score is not None:
+        candidates = [
+            (document, score) for document, score in candidates if score >= min_score
+        ]
+    if bm25_index is not None and len(bm25_index) > 0:
+        candidates = fuse_bm25_results(candidates, bm25_index, query, fetch_k)
+    candidates = rerank_candidates(
+        query,
+        candidates,
+        text_of=lambda candidate: candidate[0].page_content,
+        budget_ms=budget_ms,
+    )
+    if mmr:
+        candidates = mmr_order(
+            embeddings, query, candidates, lambda_mult, vector_store
+        )
+
+    results = group_by_document(candidates)
+    return results[offset : offset + k], len(results) > offset + k
@@ -1,16 +1,102 @@
+import hashlib
 import os
+import threading
 
+import httpx
 from langchain.embeddings.base import Embeddings
 from langchain_anthropic import ChatAnthropic
-from langchain_community.embeddings import (HuggingFaceEmbeddings,
-                                            OllamaEmbeddings, VoyageEmbeddings)
+from langchain_community.embeddings import VoyageEmbeddings
 from langchain_together import TogetherEmbeddings
 from langchain_community.llms import Ollama
 from langchain_core.language_models import BaseChatModel
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_together import ChatTogether
+from openai import DefaultHttpxClient
 
+from rocketnotes_handler.lib.cache import TTLCache
+from rocketnotes_handler.lib.embedding_cache import (CachedEmbeddings,
+                                                     LRUCache,
+                                                     get_embedding_store)
+from rocketnotes_handler.lib.local_embeddings import (
+    get_sentence_transformers_embeddings, sentence_transformers_variant)
+from rocketnotes_handler.lib.manifest import get_indexed_embeddings_model
 from rocketnotes_handler.lib.model import UserConfig
+from rocketnotes_handler.lib.ollama_embeddings import (OllamaBatchEmbeddings,
+                                                       ollama_base_url)
+
+userConfig_table_name = "tnn-UserConfig"
+
+# UserConfigs hold API keys, so they are only ever cached in process memory.
+# Settings saved by the CRUD handlers are picked up after the TTL at the latest,
+# searches pick up a changed embeddings model once the index was recreated with
+# it (load_search_user_config).
+user_config_cache = TTLCache(
+    max_entries=int(os.environ.get("USER_CONFIG_CACHE_MAX_ENTRIES", 256)),
+    ttl_seconds=float(os.environ.get("USER_CONFIG_CACHE_TTL_SECONDS", 60)),
+)
+
+
+def load_user_config(dynamodb, userId: str) -> UserConfig | None:
+    """UserConfig of a user from the cache or DynamoDB, None if the user is unknown"""
+    user_config = user_config_cache.get(userId)
+    if user_config is not None:
+        return user_config
+
+    user_config_search_result = dynamodb.get_item(
+        TableName=userConfig_table_name,
+        Key={"id": {"S": userId}},
+    )
+    if "Item" not in user_config_search_result:
+        return None
+
+    user_config = get_user_config(user_config_search_result)
+    user_config_cache.set(userId, user_config)
+    return user_config
+
+
+def invalidate_user_config(userId: str | None = None):
+    """
+    Drop the cached UserConfig of a user, or of all users.
+
+    Only the cache of this process is cleared, other Lambda instances keep
+    their copy until USER_CONFIG_CACHE_TTL_SECONDS have passed.
+    """
+    if userId is None:
+        user_config_cache.clear()
+    else:
+        user_config_cache.delete(userId)
+
+
+def load_search_user_config(dynamodb, userId: str) -> UserConfig | None:
+    """
+    UserConfig of a user for searching their index.
+
+    A cached UserConfig can name the embeddings model used before the index
+    was recreated with another one. It is loaded again when it does not match
+    the model the index was built with, so queries are embedded like the index.
+    """
+    user_config = load_user_config(dynamodb, userId)
+    if user_config is None or user_config.embeddingsModel is None:
+        return user_config
+    try:
+        indexed_model = get_indexed_embeddings_model(dynamodb, userId)
+    except Exception as e:
+        print(f"Embeddings model of the index of {userId} not available: {e}")
+        return user_config
+    if indexed_model is not None and indexed_model != versioned_embeddings_model(
+        user_config.embeddingsModel
+    ):
+        invalidate_user_config(userId)
+        user_config = load_user_config(dynamodb, userId)
+    return user_config
+
+
+def user_config_cache_stats() -> dict:
+    return {
+        "hits": user_config_cache.hits,
+        "misses": user_config_cache.misses,
+        "entries": len(user_config_cache),
+    }
 
 
 def get_user_config(user_config) -> UserConfig:
@@ -34,79 +120,190 @@ def get_user_config(user_config) -> UserConfig:
         togetherApiKey=user_config["Item"]
         .get("togetherApiKey", {})
         .get("S", None),
+        vectorQuantization=user_config["Item"]
+        .get("vectorQuantization", {})
+        .get("S", None)
+        or None,
     )
 
+# Bumped when the vectors of a model change. Ollama's /api/embed returns L2
+# normalized vectors, the /api/embeddings endpoint used before did not. Cached
+# vectors of an older version are not reused and indexes built with them are
+# recreated by the embeddings worker.
+embeddings_model_versions = {"Ollama-nomic-embed-text": 2}
+
+
+def versioned_embeddings_model(embeddingsModel: str) -> str:
+    """Model name including the version of its vectors, if it has one"""
+    if embeddingsModel == "Sentence-Transformers":
+        # The local model is versioned by its backend and quantization
+        variant = sentence_transformers_variant()
+        return embeddingsModel if variant is None else f"{embeddingsModel}@{variant}"
+    version = embeddings_model_versions.get(embeddingsModel)
+    return embeddingsModel if version is None else f"{embeddingsModel}@v{version}"
+
+
 def get_embeddings_model(user_config: UserConfig) -> Embeddings:
-    if user_config.embeddingsModel == "text-embedding-ada-002" or user_config.embeddingsModel == "text-embedding-3-small":
-        if user_config.openAiApiKey:
-            os.environ["OPENAI_API_KEY"] = user_config.openAiApiKey
-        else:
-            raise ValueError(
-                f"OpenAI API key is missing for model {user_config.embeddingsModel}"
-            )
-        return OpenAIEmbeddings(client=None, model=user_config.embeddingsModel)
-    elif user_config.embeddingsModel in ["voyage-2", "voyage-3"]:
-        if user_config.voyageApiKey:
-            os.environ["VOYAGE_API_KEY"] = user_config.voyageApiKey
-        else:
-            raise ValueError(
-                f"Voyage API key is missing for model {user_config.embeddingsModel}"
+    """Embeddings model of the user, backed by the shared embedding cache"""
+    return CachedEmbeddings(
+        create_embeddings_model(user_config),
+        model=versioned_embeddings_model(user_config.embeddingsModel),
+        store=get_embedding_store(),
+    )
+
+
+# Model clients are reused across warm invocations. They are keyed by a
+# fingerprint of the API key, so users with their own keys never share a client
+# and rotated keys get a new one.
+model_client_cache = LRUCache(int(os.environ.get("MODEL_CLIENT_CACHE_MAX_ENTRIES", 32)))
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """Keep-alive connection pool shared by all OpenAI compatible clients"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=20,
+                    keepalive_expiry=300,
+                )
             )
-        return VoyageEmbeddings(model=user_config.embeddingsModel, batch_size=1)
-    elif user_config.embeddingsModel == "Sentence-Transformers":
-        return HuggingFaceEmbeddings(model_kwargs={"device": "cpu"})
-    elif user_config.embeddingsModel == "Ollama-nomic-embed-text":
-        return OllamaEmbeddings(
-            base_url="http://ollama:11434",
-            model=user_config.embeddingsModel.split("Ollama-")[1],
+    return _http_client
+
+
+def key_fingerprint(api_key: str | None) -> str:
+    if not api_key:
+        return ""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def get_model_client(provider: str, model: str, api_key: str | None, create):
+    """Client for (provider, model, API key) from the registry, created on a miss"""
+    key = (provider, model, key_fingerprint(api_key))
+    client = model_client_cache.get(key)
+    if client is None:
+        client = create()
+        model_client_cache.set(key, client)
+    return client
+
+
+def create_embeddings_model(user_config: UserConfig) -> Embeddings:
+    model = user_config.embeddingsModel
+    if model == "text-embedding-ada-002" or model == "text-embedding-3-small":
+        if not user_config.openAiApiKey:
+            raise ValueError(f"OpenAI API key is missing for model {model}")
+        return get_model_client(
+            "openai",
+            model,
+            user_config.openAiApiKey,
+            lambda: OpenAIEmbeddings(
+                model=model,
+                api_key=user_config.openAiApiKey,
+                http_client=get_http_client(),
+            ),
+        )
+    elif model in ["voyage-2", "voyage-3"]:
+        if not user_config.voyageApiKey:
+            raise ValueError(f"Voyage API key is missing for model {model}")
+        return get_model_client(
+            "voyage",
+            model,
+            user_config.voyageApiKey,
+            lambda: VoyageEmbeddings(
+                model=model, voyage_api_key=user_config.voyageApiKey, batch_size=1
+            ),
+        )
+    elif model == "Sentence-Transformers":
+        # Local weights are loaded once per process and never evicted
+        return get_sentence_transformers_embeddings()
+    elif model == "Ollama-nomic-embed-text":
+        return get_model_client(
+            "ollama",
+            model,
+            None,
+            lambda: OllamaBatchEmbeddings(model=model.split("Ollama-")[1]),
+        )
+    elif model == "together-m2-bert-80M":
+        if not user_config.togetherApiKey:
+            raise ValueError(f"Together AI API key is missing for model {model}")
+        return get_model_client(
+            "together",
+            model,
+            user_config.togetherApiKey,
+            lambda: TogetherEmbeddings(
+                model=model,
+                api_key=user_config.togetherApiKey,
+                http_client=get_http_client(),
+            ),
         )
-    elif user_config.embeddingsModel == "together-m2-bert-80M":
-        if user_config.togetherApiKey:
-            os.environ["TOGETHER_API_KEY"] = user_config.togetherApiKey
-        else:
-            raise ValueError(
-                f"Together AI API key is missing for model {user_config.embeddingsModel}"
-            )
-        return TogetherEmbeddings(model=user_config.embeddingsModel)
     else:
-        raise ValueError(f"Embeddings model '{user_config.embeddingsModel}' not found")
+        raise ValueError(f"Embeddings model '{model}' not found")
 
 
 def get_chat_model(userConfig: UserConfig) -> BaseChatModel:
     if userConfig.llm is None:
         raise ValueError("LLM is missing")
-    if userConfig.llm.startswith("gpt-"):
-        if userConfig.openAiApiKey:
-            os.environ["OPENAI_API_KEY"] = userConfig.openAiApiKey
-        else:
+    llm = userConfig.llm
+    if llm.startswith("gpt-"):
+        if not userConfig.openAiApiKey:
             raise ValueError("OpenAI API key is missing")
-        return ChatOpenAI(
-            temperature=0.9, max_completion_tokens=2048, model=userConfig.llm
+        return get_model_client(
+            "openai",
+            llm,
+            userConfig.openAiApiKey,
+            lambda: ChatOpenAI(
+                temperature=0.9,
+                max_completion_tokens=2048,
+                model=llm,
+                api_key=userConfig.openAiApiKey,
+                http_client=get_http_client(),
+            ),
         )
-    elif userConfig.llm.startswith("claude-"):
-        if userConfig.anthropicApiKey:
-            os.environ["ANTHROPIC_API_KEY"] = userConfig.anthropicApiKey
-        else:
+    elif llm.startswith("claude-"):
+        if not userConfig.anthropicApiKey:
             raise ValueError("Anthropic API key is missing")
-        return ChatAnthropic(
-            temperature=0.9,
-            max_tokens_to_sample=2048,
-            model_name=userConfig.llm,
-            timeout=60,
-            stop=None,
+        # The Anthropic SDK client of a reused model keeps its connections alive
+        return get_model_client(
+            "anthropic",
+            llm,
+            userConfig.anthropicApiKey,
+            lambda: ChatAnthropic(
+                temperature=0.9,
+                max_tokens_to_sample=2048,
+                model_name=llm,
+                timeout=60,
+                stop=None,
+                api_key=userConfig.anthropicApiKey,
+            ),
         )
-    elif userConfig.llm.startswith("together-"):
-        if userConfig.togetherApiKey:
-            os.environ["TOGETHER_API_KEY"] = userConfig.togetherApiKey
-        else:
+    elif llm.startswith("together-"):
+        if not userConfig.togetherApiKey:
             raise ValueError("Together API key is missing")
-        return ChatTogether(
-            temperature=0.9, max_tokens=2048, model=userConfig.llm.split("together-")[1]
+        return get_model_client(
+            "together",
+            llm,
+            userConfig.togetherApiKey,
+            lambda: ChatTogether(
+                temperature=0.9,
+                max_tokens=2048,
+                model=llm.split("together-")[1],
+                api_key=userConfig.togetherApiKey,
+                http_client=get_http_client(),
+            ),
         )
-    elif userConfig.llm.startswith("Ollama"):
-        return Ollama(
-            base_url="http://ollama:11434",
-            model=userConfig.llm.split("Ollama-")[1],
+    elif llm.startswith("Ollama"):
+        return get_model_client(
+            "ollama",
+            llm,
+            None,
+            lambda: Ollama(
+                base_url=ollama_base_url,
+                model=llm.split("Ollama-")[1],
+            ),
         )
     else:
         raise ValueError(
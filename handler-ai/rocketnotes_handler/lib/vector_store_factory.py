@@ -1,4 +1,7 @@
 import os
+import threading
+
+import boto3
 
 # Import chromadb and langchain_chroma only for local development
 try:
@@ -23,42 +26,166 @@ except ImportError as e:
 
 from langchain_aws.vectorstores.s3_vectors import AmazonS3Vectors
 
+from .cache import TTLCache
+from .hnsw_vector_store import HNSWLIB_AVAILABLE, HnswVectorStore
+from .numpy_vector_store import NumpyVectorStore
+
 is_local = os.environ.get("LOCAL", False)
 
 vector_bucket_name = os.environ.get("VECTOR_BUCKET_NAME", "rocketnotes-vectors")
 
+# "chroma", "s3", "numpy" or "hnsw", defaults to Chroma locally and S3 Vectors in prod
+vector_store_backend = os.environ.get("VECTOR_STORE_BACKEND")
+# Directory of the per-user index files of the numpy and hnsw backends
+vector_store_path = os.environ.get("VECTOR_STORE_PATH", "/tmp/rocketnotes-vectors")
+
+# Maximum number of vectors in a single S3 Vectors PutVectors request
+s3_vectors_put_batch_size = 500
+# Maximum number of keys in a single S3 Vectors GetVectors request
+s3_vectors_get_batch_size = 100
+
+
+# Warm invocations reuse vector stores, keyed by
+# (userId, embeddingsModel, backend, quantization)
+vector_store_cache = TTLCache(
+    max_entries=int(os.environ.get("VECTOR_STORE_CACHE_MAX_ENTRIES", 32)),
+    ttl_seconds=float(os.environ.get("VECTOR_STORE_CACHE_TTL_SECONDS", 900)),
+)
+
+chroma_hosts = [
+    "host.docker.internal",
+    "chroma",
+    "rocketnotes-chroma",
+    "localhost",
+]
+
+_clients_lock = threading.Lock()
+_chroma_client = None
+_chroma_host = None
+_s3_vectors_client = None
+
+
+def get_vector_store_backend():
+    if vector_store_backend:
+        return vector_store_backend
+    return "chroma" if is_local and CHROMADB_AVAILABLE else "s3"
+
+
+def get_vector_store_factory(userId, embeddings, context="", quantization=None):
+    """
+    Factory function to create appropriate vector store based on environment.
 
-def get_vector_store_factory(userId, embeddings, context=""):
-    """Factory function to create appropriate vector store based on environment"""
+    Vector stores are cached per process. A cached store is handed the given
+    embeddings, so queries always use the caller's current credentials, and
+    file-backed stores are reloaded when their files changed.
+    quantization ("int8" or "binary") applies to the numpy and hnsw backends.
+    """
     context_msg = f" for {context}" if context else ""
-    if is_local and CHROMADB_AVAILABLE:
+    backend = get_vector_store_backend()
+    if backend not in ("numpy", "hnsw"):
+        quantization = None
+    cache_key = (userId, getattr(embeddings, "model", None), backend, quantization)
+
+    vector_store = vector_store_cache.get(cache_key)
+    if vector_store is not None:
+        print(f"Using cached {backend} vector store{context_msg}")
+        set_vector_store_embeddings(vector_store, embeddings)
+        # The embeddings worker writes file-backed stores from another process
+        if isinstance(vector_store, NumpyVectorStore):
+            vector_store.reload_if_changed()
+        return vector_store
+
+    if backend == "chroma":
         print(f"Using Chroma vector store for local development{context_msg}")
-        return get_chroma_vector_store(userId, embeddings, context)
+        vector_store = get_chroma_vector_store(userId, embeddings, context)
+    elif backend == "numpy":
+        print(f"Using in-process numpy vector store{context_msg}")
+        vector_store = get_numpy_vector_store(userId, embeddings, quantization)
+    elif backend == "hnsw":
+        print(f"Using in-process HNSW vector store{context_msg}")
+        vector_store = get_hnsw_vector_store(userId, embeddings, quantization)
     else:
         print(f"Using S3 vector store{context_msg}")
-        return get_s3_vector_store(userId, embeddings)
+        vector_store = get_s3_vector_store(userId, embeddings)
+    vector_store_cache.set(cache_key, vector_store)
+    return vector_store
 
 
-def get_chroma_vector_store(userId, embeddings, context=""):
-    """Get or create a Chroma vector store for local development"""
-    try:
-        collection_name = f"user_{userId}"
-        context_msg = f" for {context}" if context else ""
-        print(f"Connecting to Chroma collection{context_msg}: {collection_name}")
+def invalidate_vector_stores(userId=None):
+    """Drop cached vector stores of a user, or all of them"""
+    if userId is None:
+        vector_store_cache.clear()
+    else:
+        vector_store_cache.delete_where(lambda key: key[0] == userId)
 
-        # Create ChromaDB client with telemetry disabled (official way)
-        # Try different host configurations for Docker networking
-        chroma_hosts = [
-            "host.docker.internal",
-            "chroma",
-            "rocketnotes-chroma",
-            "localhost",
-        ]
-        chroma_client = None
 
-        for host in chroma_hosts:
+def flush_vector_store(vector_store):
+    """Persist pending writes of file-backed stores, a no-op for other backends"""
+    if isinstance(vector_store, NumpyVectorStore):
+        vector_store.flush()
+
+
+def get_stored_vectors(vector_store, ids: list[str]) -> dict[str, list[float]]:
+    """
+    Stored vectors of sections by vector id, so they are not embedded again.
+
+    Ids the backend does not know, or backends that cannot return vectors,
+    are missing from the result.
+    """
+    if not ids:
+        return {}
+    if isinstance(vector_store, NumpyVectorStore):
+        return vector_store.get_vectors_by_ids(ids)
+    if isinstance(vector_store, AmazonS3Vectors):
+        vectors = {}
+        for i in range(0, len(ids), s3_vectors_get_batch_size):
+            response = vector_store.client.get_vectors(
+                vectorBucketName=vector_store.vector_bucket_name,
+                indexName=vector_store.index_name,
+                keys=ids[i : i + s3_vectors_get_batch_size],
+                returnData=True,
+                returnMetadata=False,
+            )
+            for vector in response["vectors"]:
+                vectors[vector["key"]] = vector["data"][vector_store.data_type]
+        return vectors
+    if CHROMADB_AVAILABLE and isinstance(vector_store, Chroma):
+        result = vector_store.get(ids=ids, include=["embeddings"])
+        return {
+            vector_id: list(vector)
+            for vector_id, vector in zip(result["ids"], result["embeddings"])
+        }
+    return {}
+
+
+def set_vector_store_embeddings(vector_store, embeddings):
+    if CHROMADB_AVAILABLE and isinstance(vector_store, Chroma):
+        vector_store._embedding_function = embeddings
+    elif isinstance(vector_store, NumpyVectorStore):
+        vector_store._embedding = embeddings
+    elif isinstance(vector_store, AmazonS3Vectors):
+        vector_store._embedding = embeddings
+
+
+def get_chroma_client(context=""):
+    """
+    Connect to the local Chroma server once per process.
+
+    The host that responded is remembered and tried first on reconnects.
+    """
+    global _chroma_client, _chroma_host
+    context_msg = f" for {context}" if context else ""
+    with _clients_lock:
+        if _chroma_client is not None:
+            return _chroma_client
+
+        # Try different host configurations for Docker networking
+        hosts = [_chroma_host] if _chroma_host else []
+        hosts += [host for host in chroma_hosts if host != _chroma_host]
+        for host in hosts:
             try:
                 print(f"Attempting to connect to Chroma at {host}:8000{context_msg}")
+                # Create ChromaDB client with telemetry disabled (official way)
                 chroma_client = chromadb.HttpClient(
                     host=host, port=8000, settings=Settings(anonymized_telemetry=False)
                 )
@@ -66,21 +193,54 @@ def get_chroma_vector_store(userId, embeddings, context=""):
                 heartbeat = chroma_client.heartbeat()
                 print(f"Heartbeat successful{context_msg}: {heartbeat}")
                 print(f"Successfully connected to Chroma at {host}:8000{context_msg}")
-                break
+                _chroma_client = chroma_client
+                _chroma_host = host
+                return _chroma_client
             except Exception as e:
                 print(f"Failed to connect to Chroma at {host}:8000{context_msg}: {e}")
                 continue
 
-        if chroma_client is None:
-            raise Exception(
-                f"Could not connect to Chroma server on any host{context_msg}"
-            )
+        raise Exception(f"Could not connect to Chroma server on any host{context_msg}")
 
-        vector_store = Chroma(
-            collection_name=collection_name,
-            embedding_function=embeddings,
-            client=chroma_client,
-        )
+
+def reset_chroma_client():
+    """Forget the Chroma connection after it failed, keeping the known host"""
+    global _chroma_client
+    with _clients_lock:
+        _chroma_client = None
+    invalidate_vector_stores()
+
+
+def get_s3_vectors_client():
+    """Shared S3 Vectors client, boto3 clients are thread-safe"""
+    global _s3_vectors_client
+    with _clients_lock:
+        if _s3_vectors_client is None:
+            _s3_vectors_client = boto3.client("s3vectors")
+        return _s3_vectors_client
+
+
+def get_chroma_vector_store(userId, embeddings, context=""):
+    """Get or create a Chroma vector store for local development"""
+    try:
+        collection_name = f"user_{userId}"
+        context_msg = f" for {context}" if context else ""
+        print(f"Connecting to Chroma collection{context_msg}: {collection_name}")
+
+        try:
+            vector_store = Chroma(
+                collection_name=collection_name,
+                embedding_function=embeddings,
+                client=get_chroma_client(context),
+            )
+        except Exception:
+            # The cached client may point to a server that went away
+            reset_chroma_client()
+            vector_store = Chroma(
+                collection_name=collection_name,
+                embedding_function=embeddings,
+                client=get_chroma_client(context),
+            )
 
         print(
             f"Successfully created Chroma vector store{context_msg} for user: {userId}"
@@ -102,69 +262,202 @@ def get_s3_vector_store(userId, embeddings):
             "AMAZON_BEDROCK_TEXT",
             "AMAZON_BEDROCK_METADATA",
         ],
+        client=get_s3_vectors_client(),
     )
 
 
-def create_vector_store_from_documents(split_documents, userId, embeddings):
-    """Create vector store with documents (handles both S3 and Chroma)"""
-    if is_local and CHROMADB_AVAILABLE:
-        print(f"Creating Chroma vector store with {len(split_documents)} documents")
-        collection_name = f"user_{userId}"
+def get_numpy_vector_store(userId, embeddings, quantization=None):
+    """
+    Open the persisted numpy vector store of the user.
 
-        # Create ChromaDB client with telemetry disabled (official way)
-        chroma_client = chromadb.HttpClient(
-            host="host.docker.internal",
-            port=8000,
-            settings=Settings(anonymized_telemetry=False),
-        )
+    Writes are kept in memory until flush_vector_store is called.
+    """
+    return NumpyVectorStore(
+        embeddings,
+        path=os.path.join(vector_store_path, userId),
+        quantization=quantization,
+        auto_flush=False,
+    )
 
-        # For Chroma, we can use from_documents to create and populate
-        vector_store = Chroma.from_documents(
-            documents=split_documents,
-            embedding=embeddings,
-            collection_name=collection_name,
-            client=chroma_client,
-        )
-        print(f"Successfully created Chroma vector store")
-        return vector_store
+
+def get_hnsw_vector_store(userId, embeddings, quantization=None):
+    """Open the persisted HNSW vector store of the user, exact numpy without hnswlib"""
+    if not HNSWLIB_AVAILABLE:
+        print("hnswlib not available, falling back to the numpy vector store")
+        return get_numpy_vector_store(userId, embeddings, quantization)
+    return HnswVectorStore(
+        embeddings,
+        path=os.path.join(vector_store_path, userId),
+        quantization=quantization,
+        auto_flush=False,
+    )
+
+
+def delete_document_vectors(documentId, vector_store, vector_ids=None):
+    """
+    Delete document vectors from vector store by document ID.
+
+    When the vector ids of the document are known from its chunk manifest they are
+    deleted by key, otherwise they are looked up by their documentId metadata.
+    Errors are raised, so the message is retried and the manifest is kept.
+    """
+    print(f"Attempting to delete vectors for document: {documentId}")
+
+    if vector_ids is not None:
+        vector_ids = list(vector_ids)
+        if vector_ids:
+            vector_store.delete(ids=vector_ids)
+        print(f"Successfully deleted {len(vector_ids)} vectors for document {documentId}")
+    elif isinstance(vector_store, NumpyVectorStore):
+        vector_ids = vector_store.get_ids_by_metadata({"documentId": documentId})
+        vector_store.delete(ids=vector_ids)
+        print(f"Successfully deleted {len(vector_ids)} vectors for document {documentId}")
+    elif CHROMADB_AVAILABLE and isinstance(vector_store, Chroma):
+        # For Chroma, we can use delete with metadata filter
+        vector_store.delete(where={"documentId": documentId})
+        print(f"Successfully deleted vectors for document {documentId} from Chroma")
+    elif isinstance(vector_store, AmazonS3Vectors):
+        # S3 Vectors can only delete by key, so scan the index for the document
+        delete_documents_vectors([documentId], vector_store)
     else:
-        print(f"Creating S3 vector store with {len(split_documents)} documents")
-        vector_store = AmazonS3Vectors.from_documents(
-            split_documents,
-            vector_bucket_name="rocketnotes-vectors",
-            index_name=userId,
-            embedding=embeddings,
-            non_filterable_metadata_keys=[
-                "_page_content",
-                "AMAZON_BEDROCK_TEXT",
-                "AMAZON_BEDROCK_METADATA",
-            ],
-        )
-        print(f"Successfully created S3 vector store")
-        return vector_store
+        print(f"Vector store doesn't support deletion by documentId, skipping deletion")
 
 
-def delete_document_vectors(documentId, vector_store):
-    """Delete document vectors from vector store by document ID"""
-    try:
-        print(f"Attempting to delete vectors for document: {documentId}")
-
-        if is_local and CHROMADB_AVAILABLE:
-            # For Chroma, we can use delete with metadata filter
-            vector_store.delete(where={"documentId": documentId})
-            print(f"Successfully deleted vectors for document {documentId} from Chroma")
-        else:
-            # For S3 Vectors, use the metadata filter if available
+def clear_vector_store(vector_store):
+    """
+    Delete every vector of a user's store.
+
+    Indexes fix their dimension with the first vector, so the vectors of a
+    previous embeddings model have to go before those of a new one are written.
+    """
+    if isinstance(vector_store, NumpyVectorStore):
+        vector_store.clear()
+    elif CHROMADB_AVAILABLE and isinstance(vector_store, Chroma):
+        vector_store.reset_collection()
+    elif isinstance(vector_store, AmazonS3Vectors):
+        # The index is created again with the dimension of the first upsert
+        try:
+            vector_store.client.delete_index(
+                vectorBucketName=vector_store.vector_bucket_name,
+                indexName=vector_store.index_name,
+            )
+        except vector_store.client.exceptions.NotFoundException:
+            pass
+    else:
+        print("Vector store doesn't support clearing, skipping")
+
+
+def list_vector_document_ids(vector_store) -> dict[str, str | None]:
+    """Vector id -> documentId of every vector in a user's store"""
+    if isinstance(vector_store, NumpyVectorStore):
+        with vector_store._lock:
+            return {
+                vector_id: metadata.get("documentId")
+                for vector_id, metadata in zip(
+                    vector_store._ids, vector_store._metadatas
+                )
+            }
+    if CHROMADB_AVAILABLE and isinstance(vector_store, Chroma):
+        result = vector_store.get(include=["metadatas"])
+        return {
+            vector_id: (metadata or {}).get("documentId")
+            for vector_id, metadata in zip(result["ids"], result["metadatas"])
+        }
+    if isinstance(vector_store, AmazonS3Vectors):
+        document_ids = {}
+        list_vectors_args = {
+            "vectorBucketName": vector_store.vector_bucket_name,
+            "indexName": vector_store.index_name,
+            "returnMetadata": True,
+        }
+        while True:
             try:
-                vector_store.delete_by_metadata_filter({"documentId": documentId})
-                print(f"Successfully deleted vectors for document {documentId} from S3")
-            except AttributeError:
-                print(
-                    f"S3 Vectors doesn't support delete_by_metadata_filter, skipping deletion"
+                response = vector_store.client.list_vectors(**list_vectors_args)
+            except vector_store.client.exceptions.NotFoundException:
+                return document_ids
+            for vector in response.get("vectors", []):
+                document_ids[vector["key"]] = vector.get("metadata", {}).get(
+                    "documentId"
                 )
-                # S3 Vectors might not support this method yet
-                pass
+            if not response.get("nextToken"):
+                return document_ids
+            list_vectors_args["nextToken"] = response["nextToken"]
+    return {}
 
-    except Exception as e:
-        print(f"Error deleting vectors for document {documentId}: {e}")
-        # Continue execution even if deletion fails
+
+def delete_documents_vectors(documentIds, vector_store):
+    """
+    Delete the vectors of several documents by their documentId metadata.
+
+    S3 vector indexes are scanned once for all documents and the matching keys
+    are deleted in bulk.
+    """
+    documentIds = set(documentIds)
+    if not documentIds:
+        return
+    if isinstance(vector_store, AmazonS3Vectors):
+        vector_ids = [
+            vector_id
+            for vector_id, documentId in list_vector_document_ids(vector_store).items()
+            if documentId in documentIds
+        ]
+        if vector_ids:
+            vector_store.delete(ids=vector_ids)
+        print(f"Deleted {len(vector_ids)} vectors of {len(documentIds)} documents from S3")
+    else:
+        for documentId in documentIds:
+            delete_document_vectors(documentId, vector_store)
+
+
+def add_embedded_documents(vector_store, documents, vectors, ids):
+    """
+    Upsert documents with precomputed embeddings in bulk.
+
+    Writes straight to the underlying Chroma collection or S3 vector index so the
+    vector store does not embed the documents a second time.
+    """
+    if not documents:
+        return ids
+
+    if CHROMADB_AVAILABLE and isinstance(vector_store, Chroma):
+        vector_store._collection.upsert(
+            ids=ids,
+            embeddings=vectors,
+            metadatas=[document.metadata for document in documents],
+            documents=[document.page_content for document in documents],
+        )
+    elif isinstance(vector_store, NumpyVectorStore):
+        vector_store.add_embeddings(
+            [document.page_content for document in documents],
+            vectors,
+            [document.metadata for document in documents],
+            ids,
+        )
+    elif isinstance(vector_store, AmazonS3Vectors):
+        if vector_store._get_index() is None:
+            vector_store._create_index(dimension=len(vectors[0]))
+        for i in range(0, len(documents), s3_vectors_put_batch_size):
+            vector_store.client.put_vectors(
+                vectorBucketName=vector_store.vector_bucket_name,
+                indexName=vector_store.index_name,
+                vectors=[
+                    {
+                        "key": vector_id,
+                        "data": {vector_store.data_type: vector},
+                        "metadata": {
+                            **document.metadata,
+                            vector_store.page_content_metadata_key: document.page_content,
+                        },
+                    }
+                    for document, vector, vector_id in zip(
+                        documents[i : i + s3_vectors_put_batch_size],
+                        vectors[i : i + s3_vectors_put_batch_size],
+                        ids[i : i + s3_vectors_put_batch_size],
+                    )
+                ],
+            )
+    else:
+        vector_store.add_documents(documents, ids=ids)
+
+    print(f"Upserted {len(documents)} embedded documents")
+    return ids
@@ -0,0 +1,30 @@
+import pytest
+
+from rocketnotes_handler.lib import bm25, embedding_cache, util
+
+
+@pytest.fixture(autouse=True)
+def bm25_index_path(tmp_path, monkeypatch):
+    """Keep BM25 indexes written by handlers out of the shared /tmp path"""
+    monkeypatch.setattr(bm25, "bm25_index_path", str(tmp_path / "bm25"))
+    monkeypatch.setattr(bm25, "bm25_bucket_name", None)
+    bm25.bm25_index_cache.clear()
+    yield str(tmp_path / "bm25")
+    bm25.bm25_index_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def query_embedding_cache():
+    """Start every test with an empty process-wide query embedding cache"""
+    embedding_cache.get_query_cache().clear()
+    yield embedding_cache.get_query_cache()
+
+
+@pytest.fixture(autouse=True)
+def user_config_cache():
+    """UserConfigs cached by one test must not leak into the next"""
+    util.invalidate_user_config()
+    util.user_config_cache.hits = 0
+    util.user_config_cache.misses = 0
+    yield util.user_config_cache
+    util.invalidate_user_config()
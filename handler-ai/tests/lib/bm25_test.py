@@ -0,0 +1,169 @@
+import json
+
+import boto3
+from moto import mock_aws
+
+from rocketnotes_handler.lib import bm25
+from rocketnotes_handler.lib.bm25 import (BM25Index, BM25IndexStore,
+                                          reciprocal_rank_fusion, tokenize)
+
+
+def build_index():
+    index = BM25Index()
+    index.add("a", "Kubernetes deployment with helm charts", {"documentId": "doc-1"})
+    index.add("b", "Cooking pasta with tomato sauce", {"documentId": "doc-2"})
+    index.add("c", "Helm values for the staging deployment", {"documentId": "doc-3"})
+    return index
+
+
+def test_tokenize():
+    assert tokenize("Fix get_user_config, v2!") == ["fix", "get_user_config", "v2"]
+
+
+def test_search_ranks_matching_chunks():
+    index = build_index()
+
+    results = index.search("helm deployment")
+
+    assert {vector_id for vector_id, _ in results} == {"a", "c"}
+    assert index.search("tomato")[0][0] == "b"
+    assert index.search("unknown") == []
+
+
+def test_remove_and_update_chunks():
+    index = build_index()
+
+    index.remove("b")
+    index.add("c", "Tomato soup", {"documentId": "doc-3"})
+
+    assert len(index) == 2
+    assert index.search("tomato")[0][0] == "c"
+    assert [vector_id for vector_id, _ in index.search("helm")] == ["a"]
+    assert "pasta" not in index.postings
+
+
+def test_round_trip():
+    index = build_index()
+
+    restored = BM25Index.from_dict(json.loads(json.dumps(index.to_dict())))
+
+    assert restored.postings == index.postings
+    assert restored.search("helm deployment") == index.search("helm deployment")
+
+
+def test_loads_index_saved_without_postings():
+    index = build_index()
+    data = {"k1": index.k1, "b": index.b, "chunks": index.chunks}
+
+    restored = BM25Index.from_dict(data)
+
+    assert restored.search("helm deployment") == index.search("helm deployment")
+
+
+def test_reciprocal_rank_fusion_prefers_items_ranked_by_both():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["d", "c", "a"]])
+
+    assert fused[:2] == ["a", "c"]
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_disk_store_persists_changes(bm25_index_path):
+    store = BM25IndexStore("user-1")
+    assert not store.exists()
+
+    store.replace(build_index())
+    store.save()
+
+    store = BM25IndexStore("user-1")
+    assert store.exists()
+    store.remove_document("doc-2")
+    store.save()
+
+    assert len(BM25IndexStore("user-1").load()) == 2
+
+
+def test_changes_are_saved_as_segments_without_loading(bm25_index_path, monkeypatch):
+    monkeypatch.setattr(bm25, "bm25_compact_segments", 3)
+    store = BM25IndexStore("user-1")
+    store.replace(build_index())
+    store.save()
+
+    for vector_id in ["d", "e"]:
+        store = BM25IndexStore("user-1")
+        store.add(vector_id, f"Terraform module {vector_id}", {"documentId": "doc-4"})
+        store.save()
+
+    assert len(store._list_segments()) == 2
+    assert set(BM25IndexStore("user-1").load().chunks) == {"a", "b", "c", "d", "e"}
+
+    # The third segment is folded into the snapshot
+    store = BM25IndexStore("user-1")
+    store.remove("a")
+    store.save()
+
+    assert store._list_segments() == []
+    assert set(BM25IndexStore("user-1").load().chunks) == {"b", "c", "d", "e"}
+
+
+def test_rebuild_is_saved_in_segments(bm25_index_path, monkeypatch):
+    monkeypatch.setattr(bm25, "bm25_compact_segments", 2)
+    store = BM25IndexStore("user-1")
+    store.replace(build_index())
+    store.save()
+
+    store = BM25IndexStore("user-1")
+    store.start_rebuild()
+    store.add("a", "Kubernetes deployment with kustomize", {"documentId": "doc-1"})
+    store.save()
+    store.add("d", "Terraform modules", {"documentId": "doc-4"})
+    store.save()
+
+    # Readers keep the chunks that are not rewritten yet, nothing is compacted
+    assert len(store._list_segments()) == 2
+    assert set(BM25IndexStore("user-1").load().chunks) == {"a", "b", "c", "d"}
+
+    store.finish_rebuild({"a", "d"})
+
+    assert store._list_segments() == []
+    index = BM25IndexStore("user-1").load()
+    assert set(index.chunks) == {"a", "d"}
+    assert index.search("kustomize")[0][0] == "a"
+
+
+def test_rebuild_without_index_starts_from_empty_snapshot(bm25_index_path):
+    store = BM25IndexStore("user-1")
+    store.remove_document("doc-2")
+    store.start_rebuild()
+
+    assert store.exists()
+    store.add("a", "Kubernetes deployment", {"documentId": "doc-1"})
+    store.finish_rebuild({"a"})
+
+    assert set(BM25IndexStore("user-1").load().chunks) == {"a"}
+
+@mock_aws
+def test_s3_store_keeps_concurrent_changes(monkeypatch):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="bucket")
+    monkeypatch.setattr(bm25, "bm25_bucket_name", "bucket")
+
+    initial = BM25IndexStore("user-1", s3=s3)
+    initial.replace(build_index())
+    initial.save()
+
+    first = BM25IndexStore("user-1", s3=s3)
+    second = BM25IndexStore("user-1", s3=s3)
+
+    first.add("d", "Terraform modules", {"documentId": "doc-4"})
+    first.save()
+    second.remove("b")
+    second.save()
+
+    index = BM25IndexStore("user-1", s3=s3).load()
+    assert set(index.chunks) == {"a", "c", "d"}
+
+    BM25IndexStore("user-1", s3=s3).compact()
+
+    assert s3.list_objects_v2(Bucket="bucket", Prefix="bm25/user-1/")["KeyCount"] == 0
+    index = BM25IndexStore("user-1", s3=s3).load()
+    assert set(index.chunks) == {"a", "c", "d"}
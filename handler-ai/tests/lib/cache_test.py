@@ -0,0 +1,19 @@
+import time
+from unittest.mock import patch
+
+from rocketnotes_handler.lib.cache import TTLCache
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    expired = time.monotonic() + 61
+    with patch("rocketnotes_handler.lib.cache.time.monotonic", return_value=expired):
+        assert cache.get("a") is None
@@ -0,0 +1,42 @@
+from rocketnotes_handler.lib.chunker import MarkdownChunker, get_chunker
+
+SECTION_TEXT = "A sentence that is long enough to count for a few tokens. " * 4
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_merges_tiny_adjacent_sections():
+    chunker = MarkdownChunker(count_tokens=count_words, min_tokens=5)
+
+    chunks = chunker.split_text("# A\nshort\n## B\nalso short\n## C\n" + SECTION_TEXT)
+
+    assert len(chunks) == 2
+    assert "short" in chunks[0] and "also short" in chunks[0]
+    assert chunks[1].startswith("## C")
+
+
+def test_splits_sections_above_max_tokens():
+    chunker = MarkdownChunker(count_tokens=count_words, target_tokens=20, max_tokens=40)
+
+    chunks = chunker.split_text("# A\n" + SECTION_TEXT * 3)
+
+    assert len(chunks) > 1
+    assert all(count_words(chunk) <= 40 for chunk in chunks)
+
+
+def test_overlap_repeats_text_between_chunks():
+    chunker = MarkdownChunker(
+        count_tokens=count_words, target_tokens=20, max_tokens=20, overlap_tokens=5
+    )
+
+    chunks = chunker.split_text(" ".join(f"word{i}" for i in range(60)))
+
+    assert len(chunks) > 1
+    assert chunks[0].split()[-1] in chunks[1].split()
+
+
+def test_get_chunker_is_built_once_and_capped_by_model():
+    assert get_chunker("Sentence-Transformers") is get_chunker("Sentence-Transformers")
+    assert get_chunker("Sentence-Transformers").max_tokens <= 384
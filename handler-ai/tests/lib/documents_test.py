@@ -0,0 +1,116 @@
+import os
+from unittest.mock import Mock, patch
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from rocketnotes_handler.lib.documents import (batch_get_documents,
+                                               iter_user_documents)
+
+
+@pytest.fixture
+def dynamodb():
+    with mock_aws(), patch.dict(os.environ, {
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    }):
+        client = boto3.client('dynamodb', region_name='us-east-1')
+        client.create_table(
+            TableName='tnn-Documents',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'id', 'AttributeType': 'S'},
+                {'AttributeName': 'userId', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST',
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'userId-index',
+                'KeySchema': [{'AttributeName': 'userId', 'KeyType': 'HASH'}],
+                'Projection': {'ProjectionType': 'ALL'}
+            }]
+        )
+        yield client
+
+
+def test_iter_user_documents_follows_pagination(dynamodb):
+    for i in range(5):
+        dynamodb.put_item(
+            TableName='tnn-Documents',
+            Item={'id': {'S': f'doc-{i}'}, 'userId': {'S': 'test-user'}}
+        )
+    dynamodb.put_item(
+        TableName='tnn-Documents',
+        Item={'id': {'S': 'other-doc'}, 'userId': {'S': 'other-user'}}
+    )
+
+    documents = list(iter_user_documents(dynamodb, 'test-user', page_size=2))
+
+    assert sorted(document['id']['S'] for document in documents) == [
+        f'doc-{i}' for i in range(5)
+    ]
+
+
+def test_iter_user_documents_without_documents(dynamodb):
+    assert list(iter_user_documents(dynamodb, 'test-user')) == []
+
+
+def test_batch_get_documents_in_chunks(dynamodb):
+    for i in range(150):
+        dynamodb.put_item(
+            TableName='tnn-Documents',
+            Item={
+                'id': {'S': f'doc-{i}'},
+                'userId': {'S': 'test-user'},
+                'title': {'S': f'Doc {i}'},
+                'content': {'S': f'Content {i}'},
+                'searchContent': {'S': f'doc {i}\ncontent {i}'},
+            }
+        )
+
+    document_ids = [f'doc-{i}' for i in range(150)] + ['doc-0', 'missing-doc']
+    documents = batch_get_documents(dynamodb, document_ids)
+
+    assert len(documents) == 150
+    assert 'missing-doc' not in documents
+    assert documents['doc-42'] == {
+        'id': {'S': 'doc-42'},
+        'title': {'S': 'Doc 42'},
+        'content': {'S': 'Content 42'},
+    }
+
+
+@patch('rocketnotes_handler.lib.documents.time.sleep')
+def test_batch_get_documents_retries_unprocessed_keys(mock_sleep):
+    unprocessed = {'tnn-Documents': {'Keys': [{'id': {'S': 'doc-2'}}]}}
+    client = Mock()
+    client.batch_get_item = Mock(side_effect=[
+        {
+            'Responses': {'tnn-Documents': [{'id': {'S': 'doc-1'}}]},
+            'UnprocessedKeys': unprocessed,
+        },
+        {
+            'Responses': {'tnn-Documents': [{'id': {'S': 'doc-2'}}]},
+            'UnprocessedKeys': {},
+        },
+    ])
+
+    documents = batch_get_documents(client, ['doc-1', 'doc-2'])
+
+    assert sorted(documents) == ['doc-1', 'doc-2']
+    assert client.batch_get_item.call_args_list[1][1]['RequestItems'] == unprocessed
+    mock_sleep.assert_called_once()
+
+
+def test_batch_get_documents_consistent_read():
+    client = Mock()
+    client.batch_get_item = Mock(return_value={
+        'Responses': {'tnn-Documents': [{'id': {'S': 'doc-1'}}]},
+    })
+
+    batch_get_documents(client, ['doc-1'], consistent_read=True)
+
+    request = client.batch_get_item.call_args[1]['RequestItems']['tnn-Documents']
+    assert request['ConsistentRead'] is True
@@ -0,0 +1,223 @@
+import json
+import sys
+from array import array
+from unittest.mock import Mock
+
+import boto3
+import httpx
+import pytest
+from langchain_openai import OpenAIEmbeddings
+from moto import mock_aws
+
+from rocketnotes_handler.lib.cache import TTLCache
+from rocketnotes_handler.lib.embedding_cache import (CachedEmbeddings, LRUCache,
+                                                     QueryEmbeddingCache,
+                                                     S3EmbeddingStore,
+                                                     SQLiteEmbeddingStore,
+                                                     has_symmetric_queries)
+from rocketnotes_handler.lib.ollama_embeddings import OllamaBatchEmbeddings
+
+
+@pytest.fixture
+def underlying():
+    embeddings = Mock()
+    embeddings.embed_documents = Mock(
+        side_effect=lambda texts: [[float(len(text)), 1.0] for text in texts]
+    )
+    embeddings.embed_query = Mock(side_effect=lambda text: [float(len(text)), 0.0])
+    return embeddings
+
+
+def test_embed_documents_only_embeds_missing_texts(underlying):
+    embeddings = CachedEmbeddings(underlying, model="model-a", cache=LRUCache(100))
+
+    assert embeddings.embed_documents(["a", "bb"]) == [[1.0, 1.0], [2.0, 1.0]]
+    assert embeddings.embed_documents(["bb", "ccc", "ccc"]) == [
+        [2.0, 1.0],
+        [3.0, 1.0],
+        [3.0, 1.0],
+    ]
+
+    assert underlying.embed_documents.call_args_list[0][0][0] == ["a", "bb"]
+    assert underlying.embed_documents.call_args_list[1][0][0] == ["ccc"]
+
+
+def test_cache_is_keyed_by_model(underlying):
+    cache = LRUCache(100)
+    CachedEmbeddings(underlying, model="model-a", cache=cache).embed_documents(["a"])
+    CachedEmbeddings(underlying, model="model-b", cache=cache).embed_documents(["a"])
+
+    assert underlying.embed_documents.call_count == 2
+
+
+def test_queries_and_documents_are_cached_separately(underlying):
+    embeddings = CachedEmbeddings(underlying, model="model-a", cache=LRUCache(100))
+
+    assert embeddings.embed_query("a") == [1.0, 0.0]
+    assert embeddings.embed_query("a") == [1.0, 0.0]
+    assert embeddings.embed_documents(["a"]) == [[1.0, 1.0]]
+    underlying.embed_query.assert_called_once_with("a")
+
+
+def test_persistent_store_survives_memory_eviction(underlying, tmp_path):
+    store = SQLiteEmbeddingStore(str(tmp_path / "embeddings.sqlite"))
+    embeddings = CachedEmbeddings(
+        underlying, model="model-a", store=store, cache=LRUCache(1)
+    )
+
+    embeddings.embed_documents(["a", "bb"])
+    assert embeddings.embed_documents(["a", "bb"]) == [[1.0, 1.0], [2.0, 1.0]]
+    underlying.embed_documents.assert_called_once()
+
+
+@mock_aws
+def test_s3_store_reads_and_writes_vectors_in_parallel(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    boto3.client("s3").create_bucket(Bucket="test-bucket")
+    store = S3EmbeddingStore("test-bucket", concurrency=4)
+
+    store.set_many({f"key-{i}": [float(i), 0.5] for i in range(10)})
+
+    assert store.get_many(["key-3", "missing", "key-7"]) == {
+        "key-3": [3.0, 0.5],
+        "key-7": [7.0, 0.5],
+    }
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_lru_cache_is_bounded_by_bytes(underlying):
+    vector = array("f", [0.0] * 1536)
+    cache = LRUCache(max_bytes=3 * sys.getsizeof(vector) + 500)
+    for key in ["a", "b", "c", "d"]:
+        cache.set(key, array("f", vector))
+
+    assert len(cache) == 3
+    assert cache.get("a") is None
+    assert cache.size_bytes <= cache.max_bytes
+
+
+def test_memory_tier_holds_float32_arrays(underlying):
+    cache = LRUCache(100)
+    embeddings = CachedEmbeddings(underlying, model="model-a", cache=cache)
+
+    embeddings.embed_documents(["a"])
+
+    assert embeddings.embed_documents(["a"]) == [[1.0, 1.0]]
+    assert [value.typecode for value in cache._entries.values()] == ["f"]
+
+
+def test_query_embeddings_are_cached_by_normalized_query(underlying):
+    query_cache = QueryEmbeddingCache(TTLCache(100, ttl_seconds=60))
+    embeddings = CachedEmbeddings(
+        underlying, model="model-a", cache=LRUCache(100), query_cache=query_cache
+    )
+
+    assert embeddings.embed_query("Hello  World") == [12.0, 0.0]
+    assert embeddings.embed_query(" hello world ") == [12.0, 0.0]
+    CachedEmbeddings(
+        underlying, model="model-b", cache=LRUCache(100), query_cache=query_cache
+    ).embed_query("hello world")
+
+    assert underlying.embed_query.call_count == 2
+    assert query_cache.metrics() == {
+        "hits": 1,
+        "sharedHits": 0,
+        "misses": 2,
+        "hitRate": 1 / 3,
+    }
+
+
+def test_query_embeddings_expire(underlying):
+    query_cache = QueryEmbeddingCache(TTLCache(100, ttl_seconds=0))
+    embeddings = CachedEmbeddings(
+        underlying, model="model-a", cache=LRUCache(100), query_cache=query_cache
+    )
+
+    embeddings.embed_query("a")
+    embeddings.embed_query("a")
+
+    assert underlying.embed_query.call_count == 2
+
+
+def test_query_embeddings_are_shared_across_processes(underlying, tmp_path):
+    store = SQLiteEmbeddingStore(str(tmp_path / "embeddings.sqlite"))
+    for _ in range(2):
+        # Every iteration stands for a new Lambda with an empty memory tier
+        query_cache = QueryEmbeddingCache(TTLCache(100, ttl_seconds=60), store=store)
+        CachedEmbeddings(
+            underlying, model="model-a", cache=LRUCache(100), query_cache=query_cache
+        ).embed_query("a")
+
+    underlying.embed_query.assert_called_once_with("a")
+    assert query_cache.metrics()["sharedHits"] == 1
+    assert query_cache.metrics()["misses"] == 0
+
+
+def test_embed_queries_embeds_missing_queries_in_one_call(underlying):
+    underlying.symmetric_queries = True
+    query_cache = QueryEmbeddingCache(TTLCache(100, ttl_seconds=60))
+    embeddings = CachedEmbeddings(
+        underlying, model="model-a", cache=LRUCache(100), query_cache=query_cache
+    )
+    embeddings.embed_query("a")
+
+    assert embeddings.embed_queries(["a", "bb", "ccc"]) == [
+        [1.0, 0.0],
+        [2.0, 1.0],
+        [3.0, 1.0],
+    ]
+    underlying.embed_documents.assert_called_once_with(["bb", "ccc"])
+    # Searches for the batched queries are served from the cache
+    assert embeddings.embed_query("bb") == [2.0, 1.0]
+    assert underlying.embed_query.call_count == 1
+
+
+def test_embed_queries_keeps_query_embeddings_of_asymmetric_models(underlying):
+    underlying.symmetric_queries = False
+    embeddings = CachedEmbeddings(
+        underlying,
+        model="voyage-3",
+        cache=LRUCache(100),
+        query_cache=QueryEmbeddingCache(TTLCache(100, ttl_seconds=60)),
+    )
+
+    assert embeddings.embed_queries(["a", "bb"]) == [[1.0, 0.0], [2.0, 0.0]]
+    underlying.embed_documents.assert_not_called()
+
+
+def test_embed_queries_of_ollama_get_the_query_prefix():
+    def handle(request):
+        inputs = json.loads(request.content)["input"]
+        return httpx.Response(
+            200, json={"embeddings": [[float(len(text)), 0.0] for text in inputs]}
+        )
+
+    underlying = OllamaBatchEmbeddings(
+        model="nomic-embed-text",
+        client=httpx.Client(transport=httpx.MockTransport(handle)),
+    )
+    embeddings = CachedEmbeddings(
+        underlying,
+        model="Ollama-nomic-embed-text@v2",
+        cache=LRUCache(100),
+        query_cache=QueryEmbeddingCache(TTLCache(100, ttl_seconds=60)),
+    )
+
+    assert embeddings.embed_queries(["abc"]) == [underlying.embed_query("abc")]
+    assert embeddings.embed_query("abc") == [float(len("query: abc")), 0.0]
+
+
+def test_openai_queries_are_symmetric():
+    assert has_symmetric_queries(OpenAIEmbeddings(api_key="test"))
+    assert not has_symmetric_queries(Mock())
@@ -0,0 +1,94 @@
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from rocketnotes_handler.lib.embedding_executor import (EmbeddingExecutor,
+                                                        TokenBucket,
+                                                        get_embeddings_provider,
+                                                        is_rate_limit_error)
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def test_embed_documents_keeps_order():
+    embeddings = Mock()
+    embeddings.embed_documents = Mock(
+        side_effect=lambda texts: [[float(len(text))] for text in texts]
+    )
+    executor = EmbeddingExecutor(embeddings, max_concurrency=4)
+
+    vectors = executor.embed_documents(["a" * i for i in range(1, 8)])
+
+    assert vectors == [[float(i)] for i in range(1, 8)]
+
+
+def test_map_runs_batches_concurrently():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def embed_documents(texts):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return [[0.0] for _ in texts]
+
+    embeddings = Mock()
+    embeddings.embed_documents = Mock(side_effect=embed_documents)
+    executor = EmbeddingExecutor(embeddings, provider="openai", max_concurrency=3)
+
+    results = list(executor.map(range(6), lambda item: [str(item)]))
+
+    assert sorted(item for item, _ in results) == list(range(6))
+    assert 1 < max(peak) <= 3
+
+
+@patch("rocketnotes_handler.lib.embedding_executor.time.sleep")
+def test_rate_limit_is_retried_with_reduced_concurrency(mock_sleep):
+    embeddings = Mock()
+    embeddings.embed_documents = Mock(side_effect=[RateLimitError(), [[1.0]]])
+    executor = EmbeddingExecutor(embeddings, provider="ollama", max_concurrency=4)
+
+    assert executor.embed(["text"]) == [[1.0]]
+    assert embeddings.embed_documents.call_count == 2
+    assert executor.concurrency.limit == executor.concurrency.max_concurrency
+    mock_sleep.assert_called_once()
+
+
+def test_other_errors_are_not_retried():
+    embeddings = Mock()
+    embeddings.embed_documents = Mock(side_effect=ValueError("invalid input"))
+    executor = EmbeddingExecutor(embeddings)
+
+    with pytest.raises(ValueError):
+        executor.embed(["text"])
+    assert embeddings.embed_documents.call_count == 1
+
+
+@patch("rocketnotes_handler.lib.embedding_executor.time.sleep")
+def test_token_bucket_waits_for_refill(mock_sleep):
+    bucket = TokenBucket(tokens_per_minute=60)
+    bucket.acquire(60)
+
+    with patch(
+        "rocketnotes_handler.lib.embedding_executor.time.monotonic",
+        side_effect=[bucket._updated, bucket._updated + 10],
+    ):
+        bucket.acquire(10)
+
+    mock_sleep.assert_called_once_with(10)
+
+
+def test_helpers():
+    assert get_embeddings_provider("text-embedding-3-small") == "openai"
+    assert get_embeddings_provider("Ollama-nomic-embed-text") == "ollama"
+    assert get_embeddings_provider("Sentence-Transformers") == "local"
+    assert is_rate_limit_error(Exception("Error code: 429 - Too Many Requests"))
+    assert not is_rate_limit_error(Exception("Internal server error"))
@@ -0,0 +1,29 @@
+from unittest.mock import Mock
+
+from rocketnotes_handler.lib.embedding import embed_in_batches, iter_token_batches
+
+
+def test_iter_token_batches_respects_token_limit():
+    texts = ["a" * 40, "b" * 40, "c" * 40, "d" * 400]
+
+    batches = list(iter_token_batches(texts, max_tokens=25, max_texts=10))
+
+    assert batches == [[0, 1], [2], [3]]
+
+
+def test_iter_token_batches_respects_text_limit():
+    batches = list(iter_token_batches(["text"] * 5, max_tokens=1000, max_texts=2))
+
+    assert batches == [[0, 1], [2, 3], [4]]
+
+
+def test_embed_in_batches_keeps_order():
+    embeddings = Mock()
+    embeddings.embed_documents = Mock(
+        side_effect=lambda texts: [[float(len(text))] for text in texts]
+    )
+
+    vectors = embed_in_batches(embeddings, ["a", "bb", "ccc"])
+
+    assert vectors == [[1.0], [2.0], [3.0]]
+    embeddings.embed_documents.assert_called_once_with(["a", "bb", "ccc"])
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("hnswlib")
+
+from rocketnotes_handler.lib.hnsw_vector_store import HnswVectorStore
+from rocketnotes_handler.lib.numpy_vector_store import NumpyVectorStore
+
+
+def random_vectors(count, dim=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+
+
+def make_store(path=None):
+    return HnswVectorStore(None, path=path, exact_search_threshold=0)
+
+
+def test_matches_exact_search():
+    vectors = random_vectors(500)
+    ids = [str(i) for i in range(500)]
+    store = make_store()
+    exact = NumpyVectorStore(None)
+    for vector_store in (store, exact):
+        vector_store.add_embeddings(ids, vectors.tolist(), ids=ids)
+
+    queries = random_vectors(20, seed=1)
+    recall = np.mean([
+        len(
+            {document.id for document in store.similarity_search_by_vector(query, k=10)}
+            & {document.id for document in exact.similarity_search_by_vector(query, k=10)}
+        ) / 10
+        for query in queries
+    ])
+
+    assert recall >= 0.95
+
+
+def test_incremental_upsert_and_delete():
+    vectors = random_vectors(3)
+    store = make_store()
+    store.add_embeddings(["a", "b", "c"], vectors.tolist(), ids=["a", "b", "c"])
+
+    store.delete(ids=["a"])
+    assert "a" not in [document.id for document in store.similarity_search_by_vector(vectors[0], k=2)]
+
+    # Re-adding reuses the deleted slot, updating moves the vector
+    store.add_embeddings(["a"], [vectors[0].tolist()], ids=["a"])
+    store.add_embeddings(["b"], [vectors[2].tolist()], ids=["b"])
+    assert store.similarity_search_by_vector(vectors[0], k=1)[0].id == "a"
+    assert store._index.get_current_count() == 3
+
+
+def test_index_is_persisted(tmp_path):
+    vectors = random_vectors(50)
+    ids = [str(i) for i in range(50)]
+    store = make_store(str(tmp_path))
+    store.add_embeddings(ids, vectors.tolist(), ids=ids)
+    store.delete(ids=["7"])
+
+    reopened = make_store(str(tmp_path))
+
+    assert (tmp_path / "hnsw.bin").exists()
+    assert reopened._index is not None
+    assert reopened.similarity_search_by_vector(vectors[3], k=1)[0].id == "3"
+    assert "7" not in reopened._labels
+
+
+def test_filtered_search_is_exact():
+    vectors = random_vectors(10)
+    store = make_store()
+    store.add_embeddings(
+        [str(i) for i in range(10)],
+        vectors.tolist(),
+        [{"documentId": f"doc-{i % 2}"} for i in range(10)],
+        ids=[str(i) for i in range(10)],
+    )
+
+    results = store.similarity_search_by_vector(vectors[1], k=10, filter={"documentId": "doc-1"})
+
+    assert len(results) == 5
+    assert results[0].id == "1"
+
+
+def test_cleared_store_accepts_another_dimension(tmp_path):
+    store = make_store(str(tmp_path))
+    store.add_embeddings(["a", "b"], random_vectors(2).tolist(), ids=["a", "b"])
+
+    store.clear()
+    store.add_embeddings(["c"], random_vectors(1, dim=8).tolist(), ids=["c"])
+
+    assert [document.id for document in store.similarity_search_by_vector(
+        random_vectors(1, dim=8)[0], k=1)] == ["c"]
+    assert make_store(str(tmp_path))._vectors.shape == (1, 8)
@@ -0,0 +1,71 @@
+from unittest.mock import patch
+
+import pytest
+
+from rocketnotes_handler.lib import local_embeddings
+from rocketnotes_handler.lib.local_embeddings import (
+    get_sentence_transformers_embeddings, onnx_file_name,
+    preload_local_embeddings, sentence_transformers_variant)
+
+
+@pytest.fixture
+def huggingface_embeddings():
+    with patch.object(local_embeddings, "HuggingFaceEmbeddings") as model_class, \
+            patch.dict(local_embeddings._sentence_transformers, clear=True):
+        yield model_class
+
+
+def test_model_is_loaded_once_per_process(huggingface_embeddings):
+    with patch.object(local_embeddings, "sentence_transformers_batch_size", 8):
+        model = get_sentence_transformers_embeddings()
+        assert get_sentence_transformers_embeddings() is model
+
+    huggingface_embeddings.assert_called_once()
+    assert huggingface_embeddings.call_args[1]["encode_kwargs"] == {"batch_size": 8}
+    assert huggingface_embeddings.call_args[1]["model_kwargs"] == {"device": "cpu"}
+
+
+def test_onnx_backend_loads_quantized_model(huggingface_embeddings):
+    with patch.object(local_embeddings, "onnx_quantization", "avx2"):
+        get_sentence_transformers_embeddings(backend="onnx")
+    torch = get_sentence_transformers_embeddings(backend="torch")
+
+    assert huggingface_embeddings.call_count == 2
+    assert get_sentence_transformers_embeddings(backend="torch") is torch
+    onnx_kwargs = huggingface_embeddings.call_args_list[0][1]["model_kwargs"]
+    assert onnx_kwargs["backend"] == "onnx"
+    assert onnx_kwargs["model_kwargs"]["file_name"] == "onnx/model_qint8_avx2.onnx"
+    torch_kwargs = huggingface_embeddings.call_args_list[1][1]["model_kwargs"]
+    assert torch_kwargs == {"device": "cpu"}
+
+
+def test_onnx_file_name():
+    assert onnx_file_name(None) == "onnx/model.onnx"
+    assert onnx_file_name("avx512_vnni") == "onnx/model_qint8_avx512_vnni.onnx"
+    with pytest.raises(ValueError):
+        onnx_file_name("int4")
+
+
+def test_sentence_transformers_variant():
+    assert sentence_transformers_variant(backend="torch") is None
+    assert sentence_transformers_variant(backend="torch", quantization="avx2") is None
+    assert sentence_transformers_variant(backend="onnx") == "onnx"
+    assert sentence_transformers_variant(backend="onnx", quantization="avx2") == (
+        "onnx-qint8-avx2"
+    )
+
+
+def test_preload_only_when_configured(huggingface_embeddings):
+    preload_local_embeddings()
+    huggingface_embeddings.assert_not_called()
+
+    with patch.object(local_embeddings, "preload_embeddings_model", "Sentence-Transformers"):
+        preload_local_embeddings()
+    huggingface_embeddings.return_value.embed_query.assert_called_once()
+
+
+def test_preload_failure_does_not_fail_init(huggingface_embeddings):
+    huggingface_embeddings.side_effect = ImportError("sentence_transformers")
+
+    with patch.object(local_embeddings, "preload_embeddings_model", "Sentence-Transformers"):
+        preload_local_embeddings()
@@ -0,0 +1,129 @@
+from unittest.mock import Mock
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from rocketnotes_handler.lib.numpy_vector_store import NumpyVectorStore
+from rocketnotes_handler.lib.vector_store_factory import (
+    add_embedded_documents, delete_document_vectors)
+
+
+def make_store(path=None):
+    return NumpyVectorStore(DeterministicFakeEmbedding(size=16), path=path)
+
+
+def test_similarity_search_finds_exact_match():
+    store = make_store()
+    store.add_texts(
+        ["alpha", "beta", "gamma"],
+        [{"documentId": "doc-1"}, {"documentId": "doc-2"}, {"documentId": "doc-2"}],
+        ids=["a", "b", "c"],
+    )
+
+    results = store.similarity_search_with_score("beta", k=2)
+
+    assert results[0][0].page_content == "beta"
+    assert results[0][0].metadata == {"documentId": "doc-2"}
+    assert results[0][1] > results[1][1]
+    assert np.isclose(results[0][1], 1.0)
+
+
+def test_similarity_search_filters_by_document_id():
+    store = make_store()
+    store.add_texts(
+        ["alpha", "beta", "gamma"],
+        [{"documentId": "doc-1"}, {"documentId": "doc-2"}, {"documentId": "doc-2"}],
+        ids=["a", "b", "c"],
+    )
+
+    results = store.similarity_search("alpha", k=3, filter={"documentId": "doc-2"})
+
+    assert {document.page_content for document in results} == {"beta", "gamma"}
+
+
+def test_upsert_and_delete_by_id():
+    store = make_store()
+    store.add_texts(["alpha", "beta"], ids=["a", "b"])
+    store.add_texts(["alpha changed"], ids=["a"])
+
+    assert len(store) == 2
+    assert store.get_by_ids(["a"])[0].page_content == "alpha changed"
+
+    assert store.delete(ids=["a"])
+    assert len(store) == 1
+    assert store.similarity_search("alpha changed", k=5)[0].page_content == "beta"
+    # Deleting without ids never wipes the store
+    assert store.delete() is False
+    assert len(store) == 1
+
+
+def test_index_is_persisted_and_memory_mapped(tmp_path):
+    store = make_store(str(tmp_path))
+    store.add_texts(["alpha", "beta"], [{"documentId": "doc-1"}] * 2, ids=["a", "b"])
+
+    reopened = make_store(str(tmp_path))
+
+    assert isinstance(reopened._vectors, np.memmap)
+    assert reopened._vectors.dtype == np.float32
+    assert reopened.similarity_search("beta", k=1)[0].page_content == "beta"
+
+
+def test_factory_helpers_write_and_delete_documents():
+    store = make_store()
+    documents = [
+        Document(page_content="one", metadata={"documentId": "doc-1"}),
+        Document(page_content="two", metadata={"documentId": "doc-2"}),
+    ]
+    embeddings = DeterministicFakeEmbedding(size=16)
+
+    add_embedded_documents(
+        store, documents, embeddings.embed_documents(["one", "two"]), ["1", "2"]
+    )
+    delete_document_vectors("doc-1", store)
+
+    assert [document.page_content for document in store.similarity_search("one", k=5)] == ["two"]
+
+
+def test_max_marginal_relevance_search():
+    embeddings = Mock()
+    embeddings.embed_query = Mock(return_value=[1.0, 0.0])
+    store = NumpyVectorStore(embeddings)
+    store.add_embeddings(
+        ["a", "a copy", "b"], [[1.0, 0.0], [1.0, 0.01], [0.7, 0.7]], ids=["1", "2", "3"]
+    )
+
+    results = store.max_marginal_relevance_search("query", k=2, fetch_k=3, lambda_mult=0.3)
+
+    assert [document.page_content for document in results] == ["a", "b"]
+
+
+def test_writes_are_persisted_on_flush(tmp_path):
+    store = NumpyVectorStore(
+        DeterministicFakeEmbedding(size=16), path=str(tmp_path), auto_flush=False
+    )
+    for i in range(10):
+        store.add_texts([f"text {i}"], [{"documentId": f"doc-{i}"}], ids=[str(i)])
+    store.delete(ids=["0", "4"])
+
+    assert not (tmp_path / "records.json").exists()
+    assert store.similarity_search("text 9", k=1)[0].id == "9"
+    assert sorted(store.get_ids_by_metadata({"documentId": ["doc-4", "doc-9"]})) == ["9"]
+
+    store.flush()
+    reopened = make_store(str(tmp_path))
+
+    assert isinstance(store._vectors, np.memmap)
+    assert len(reopened) == 8
+    assert reopened.similarity_search("text 7", k=1)[0].id == "7"
+
+
+def test_store_emptied_by_deletes_accepts_another_dimension():
+    store = make_store()
+    store.add_embeddings(["a", "b"], [[1.0, 0.0], [0.0, 1.0]], ids=["a", "b"])
+
+    store.delete(ids=["a", "b"])
+    store.add_embeddings(["c"], [[1.0, 0.0, 0.0]], ids=["c"])
+
+    assert store._vectors.shape == (1, 3)
+    assert store.similarity_search_by_vector([1.0, 0.0, 0.0], k=1)[0].id == "c"
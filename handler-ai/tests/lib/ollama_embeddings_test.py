@@ -0,0 +1,70 @@
+import json
+
+import httpx
+import pytest
+
+from rocketnotes_handler.lib.ollama_embeddings import OllamaBatchEmbeddings
+
+
+def create_embeddings(requests, batch_size=3, batch_max_tokens=1000, status_code=200):
+    def handle(request):
+        body = json.loads(request.content)
+        requests.append(body)
+        return httpx.Response(
+            status_code,
+            json={"embeddings": [[float(len(text))] for text in body["input"]]},
+        )
+
+    return OllamaBatchEmbeddings(
+        model="nomic-embed-text",
+        base_url="http://ollama:11434",
+        batch_size=batch_size,
+        batch_max_tokens=batch_max_tokens,
+        keep_alive="10m",
+        client=httpx.Client(transport=httpx.MockTransport(handle)),
+    )
+
+
+def test_embed_documents_batches_texts_in_order():
+    requests = []
+    embeddings = create_embeddings(requests)
+    texts = ["a" * i for i in range(1, 8)]
+
+    vectors = embeddings.embed_documents(texts)
+
+    assert vectors == [[float(len("passage: ") + i)] for i in range(1, 8)]
+    assert [len(request["input"]) for request in requests] == [3, 3, 1]
+    assert all(request["keep_alive"] == "10m" for request in requests)
+    assert requests[0]["model"] == "nomic-embed-text"
+
+
+def test_large_texts_are_split_by_tokens():
+    requests = []
+    embeddings = create_embeddings(requests, batch_size=64, batch_max_tokens=30)
+
+    embeddings.embed_documents(["word " * 20] * 4)
+
+    assert [len(request["input"]) for request in requests] == [1, 1, 1, 1]
+
+
+def test_embed_query_uses_query_prefix():
+    requests = []
+    embeddings = create_embeddings(requests)
+
+    embeddings.embed_query("abc")
+
+    assert requests == [
+        {
+            "model": "nomic-embed-text",
+            "input": ["query: abc"],
+            "keep_alive": "10m",
+            "truncate": True,
+        }
+    ]
+
+
+def test_errors_are_raised():
+    embeddings = create_embeddings([], status_code=500)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        embeddings.embed_documents(["text"])
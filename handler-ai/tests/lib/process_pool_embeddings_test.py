@@ -0,0 +1,53 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from rocketnotes_handler.lib import process_pool_embeddings
+from rocketnotes_handler.lib.process_pool_embeddings import (
+    ProcessPoolEmbeddings, get_process_pool_embeddings)
+
+
+class WorkerEmbeddings:
+    """Deterministic embeddings that record the worker process"""
+
+    def embed_documents(self, texts):
+        return [[float(len(text)), float(os.getpid())] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def create_embeddings(embeddingsModel):
+    return WorkerEmbeddings()
+
+
+@pytest.fixture
+def pool_embeddings():
+    embeddings = ProcessPoolEmbeddings(
+        "Sentence-Transformers", max_workers=2, shard_size=3, create=create_embeddings
+    )
+    yield embeddings
+    embeddings.close()
+
+
+def test_embed_documents_keeps_order_across_shards(pool_embeddings):
+    texts = ["a" * i for i in range(1, 12)]
+
+    vectors = pool_embeddings.embed_documents(texts)
+
+    assert [vector[0] for vector in vectors] == [float(i) for i in range(1, 12)]
+    assert all(vector[1] != os.getpid() for vector in vectors)
+    assert pool_embeddings.embed_query("abc")[0] == 3.0
+    assert pool_embeddings.embed_documents([]) == []
+
+
+def test_pool_only_for_local_models():
+    with patch.object(process_pool_embeddings, "reindex_pool_workers", 0):
+        assert get_process_pool_embeddings("Sentence-Transformers") is None
+    with patch.object(process_pool_embeddings, "reindex_pool_workers", 4), \
+            patch.dict(process_pool_embeddings._process_pool_embeddings, clear=True):
+        assert get_process_pool_embeddings("text-embedding-3-small") is None
+        pool = get_process_pool_embeddings("Sentence-Transformers")
+        assert pool.max_workers == 4
+        assert get_process_pool_embeddings("Sentence-Transformers") is pool
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from rocketnotes_handler.lib.numpy_vector_store import NumpyVectorStore
+from rocketnotes_handler.lib.quantization import (QuantizedIndex,
+                                                  quantize_binary,
+                                                  quantize_int8)
+
+
+def clustered_vectors(count, dim=384, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(20, dim))
+    return (centroids[rng.integers(0, 20, count)] + rng.normal(scale=0.5, size=(count, dim))).astype(np.float32)
+
+
+def test_quantize_int8_round_trip():
+    vectors = clustered_vectors(10)
+
+    codes, scales = quantize_int8(vectors)
+
+    assert codes.dtype == np.int8
+    assert np.allclose(codes * scales[:, None], vectors, atol=scales.max())
+
+
+def test_quantize_binary_packs_sign_bits():
+    codes = quantize_binary(np.array([[1.0, -1.0] * 8]))
+
+    assert codes.dtype == np.uint8
+    assert codes.tolist() == [[0b10101010, 0b10101010]]
+
+
+def test_unknown_quantization_is_rejected():
+    with pytest.raises(ValueError):
+        QuantizedIndex("float16")
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_quantized_search_is_reranked_exactly(quantization):
+    vectors = clustered_vectors(2000)
+    ids = [str(i) for i in range(2000)]
+    exact = NumpyVectorStore(None)
+    quantized = NumpyVectorStore(None, quantization=quantization)
+    for store in (exact, quantized):
+        store.add_embeddings(ids, vectors.tolist(), ids=ids)
+
+    # Queries close to stored notes, as with real searches
+    queries = vectors[:20] + np.random.default_rng(1).normal(scale=0.5, size=(20, 384))
+    recalls = []
+    for query in queries:
+        expected = exact.similarity_search_with_score_by_vector(query, k=10)
+        found = quantized.similarity_search_with_score_by_vector(query, k=10)
+        recalls.append(len({d.id for d, _ in found} & {d.id for d, _ in expected}) / 10)
+        # Scores of the returned vectors are exact cosine similarities
+        assert np.isclose(found[0][1], exact._vectors[int(found[0][0].id)] @ (query / np.linalg.norm(query)), atol=1e-5)
+
+    assert np.mean(recalls) >= 0.8
+    assert quantized._quantized.nbytes < exact._vectors.nbytes / 3
+
+
+def test_quantized_index_is_rebuilt_on_load(tmp_path):
+    vectors = clustered_vectors(100)
+    ids = [str(i) for i in range(100)]
+    NumpyVectorStore(None, path=str(tmp_path), quantization="int8").add_embeddings(ids, vectors.tolist(), ids=ids)
+
+    reopened = NumpyVectorStore(None, path=str(tmp_path), quantization="int8")
+
+    assert reopened._quantized.codes.shape == (100, 384)
+    assert reopened.similarity_search_by_vector(vectors[5], k=1)[0].id == "5"
@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from langchain_core.documents import Document
+
+from rocketnotes_handler.lib import rerank
+from rocketnotes_handler.lib.rerank import (CrossEncoderReranker,
+                                            RerankingRetriever,
+                                            rerank_candidates,
+                                            remaining_budget_ms)
+
+
+def fake_cross_encoder(*args, **kwargs):
+    """Scores a pair by the number of query words found in the passage"""
+    model = Mock()
+    model.predict = Mock(side_effect=lambda pairs, **kwargs: [
+        sum(word in passage for word in query.split()) for query, passage in pairs
+    ])
+    return model
+
+
+def make_reranker(**kwargs):
+    return CrossEncoderReranker("test-model", **kwargs)
+
+
+@patch.object(rerank, "create_cross_encoder", Mock(side_effect=fake_cross_encoder))
+def test_rerank_orders_by_cross_encoder_score():
+    reranker = make_reranker()
+
+    result = reranker.rerank(
+        "red apple", ["green pear", "red apple pie", "apple"], text_of=lambda text: text
+    )
+
+    assert result == ["red apple pie", "apple", "green pear"]
+    # The model is loaded once per process
+    reranker.rerank("pear", ["pear", "apple"], text_of=lambda text: text)
+    rerank.create_cross_encoder.assert_called_once()
+
+
+@patch.object(rerank, "create_cross_encoder", Mock(side_effect=fake_cross_encoder))
+def test_rerank_is_skipped_when_over_budget():
+    reranker = make_reranker(latency_budget_ms=100)
+    reranker.ms_per_pair = 10.0
+    candidates = ["a", "b a"]
+
+    assert reranker.rerank("b", candidates, text_of=lambda text: text, budget_ms=5) == candidates
+    assert reranker.rerank("b", candidates, text_of=lambda text: text) == ["b a", "a"]
+
+
+def test_rerank_keeps_order_when_scoring_fails():
+    reranker = make_reranker()
+    reranker.model = Mock()
+    reranker.model.predict.side_effect = RuntimeError("out of memory")
+
+    assert reranker.rerank("q", ["a", "b"], text_of=lambda text: text) == ["a", "b"]
+
+
+@patch.object(rerank, "create_cross_encoder", Mock(side_effect=fake_cross_encoder))
+def test_rerank_candidates_only_reranks_top_n():
+    documents = [Document(page_content=text) for text in ["x", "y", "x y", "y y"]]
+
+    with patch.object(rerank, "get_reranker", Mock(return_value=make_reranker())):
+        result = rerank_candidates("y", documents, top_n=2)
+
+    assert [document.page_content for document in result] == ["y", "x", "x y", "y y"]
+
+
+def test_rerank_candidates_without_reranker_keeps_order():
+    documents = [Document(page_content="a"), Document(page_content="b")]
+
+    with patch.object(rerank, "get_reranker", Mock(return_value=None)):
+        assert rerank_candidates("b", documents) == documents
+
+
+@patch.object(rerank, "create_cross_encoder", Mock(side_effect=fake_cross_encoder))
+def test_reranking_retriever_over_fetches():
+    vector_store = Mock()
+    vector_store.similarity_search.return_value = [
+        Document(page_content=text) for text in ["cat", "dog", "hot dog"]
+    ]
+
+    with patch.object(rerank, "get_reranker", Mock(return_value=make_reranker())), \
+            patch.object(rerank, "rerank_top_n", 20):
+        retriever = RerankingRetriever(vector_store=vector_store, k=1)
+        documents = retriever.invoke("hot dog")
+
+    vector_store.similarity_search.assert_called_once_with("hot dog", k=20)
+    assert [document.page_content for document in documents] == ["hot dog"]
+
+
+def test_remaining_budget_ms():
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 10000)
+
+    assert remaining_budget_ms(context) == 10000 - rerank.rerank_safety_margin_ms
+    assert remaining_budget_ms({}) is None
@@ -0,0 +1,112 @@
+from unittest.mock import Mock
+
+import pytest
+
+from rocketnotes_handler.lib.bm25 import BM25Index
+from rocketnotes_handler.lib.numpy_vector_store import NumpyVectorStore
+from rocketnotes_handler.lib.search import (decode_cursor, encode_cursor,
+                                            search_documents)
+
+# Two near duplicate sections of doc-1 and a less similar section of doc-2
+VECTORS = {
+    "query": [1.0, 0.0, 0.0],
+    "Doc 1\nfirst": [0.99, 0.1, 0.0],
+    "Doc 1\nsecond": [0.98, 0.12, 0.0],
+    "Doc 2\nother": [0.8, 0.0, 0.6],
+    "Doc 3\nunrelated": [0.0, 0.0, 1.0],
+}
+
+
+@pytest.fixture
+def embeddings():
+    embeddings = Mock()
+    embeddings.embed_query = Mock(side_effect=lambda text: VECTORS[text])
+    embeddings.embed_documents = Mock(
+        side_effect=lambda texts: [VECTORS[text] for text in texts]
+    )
+    return embeddings
+
+
+@pytest.fixture
+def vector_store(embeddings):
+    store = NumpyVectorStore(embeddings)
+    texts = [text for text in VECTORS if text != "query"]
+    store.add_embeddings(
+        texts,
+        [VECTORS[text] for text in texts],
+        [
+            {"documentId": f"doc-{text[4]}", "title": text.split("\n")[0]}
+            for text in texts
+        ],
+    )
+    return store
+
+
+def test_results_are_grouped_per_document(vector_store, embeddings):
+    results, has_more = search_documents(vector_store, embeddings, "query", k=2)
+
+    assert [result.documentId for result in results] == ["doc-1", "doc-2"]
+    assert [content for content, _ in results[0].chunks] == ["first", "second"]
+    assert results[0].to_dict()["content"] == "first"
+    assert has_more
+
+
+def test_min_score_and_pagination(vector_store, embeddings):
+    results, has_more = search_documents(
+        vector_store, embeddings, "query", k=1, offset=1, min_score=0.8
+    )
+
+    # doc-3 scores (0 + 1) / 2 = 0.5 and is dropped
+    assert [result.documentId for result in results] == ["doc-2"]
+    assert not has_more
+
+
+def test_min_score_applies_to_vector_matches_only(vector_store, embeddings):
+    bm25_index = BM25Index()
+    bm25_index.add(
+        "doc-3-a", "Doc 3\nquery terms", {"documentId": "doc-3", "title": "Doc 3"}
+    )
+
+    results, _ = search_documents(
+        vector_store, embeddings, "query", k=5, min_score=0.8, bm25_index=bm25_index
+    )
+
+    # The vector match of doc-3 is dropped, its BM25 match is kept without a score
+    assert {result.documentId for result in results} == {"doc-1", "doc-2", "doc-3"}
+    doc_3 = next(result for result in results if result.documentId == "doc-3")
+    assert doc_3.chunks == [("query terms", None)]
+    assert doc_3.to_dict()["score"] is None
+
+
+def test_mmr_prefers_diverse_sections(vector_store, embeddings):
+    results, _ = search_documents(vector_store, embeddings, "query", k=3)
+    assert [result.documentId for result in results] == ["doc-1", "doc-2", "doc-3"]
+
+    results, _ = search_documents(
+        vector_store, embeddings, "query", k=3, mmr=True, lambda_mult=0.3
+    )
+
+    # doc-2 points in a similar direction as doc-1, the unrelated doc-3 adds more
+    assert [result.documentId for result in results] == ["doc-1", "doc-3", "doc-2"]
+    # Candidate vectors are read from the store instead of being embedded again
+    embeddings.embed_documents.assert_not_called()
+
+
+def test_mmr_embeds_only_sections_without_stored_vectors(vector_store, embeddings):
+    bm25_index = BM25Index()
+    bm25_index.add("bm25-only", "Doc 4\nquery notes", {"documentId": "doc-4", "title": "Doc 4"})
+    embeddings.embed_documents = Mock(side_effect=lambda texts: [[0.5, 0.5, 0.0]] * len(texts))
+
+    results, _ = search_documents(
+        vector_store, embeddings, "query", k=4, mmr=True, lambda_mult=0.3,
+        bm25_index=bm25_index,
+    )
+
+    embeddings.embed_documents.assert_called_once_with(["Doc 4\nquery notes"])
+    assert {result.documentId for result in results} == {"doc-1", "doc-2", "doc-3", "doc-4"}
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(6)) == 6
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
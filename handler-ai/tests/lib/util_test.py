@@ -0,0 +1,121 @@
+import os
+from unittest.mock import Mock
+
+import pytest
+
+from rocketnotes_handler.lib import local_embeddings
+from rocketnotes_handler.lib.model import UserConfig
+from rocketnotes_handler.lib.util import (create_embeddings_model,
+                                          get_chat_model, get_http_client,
+                                          invalidate_user_config,
+                                          load_search_user_config,
+                                          load_user_config, model_client_cache,
+                                          user_config_cache_stats,
+                                          versioned_embeddings_model)
+
+
+def user_config_item(embeddingModel="text-embedding-3-small"):
+    return {
+        "Item": {
+            "id": {"S": "user-1"},
+            "embeddingModel": {"S": embeddingModel},
+            "openAiApiKey": {"S": "sk-test"},
+        }
+    }
+
+
+def test_user_config_is_cached_until_invalidated():
+    dynamodb = Mock()
+    dynamodb.get_item = Mock(return_value=user_config_item())
+
+    user_config = load_user_config(dynamodb, "user-1")
+    assert user_config.embeddingsModel == "text-embedding-3-small"
+    assert load_user_config(dynamodb, "user-1") is user_config
+    dynamodb.get_item.assert_called_once()
+    assert user_config_cache_stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+    dynamodb.get_item.return_value = user_config_item("voyage-3")
+    invalidate_user_config("user-1")
+
+    assert load_user_config(dynamodb, "user-1").embeddingsModel == "voyage-3"
+    assert dynamodb.get_item.call_count == 2
+
+
+def test_search_reloads_user_config_of_a_recreated_index():
+    index_item = {"Item": {"embeddingsModel": {"S": "text-embedding-3-small"}}}
+    tables = {
+        "tnn-UserConfig": user_config_item(),
+        "tnn-Vectors": index_item,
+    }
+    dynamodb = Mock()
+    dynamodb.get_item = Mock(side_effect=lambda TableName, Key: tables[TableName])
+
+    load_user_config(dynamodb, "user-1")
+    assert load_search_user_config(dynamodb, "user-1").embeddingsModel == (
+        "text-embedding-3-small"
+    )
+
+    # The worker recreated the index after the model changed, the cached
+    # UserConfig is outdated
+    tables["tnn-UserConfig"] = user_config_item("voyage-3")
+    index_item["Item"]["embeddingsModel"]["S"] = "voyage-3"
+
+    assert load_search_user_config(dynamodb, "user-1").embeddingsModel == "voyage-3"
+    assert load_user_config(dynamodb, "user-1").embeddingsModel == "voyage-3"
+
+
+def test_unknown_users_are_not_cached():
+    dynamodb = Mock()
+    dynamodb.get_item = Mock(return_value={})
+
+    assert load_user_config(dynamodb, "unknown") is None
+    assert load_user_config(dynamodb, "unknown") is None
+    assert dynamodb.get_item.call_count == 2
+
+
+def test_model_clients_are_reused_per_api_key(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    model_client_cache.clear()
+
+    def user_config(api_key):
+        return UserConfig(
+            id="user-1",
+            embeddingsModel="text-embedding-3-small",
+            llm="gpt-4o-mini",
+            openAiApiKey=api_key,
+        )
+
+    embeddings = create_embeddings_model(user_config("sk-one"))
+    chat_model = get_chat_model(user_config("sk-one"))
+
+    assert create_embeddings_model(user_config("sk-one")) is embeddings
+    assert get_chat_model(user_config("sk-one")) is chat_model
+    assert create_embeddings_model(user_config("sk-two")) is not embeddings
+    assert embeddings.openai_api_key.get_secret_value() == "sk-one"
+    # Keys are passed to the clients, never through the environment
+    assert "OPENAI_API_KEY" not in os.environ
+    # All OpenAI compatible clients share one keep-alive connection pool
+    assert embeddings.http_client is chat_model.http_client is get_http_client()
+    model_client_cache.clear()
+
+
+def test_missing_api_key_raises():
+    with pytest.raises(ValueError):
+        create_embeddings_model(UserConfig(id="user-1", embeddingsModel="voyage-3"))
+
+
+def test_models_with_changed_vectors_are_versioned():
+    assert versioned_embeddings_model("text-embedding-3-small") == "text-embedding-3-small"
+    # /api/embed vectors are normalized, cached /api/embeddings vectors are not reused
+    assert versioned_embeddings_model("Ollama-nomic-embed-text") == "Ollama-nomic-embed-text@v2"
+
+
+def test_local_model_is_versioned_by_backend(monkeypatch):
+    assert versioned_embeddings_model("Sentence-Transformers") == "Sentence-Transformers"
+
+    # int8 ONNX vectors are neither cached nor indexed with the torch ones
+    monkeypatch.setattr(local_embeddings, "sentence_transformers_backend", "onnx")
+    monkeypatch.setattr(local_embeddings, "onnx_quantization", "avx512_vnni")
+    assert versioned_embeddings_model("Sentence-Transformers") == (
+        "Sentence-Transformers@onnx-qint8-avx512_vnni"
+    )
@@ -0,0 +1,156 @@
+from unittest.mock import Mock, patch
+
+from langchain_aws.vectorstores.s3_vectors import AmazonS3Vectors
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from rocketnotes_handler.lib import vector_store_factory
+from rocketnotes_handler.lib.numpy_vector_store import NumpyVectorStore
+from rocketnotes_handler.lib.vector_store_factory import (
+    delete_document_vectors, delete_documents_vectors, get_stored_vectors,
+    get_vector_store_factory, invalidate_vector_stores)
+
+
+def test_delete_document_vectors_by_ids():
+    vector_store = Mock()
+
+    delete_document_vectors("doc-1", vector_store, ["doc-1-a", "doc-1-b"])
+
+    vector_store.delete.assert_called_once_with(ids=["doc-1-a", "doc-1-b"])
+
+
+def test_delete_document_vectors_without_ids_never_deletes_the_index():
+    vector_store = Mock()
+
+    delete_document_vectors("doc-1", vector_store, [])
+
+    vector_store.delete.assert_not_called()
+
+
+def test_delete_s3_document_vectors_without_manifest_scans_the_index():
+    vector_store = Mock(spec=AmazonS3Vectors)
+    vector_store.vector_bucket_name = "bucket"
+    vector_store.index_name = "user"
+    vector_store.client = Mock()
+    vector_store.client.list_vectors = Mock(side_effect=[
+        {
+            "vectors": [
+                {"key": "a", "metadata": {"documentId": "doc-1"}},
+                {"key": "b", "metadata": {"documentId": "doc-2"}},
+            ],
+            "nextToken": "next",
+        },
+        {"vectors": [{"key": "c", "metadata": {"documentId": "doc-1"}}]},
+    ])
+
+    delete_document_vectors("doc-1", vector_store)
+
+    vector_store.delete.assert_called_once_with(ids=["a", "c"])
+    assert vector_store.client.list_vectors.call_args_list[1][1]["nextToken"] == "next"
+
+
+def test_delete_vectors_of_several_s3_documents_scans_the_index_once():
+    vector_store = Mock(spec=AmazonS3Vectors)
+    vector_store.vector_bucket_name = "bucket"
+    vector_store.index_name = "user"
+    vector_store.client = Mock()
+    vector_store.client.list_vectors = Mock(return_value={
+        "vectors": [
+            {"key": "a", "metadata": {"documentId": "doc-1"}},
+            {"key": "b", "metadata": {"documentId": "doc-2"}},
+            {"key": "c", "metadata": {"documentId": "doc-3"}},
+        ],
+    })
+
+    delete_documents_vectors(["doc-1", "doc-3"], vector_store)
+
+    vector_store.client.list_vectors.assert_called_once()
+    vector_store.delete.assert_called_once_with(ids=["a", "c"])
+
+
+def test_stored_s3_vectors_are_read_with_their_data():
+    vector_store = Mock(spec=AmazonS3Vectors)
+    vector_store.vector_bucket_name = "bucket"
+    vector_store.index_name = "user"
+    vector_store.data_type = "float32"
+    vector_store.client = Mock()
+    vector_store.client.get_vectors.return_value = {
+        "vectors": [{"key": "a", "data": {"float32": [0.1, 0.2]}}],
+    }
+
+    vectors = get_stored_vectors(vector_store, ["a", "missing"])
+
+    assert vectors == {"a": [0.1, 0.2]}
+    assert vector_store.client.get_vectors.call_args[1]["returnData"] is True
+
+
+@patch("rocketnotes_handler.lib.vector_store_factory.get_s3_vectors_client", Mock())
+def test_vector_stores_are_cached_per_user_and_model():
+    invalidate_vector_stores()
+    embeddings = Mock(model="text-embedding-3-small")
+    other_embeddings = Mock(model="text-embedding-3-small")
+
+    vector_store = get_vector_store_factory("user-1", embeddings)
+
+    assert get_vector_store_factory("user-1", other_embeddings) is vector_store
+    # The cached store embeds queries with the caller's embeddings
+    assert vector_store.embeddings is other_embeddings
+    assert get_vector_store_factory("user-2", embeddings) is not vector_store
+    assert get_vector_store_factory("user-1", Mock(model="voyage-3")) is not vector_store
+
+    invalidate_vector_stores("user-1")
+    assert get_vector_store_factory("user-1", embeddings) is not vector_store
+    invalidate_vector_stores()
+
+
+def test_chroma_client_remembers_responding_host():
+    chromadb = Mock()
+    clients = {}
+
+    def http_client(host, port, settings):
+        client = Mock()
+        if host != "chroma":
+            client.heartbeat.side_effect = Exception("connection refused")
+        clients[host] = client
+        return client
+
+    chromadb.HttpClient = Mock(side_effect=http_client)
+    with patch.object(vector_store_factory, "chromadb", chromadb), \
+            patch.object(vector_store_factory, "Settings", Mock()), \
+            patch.object(vector_store_factory, "_chroma_client", None), \
+            patch.object(vector_store_factory, "_chroma_host", None):
+        client = vector_store_factory.get_chroma_client()
+        assert client is clients["chroma"]
+        assert vector_store_factory.get_chroma_client() is client
+
+        vector_store_factory.reset_chroma_client()
+        chromadb.HttpClient.reset_mock()
+        vector_store_factory.get_chroma_client()
+        assert chromadb.HttpClient.call_args_list[0][1]["host"] == "chroma"
+        assert chromadb.HttpClient.call_count == 1
+
+
+def test_numpy_backend_is_persisted_per_user(tmp_path):
+    invalidate_vector_stores()
+    with patch.object(vector_store_factory, "vector_store_backend", "numpy"), \
+            patch.object(vector_store_factory, "vector_store_path", str(tmp_path)):
+        vector_store = get_vector_store_factory("user-1", Mock(model="test-model"))
+
+    assert isinstance(vector_store, NumpyVectorStore)
+    assert vector_store.path == str(tmp_path / "user-1")
+    invalidate_vector_stores()
+
+
+def test_cached_numpy_store_reloads_after_another_process_writes(tmp_path):
+    invalidate_vector_stores()
+    embeddings = DeterministicFakeEmbedding(size=16)
+    with patch.object(vector_store_factory, "vector_store_backend", "numpy"), \
+            patch.object(vector_store_factory, "vector_store_path", str(tmp_path)):
+        reader = get_vector_store_factory("user-1", embeddings)
+        # The embeddings worker runs in a separate process with its own store
+        writer = NumpyVectorStore(embeddings, path=str(tmp_path / "user-1"))
+        writer.add_texts(["alpha"], [{"documentId": "doc-1"}], ids=["a"])
+
+        assert get_vector_store_factory("user-1", embeddings) is reader
+        assert reader.get_by_ids(["a"])[0].page_content == "alpha"
+        assert reader.reload_if_changed() is False
+    invalidate_vector_stores()
@@ -33,6 +33,7 @@ def mock_user_config():
     config.embeddingsModel = "openai"
     config.llm = "gpt-3.5-turbo"
     config.id = "test-user"
+    config.vectorQuantization = None
     return config
 
 
@@ -77,7 +78,7 @@ class TestChatHandler:
     @patch('rocketnotes_handler.handler_chat.main.ConversationalRetrievalChain')
     @patch('rocketnotes_handler.handler_chat.main.get_chat_model')
     @patch('rocketnotes_handler.handler_chat.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_chat.main.get_user_config')
+    @patch('rocketnotes_handler.handler_chat.main.load_search_user_config')
     @patch('rocketnotes_handler.handler_chat.main.get_vector_store_factory')
     def test_successful_chat(self, mock_get_vector_store_factory, mock_get_user_config,
                            mock_get_embeddings, mock_get_chat_model, mock_chain_class,
@@ -123,7 +124,9 @@ class TestChatHandler:
         assert response_body == "The main topic is artificial intelligence and machine learning."
 
         # Verify vector store factory was called correctly
-        mock_get_vector_store_factory.assert_called_once_with("test-user", mock_embeddings)
+        mock_get_vector_store_factory.assert_called_once_with(
+            "test-user", mock_embeddings, quantization=None
+        )
 
         # Verify retriever was configured correctly
         mock_vector_store.as_retriever.assert_called_once_with(
@@ -217,7 +220,7 @@ class TestChatHandler:
         'AWS_SECRET_ACCESS_KEY': 'testing',
         'AWS_SESSION_TOKEN': 'testing'
     })
-    @patch('rocketnotes_handler.handler_chat.main.get_user_config')
+    @patch('rocketnotes_handler.handler_chat.main.load_search_user_config')
     def test_missing_embeddings_model(self, mock_get_user_config, sample_chat_event):
         """Test error handling when embeddings model is missing"""
         # Setup DynamoDB
@@ -252,7 +255,7 @@ class TestChatHandler:
         'AWS_SESSION_TOKEN': 'testing'
     })
     @patch('rocketnotes_handler.handler_chat.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_chat.main.get_user_config')
+    @patch('rocketnotes_handler.handler_chat.main.load_search_user_config')
     def test_missing_llm_model(self, mock_get_user_config, mock_get_embeddings,
                               mock_embeddings, sample_chat_event):
         """Test error handling when LLM model is missing"""
@@ -292,7 +295,7 @@ class TestChatHandler:
     @patch('rocketnotes_handler.handler_chat.main.ConversationalRetrievalChain')
     @patch('rocketnotes_handler.handler_chat.main.get_chat_model')
     @patch('rocketnotes_handler.handler_chat.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_chat.main.get_user_config')
+    @patch('rocketnotes_handler.handler_chat.main.load_search_user_config')
     @patch('rocketnotes_handler.handler_chat.main.get_vector_store_factory')
     def test_with_vector_bucket_name_env(self, mock_get_vector_store_factory, mock_get_user_config,
                                       mock_get_embeddings, mock_get_chat_model, mock_chain_class,
@@ -339,7 +342,9 @@ class TestChatHandler:
         result = handler(event, {})
 
         # Verify vector store factory was called correctly
-        mock_get_vector_store_factory.assert_called_once_with("test-user", mock_embeddings)
+        mock_get_vector_store_factory.assert_called_once_with(
+            "test-user", mock_embeddings, quantization=None
+        )
 
     @mock_aws
     @patch.dict(os.environ, {
@@ -353,7 +358,7 @@ class TestChatHandler:
     @patch('rocketnotes_handler.handler_chat.main.ConversationalRetrievalChain')
     @patch('rocketnotes_handler.handler_chat.main.get_chat_model')
     @patch('rocketnotes_handler.handler_chat.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_chat.main.get_user_config')
+    @patch('rocketnotes_handler.handler_chat.main.load_search_user_config')
     @patch('rocketnotes_handler.handler_chat.main.get_vector_store_factory')
     def test_with_bucket_name_fallback_env(self, mock_get_vector_store_factory, mock_get_user_config,
                                          mock_get_embeddings, mock_get_chat_model, mock_chain_class,
@@ -400,7 +405,9 @@ class TestChatHandler:
         result = handler(event, {})
 
         # Verify vector store factory was called correctly
-        mock_get_vector_store_factory.assert_called_once_with("test-user", mock_embeddings)
+        mock_get_vector_store_factory.assert_called_once_with(
+            "test-user", mock_embeddings, quantization=None
+        )
 
 
 if __name__ == "__main__":
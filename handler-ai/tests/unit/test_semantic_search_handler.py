@@ -9,6 +9,7 @@ from langchain.schema import Document
 
 # Import the handler
 from rocketnotes_handler.handler_semantic_search.main import handler
+from rocketnotes_handler.lib.bm25 import BM25Index, BM25IndexStore
 
 
 @pytest.fixture
@@ -26,6 +27,7 @@ def mock_user_config():
     config = Mock()
     config.embeddingsModel = "openai"
     config.id = "test-user"
+    config.vectorQuantization = None
     return config
 
 
@@ -57,7 +59,15 @@ def mock_search_results():
     }
     result2.page_content = "Test Document 2\nThis is the content of document 2"
 
-    return [result1, result2]
+    return [(result1, 0.9), (result2, 0.8)]
+
+
+def create_mock_vector_store(results):
+    """Mock vector store whose scores are already relevance scores"""
+    vector_store = Mock()
+    vector_store.similarity_search_with_score.return_value = results
+    vector_store._select_relevance_score_fn.return_value = lambda score: score
+    return vector_store
 
 
 class TestSemanticSearchHandler:
@@ -73,7 +83,7 @@ class TestSemanticSearchHandler:
         'AWS_SESSION_TOKEN': 'testing'
     })
     @patch('rocketnotes_handler.handler_semantic_search.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_semantic_search.main.get_user_config')
+    @patch('rocketnotes_handler.handler_semantic_search.main.load_search_user_config')
     @patch('rocketnotes_handler.handler_semantic_search.main.get_vector_store_factory')
     def test_successful_semantic_search(self, mock_get_vector_store_factory, mock_get_user_config,
                                       mock_get_embeddings, mock_embeddings, mock_user_config,
@@ -123,8 +133,7 @@ class TestSemanticSearchHandler:
         # Setup mocks
         mock_get_user_config.return_value = mock_user_config
         mock_get_embeddings.return_value = mock_embeddings
-        mock_vector_store = Mock()
-        mock_vector_store.similarity_search.return_value = mock_search_results
+        mock_vector_store = create_mock_vector_store(mock_search_results)
         mock_get_vector_store_factory.return_value = mock_vector_store
 
         # Execute
@@ -148,8 +157,165 @@ class TestSemanticSearchHandler:
         assert response_body[1]["content"] == "This is the content of document 2"
 
         # Verify vector store factory was called correctly
-        mock_get_vector_store_factory.assert_called_once_with("test-user", mock_embeddings)
-        mock_vector_store.similarity_search.assert_called_once_with("test search query", k=3)
+        mock_get_vector_store_factory.assert_called_once_with(
+            "test-user", mock_embeddings, quantization=None
+        )
+        # Enough sections are fetched to fill k documents
+        mock_vector_store.similarity_search_with_score.assert_called_once_with(
+            "test search query", k=16
+        )
+        assert response_body[0]["score"] == 0.9
+        assert result["headers"] == {}
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_semantic_search.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_semantic_search.main.load_search_user_config')
+    @patch('rocketnotes_handler.handler_semantic_search.main.get_vector_store_factory')
+    def test_hybrid_search_with_bm25_index(self, mock_get_vector_store_factory, mock_get_user_config,
+                                           mock_get_embeddings, mock_embeddings, mock_user_config,
+                                           mock_search_results):
+        """Test that lexical matches are fused with vector results once a BM25 index exists"""
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        dynamodb.create_table(
+            TableName='tnn-UserConfig',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+
+        bm25_index = BM25Index()
+        bm25_index.add("doc-789-a", "Error codes\nERR_4711 is raised on timeout",
+                       {"documentId": "doc-789", "title": "Error codes"})
+        store = BM25IndexStore("test-user")
+        store.replace(bm25_index)
+        store.save()
+
+        mock_get_user_config.return_value = mock_user_config
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_vector_store = create_mock_vector_store(mock_search_results)
+        mock_get_vector_store_factory.return_value = mock_vector_store
+
+        event = {"body": json.dumps({"userId": "test-user", "searchString": "ERR_4711"})}
+        result = handler(event, {})
+
+        assert result["statusCode"] == 200
+        response_body = json.loads(result["body"])
+        assert len(response_body) == 3
+        lexical_result = next(r for r in response_body if r["documentId"] == "doc-789")
+        assert lexical_result["content"] == "ERR_4711 is raised on timeout"
+        # Sections only found by BM25 have no vector score
+        assert lexical_result["score"] is None
+        # More vector candidates are fetched for the fusion
+        assert mock_vector_store.similarity_search_with_score.call_args[1]["k"] > 3
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_semantic_search.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_semantic_search.main.load_search_user_config')
+    @patch('rocketnotes_handler.handler_semantic_search.main.get_vector_store_factory')
+    def test_paging_and_min_score(self, mock_get_vector_store_factory, mock_get_user_config,
+                                  mock_get_embeddings, mock_embeddings, mock_user_config,
+                                  mock_search_results):
+        """Test that k, cursor and minScore select the requested page of documents"""
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        dynamodb.create_table(
+            TableName='tnn-UserConfig',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+
+        mock_get_user_config.return_value = mock_user_config
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_get_vector_store_factory.return_value = create_mock_vector_store(mock_search_results)
+
+        def search(**params):
+            body = {"userId": "test-user", "searchString": "test search query", **params}
+            return handler({"body": json.dumps(body)}, {})
+
+        result = search(k=1)
+        assert [r["documentId"] for r in json.loads(result["body"])] == ["doc-123"]
+        cursor = result["headers"]["X-Next-Cursor"]
+
+        result = search(k=1, cursor=cursor)
+        assert [r["documentId"] for r in json.loads(result["body"])] == ["doc-456"]
+        assert "X-Next-Cursor" not in result["headers"]
+
+        result = search(minScore=0.85)
+        assert [r["documentId"] for r in json.loads(result["body"])] == ["doc-123"]
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_semantic_search.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_semantic_search.main.load_search_user_config')
+    @patch('rocketnotes_handler.handler_semantic_search.main.get_vector_store_factory')
+    def test_batch_of_search_strings(self, mock_get_vector_store_factory, mock_get_user_config,
+                                     mock_get_embeddings, mock_embeddings, mock_user_config,
+                                     mock_search_results):
+        """Test that a list of searchStrings is embedded once and answered per query"""
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        dynamodb.create_table(
+            TableName='tnn-UserConfig',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+
+        mock_get_user_config.return_value = mock_user_config
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_vector_store = create_mock_vector_store(mock_search_results)
+        mock_get_vector_store_factory.return_value = mock_vector_store
+
+        event = {"body": json.dumps({
+            "userId": "test-user",
+            "searchStrings": ["first query", "second query"],
+            "k": 1,
+        })}
+        result = handler(event, {})
+
+        assert result["statusCode"] == 200
+        response_body = json.loads(result["body"])
+        assert [r["searchString"] for r in response_body] == ["first query", "second query"]
+        for query_result in response_body:
+            assert [r["documentId"] for r in query_result["results"]] == ["doc-123"]
+            assert query_result["nextCursor"] is not None
+        mock_embeddings.embed_queries.assert_called_once_with(["first query", "second query"])
+        # Config, embeddings and vector store are set up once for the batch
+        mock_get_vector_store_factory.assert_called_once()
+        assert mock_vector_store.similarity_search_with_score.call_count == 2
+
+    def test_invalid_search_params(self):
+        """Test error handling of out of range parameters"""
+        for params in [{"k": 0}, {"k": 1000}, {"offset": -1}, {"cursor": "invalid"},
+                       {"mmrLambda": 2}, {"searchStrings": []},
+                       {"searchStrings": "query"}, {"searchStrings": ["q"] * 100}]:
+            body = {"userId": "test-user", "searchString": "query", **params}
+
+            result = handler({"body": json.dumps(body)}, {})
+
+            assert result["statusCode"] == 400
 
     def test_missing_body(self):
         """Test error handling when request body is missing"""
@@ -230,7 +396,7 @@ class TestSemanticSearchHandler:
         'AWS_SECRET_ACCESS_KEY': 'testing',
         'AWS_SESSION_TOKEN': 'testing'
     })
-    @patch('rocketnotes_handler.handler_semantic_search.main.get_user_config')
+    @patch('rocketnotes_handler.handler_semantic_search.main.load_search_user_config')
     def test_missing_embeddings_model(self, mock_get_user_config, sample_search_event):
         """Test error handling when embeddings model is missing"""
         # Setup DynamoDB
@@ -265,7 +431,7 @@ class TestSemanticSearchHandler:
         'AWS_SESSION_TOKEN': 'testing'
     })
     @patch('rocketnotes_handler.handler_semantic_search.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_semantic_search.main.get_user_config')
+    @patch('rocketnotes_handler.handler_semantic_search.main.load_search_user_config')
     @patch('rocketnotes_handler.handler_semantic_search.main.get_vector_store_factory')
     def test_empty_search_results(self, mock_get_vector_store_factory, mock_get_user_config,
                                  mock_get_embeddings, mock_embeddings, mock_user_config,
@@ -289,8 +455,7 @@ class TestSemanticSearchHandler:
         # Setup mocks
         mock_get_user_config.return_value = mock_user_config
         mock_get_embeddings.return_value = mock_embeddings
-        mock_vector_store = Mock()
-        mock_vector_store.similarity_search.return_value = []  # Empty results
+        mock_vector_store = create_mock_vector_store([])
         mock_get_vector_store_factory.return_value = mock_vector_store
 
         # Execute
@@ -311,7 +476,7 @@ class TestSemanticSearchHandler:
         'AWS_SESSION_TOKEN': 'testing'
     })
     @patch('rocketnotes_handler.handler_semantic_search.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_semantic_search.main.get_user_config')
+    @patch('rocketnotes_handler.handler_semantic_search.main.load_search_user_config')
     @patch('rocketnotes_handler.handler_semantic_search.main.get_vector_store_factory')
     def test_with_vector_bucket_name_env(self, mock_get_vector_store_factory, mock_get_user_config,
                                       mock_get_embeddings, mock_embeddings, mock_user_config):
@@ -334,8 +499,7 @@ class TestSemanticSearchHandler:
         # Setup mocks
         mock_get_user_config.return_value = mock_user_config
         mock_get_embeddings.return_value = mock_embeddings
-        mock_vector_store = Mock()
-        mock_vector_store.similarity_search.return_value = []
+        mock_vector_store = create_mock_vector_store([])
         mock_get_vector_store_factory.return_value = mock_vector_store
 
         # Test event
@@ -350,7 +514,9 @@ class TestSemanticSearchHandler:
         result = handler(event, {})
 
         # Verify vector store factory was called correctly
-        mock_get_vector_store_factory.assert_called_once_with("test-user", mock_embeddings)
+        mock_get_vector_store_factory.assert_called_once_with(
+            "test-user", mock_embeddings, quantization=None
+        )
 
     @mock_aws
     @patch.dict(os.environ, {
@@ -362,7 +528,7 @@ class TestSemanticSearchHandler:
         'AWS_SESSION_TOKEN': 'testing'
     })
     @patch('rocketnotes_handler.handler_semantic_search.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_semantic_search.main.get_user_config')
+    @patch('rocketnotes_handler.handler_semantic_search.main.load_search_user_config')
     @patch('rocketnotes_handler.handler_semantic_search.main.get_vector_store_factory')
     def test_with_bucket_name_fallback_env(self, mock_get_vector_store_factory, mock_get_user_config,
                                          mock_get_embeddings, mock_embeddings, mock_user_config):
@@ -385,8 +551,7 @@ class TestSemanticSearchHandler:
         # Setup mocks
         mock_get_user_config.return_value = mock_user_config
         mock_get_embeddings.return_value = mock_embeddings
-        mock_vector_store = Mock()
-        mock_vector_store.similarity_search.return_value = []
+        mock_vector_store = create_mock_vector_store([])
         mock_get_vector_store_factory.return_value = mock_vector_store
 
         # Test event
@@ -401,7 +566,9 @@ class TestSemanticSearchHandler:
         result = handler(event, {})
 
         # Verify vector store factory was called correctly
-        mock_get_vector_store_factory.assert_called_once_with("test-user", mock_embeddings)
+        mock_get_vector_store_factory.assert_called_once_with(
+            "test-user", mock_embeddings, quantization=None
+        )
 
 
 if __name__ == "__main__":
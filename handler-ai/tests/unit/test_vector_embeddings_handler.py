@@ -6,12 +6,30 @@ from moto import mock_aws
 
 import boto3
 from langchain.schema import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
 
 # Import the handler
 from rocketnotes_handler.handler_vector_embeddings.main import (
+    create_reindex_executor,
     handler,
+    recreate_index,
     split_document
 )
+from rocketnotes_handler.lib.bm25 import BM25Index, BM25IndexStore
+from rocketnotes_handler.lib.embedding_executor import EmbeddingExecutor
+from rocketnotes_handler.lib.numpy_vector_store import NumpyVectorStore
+from rocketnotes_handler.lib.chunker import MarkdownChunker
+from rocketnotes_handler.lib.embedding import estimate_tokens
+from rocketnotes_handler.lib.manifest import (chunk_vector_id,
+                                              document_content_hash,
+                                              hash_content)
+from rocketnotes_handler.lib.embedding_cache import CachedEmbeddings
+from rocketnotes_handler.lib.model import UserConfig
+from rocketnotes_handler.lib.util import versioned_embeddings_model
+
+
+# Long enough that sections are not merged by the chunker
+SECTION_TEXT = "This is test content with enough words to be embedded as its own section. " * 3
 
 
 @pytest.fixture
@@ -29,6 +47,7 @@ def mock_user_config():
     config = Mock()
     config.embeddingsModel = "openai"
     config.id = "test-user"
+    config.vectorQuantization = None
     return config
 
 
@@ -38,7 +57,7 @@ def sample_document():
     return {
         "id": {"S": "doc-123"},
         "title": {"S": "Test Document"},
-        "content": {"S": "# Header 1\nThis is test content.\n## Header 2\nMore content here."},
+        "content": {"S": f"# Header 1\n{SECTION_TEXT}\n## Header 2\nMore content here. {SECTION_TEXT}"},
         "userId": {"S": "test-user"}
     }
 
@@ -63,7 +82,7 @@ class TestDocumentOperations:
 
     def test_split_document(self):
         """Test document splitting functionality"""
-        content = "# Header 1\nContent 1\n## Header 2\nContent 2"
+        content = f"# Header 1\n{SECTION_TEXT}\n## Header 2\n{SECTION_TEXT}"
         doc_id = "doc-123"
         title = "Test Doc"
 
@@ -79,6 +98,60 @@ class TestDocumentOperations:
             assert "title" in doc.metadata
             assert len(doc.metadata) == 2  # documentId and title should be present
 
+    def test_split_document_merges_tiny_sections(self):
+        """Test that tiny adjacent sections are merged into one chunk"""
+        content = "# Header 1\nContent 1\n## Header 2\nContent 2"
+
+        result = split_document(content, "doc-123", "Test Doc")
+
+        assert len(result) == 1
+        assert "Content 1" in result[0].page_content
+        assert "Content 2" in result[0].page_content
+
+    def test_split_document_bounds_large_sections(self):
+        """Test that sections above the token limit are split further"""
+        chunker = MarkdownChunker(target_tokens=50, max_tokens=100)
+        content = "# Header 1\n" + "\n\n".join([SECTION_TEXT] * 10)
+
+        result = split_document(content, "doc-123", "Test Doc", chunker)
+
+        assert len(result) > 1
+        assert all(estimate_tokens(doc.page_content) <= 100 for doc in result)
+
+
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_process_pool_embeddings')
+    def test_reindex_executor_uses_process_pool(self, mock_get_process_pool_embeddings,
+                                                 mock_embeddings):
+        """Test that local models are embedded on the worker pool during reindex"""
+        pool_embeddings = Mock(max_workers=4)
+        mock_get_process_pool_embeddings.return_value = pool_embeddings
+        user_config = UserConfig(id="test-user", embeddingsModel="Sentence-Transformers")
+
+        executor = create_reindex_executor(user_config, mock_embeddings)
+
+        assert executor.embeddings.underlying is pool_embeddings
+        assert executor.concurrency.max_concurrency == 4
+
+        mock_get_process_pool_embeddings.return_value = None
+        executor = create_reindex_executor(user_config, mock_embeddings)
+
+        assert executor.embeddings is mock_embeddings
+
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_process_pool_embeddings')
+    def test_reindex_executor_caches_by_versioned_model(self, mock_get_process_pool_embeddings,
+                                                        mock_embeddings):
+        """Test that the process pool shares cache keys with get_embeddings_model"""
+        mock_get_process_pool_embeddings.return_value = Mock(max_workers=2)
+        user_config = UserConfig(id="test-user", embeddingsModel="Ollama-nomic-embed-text")
+
+        executor = create_reindex_executor(user_config, mock_embeddings)
+
+        # Vectors cached from the unnormalized /api/embeddings endpoint are not reused
+        assert executor.embeddings.model == "Ollama-nomic-embed-text@v2"
+        assert executor.embeddings._key("text", "document") == CachedEmbeddings(
+            Mock(), model=versioned_embeddings_model("Ollama-nomic-embed-text")
+        )._key("text", "document")
+
 
 class TestVectorEmbeddingsHandler:
     """Test the main handler function"""
@@ -93,7 +166,7 @@ class TestVectorEmbeddingsHandler:
         'AWS_SESSION_TOKEN': 'testing'
     })
     @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
     @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
     def test_delete_vectors_scenario(self, mock_get_vector_store_factory, mock_get_user_config,
                                    mock_get_embeddings, mock_embeddings, mock_user_config):
@@ -107,6 +180,13 @@ class TestVectorEmbeddingsHandler:
             BillingMode='PAY_PER_REQUEST'
         )
 
+        dynamodb.create_table(
+            TableName='tnn-Vectors',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
         # Add user config
         dynamodb.put_item(
             TableName='tnn-UserConfig',
@@ -136,7 +216,9 @@ class TestVectorEmbeddingsHandler:
         # Verify
         assert result["statusCode"] == 200
         # Verify vector store factory was called
-        mock_get_vector_store_factory.assert_called_once_with("test-user", mock_embeddings)
+        mock_get_vector_store_factory.assert_called_once_with(
+            "test-user", mock_embeddings, quantization=None
+        )
 
     @mock_aws
     @patch.dict(os.environ, {
@@ -148,7 +230,60 @@ class TestVectorEmbeddingsHandler:
         'AWS_SESSION_TOKEN': 'testing'
     })
     @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_failed_vector_delete_is_retried(self, mock_get_vector_store_factory,
+                                             mock_get_user_config, mock_get_embeddings,
+                                             mock_embeddings, mock_user_config):
+        """Test that a failed delete keeps the manifest and returns the message"""
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        for table_name in ['tnn-UserConfig', 'tnn-Vectors']:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+        dynamodb.put_item(TableName='tnn-Vectors', Item={
+            'id': {'S': 'doc-123'},
+            'userId': {'S': 'test-user'},
+            'chunks': {'M': {'hash-a': {'S': 'doc-123-a'}}},
+        })
+
+        mock_get_user_config.return_value = mock_user_config
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_vector_store = Mock()
+        mock_vector_store.delete.side_effect = Exception("Service unavailable")
+        mock_get_vector_store_factory.return_value = mock_vector_store
+
+        event = {
+            "Records": [{
+                "messageId": "message-1",
+                "body": json.dumps({
+                    "userId": "test-user",
+                    "documentId": "doc-123",
+                    "deleteVectors": True
+                })
+            }]
+        }
+        result = handler(event, {})
+
+        assert result["batchItemFailures"] == [{"itemIdentifier": "message-1"}]
+        manifest = dynamodb.get_item(TableName='tnn-Vectors', Key={'id': {'S': 'doc-123'}})
+        assert "Item" in manifest
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'VECTOR_BUCKET_NAME': 'test-vector-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
     @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
     def test_update_document_scenario(self, mock_get_vector_store_factory, mock_get_user_config,
                                     mock_get_embeddings, mock_embeddings, mock_user_config,
@@ -172,6 +307,13 @@ class TestVectorEmbeddingsHandler:
             BillingMode='PAY_PER_REQUEST'
         )
 
+        dynamodb.create_table(
+            TableName='tnn-Vectors',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
         # Add data
         dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
         dynamodb.put_item(TableName='tnn-Documents', Item=sample_document)
@@ -199,7 +341,9 @@ class TestVectorEmbeddingsHandler:
         # Verify
         assert result["statusCode"] == 200
         # Verify vector store factory was called
-        mock_get_vector_store_factory.assert_called_once_with("test-user", mock_embeddings)
+        mock_get_vector_store_factory.assert_called_once_with(
+            "test-user", mock_embeddings, quantization=None
+        )
 
     @mock_aws
     @patch.dict(os.environ, {
@@ -211,9 +355,9 @@ class TestVectorEmbeddingsHandler:
         'AWS_SESSION_TOKEN': 'testing'
     })
     @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
-    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_user_config')
-    @patch('rocketnotes_handler.handler_vector_embeddings.main.create_vector_store_from_documents')
-    def test_recreate_index_scenario(self, mock_create_vector_store_from_documents, mock_get_user_config,
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_recreate_index_scenario(self, mock_get_vector_store_factory, mock_get_user_config,
                                    mock_get_embeddings, mock_embeddings, mock_user_config):
         """Test recreate index scenario"""
         # Setup DynamoDB
@@ -242,6 +386,13 @@ class TestVectorEmbeddingsHandler:
             }]
         )
 
+        dynamodb.create_table(
+            TableName='tnn-Vectors',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
         # Add test documents
         test_docs = [
             {
@@ -266,7 +417,7 @@ class TestVectorEmbeddingsHandler:
         mock_get_user_config.return_value = mock_user_config
         mock_get_embeddings.return_value = mock_embeddings
         mock_vector_store = Mock()
-        mock_create_vector_store_from_documents.return_value = mock_vector_store
+        mock_get_vector_store_factory.return_value = mock_vector_store
 
         # Test event
         event = {
@@ -283,11 +434,607 @@ class TestVectorEmbeddingsHandler:
 
         # Verify
         assert result["statusCode"] == 200
-        mock_create_vector_store_from_documents.assert_called_once()
-        # Verify documents were passed to create_vector_store_from_documents
-        call_args = mock_create_vector_store_from_documents.call_args
+        mock_vector_store.add_documents.assert_called_once()
+        # Verify the embedded documents were written to the vector store
+        call_args = mock_vector_store.add_documents.call_args
         documents = call_args[0][0]
         assert len(documents) == 2  # Two documents split
+        # Every indexed section is recorded in the document's chunk manifest
+        ids = call_args[1]["ids"]
+        manifest = dynamodb.get_item(TableName='tnn-Vectors', Key={'id': {'S': 'doc-1'}})
+        assert list(manifest["Item"]["chunks"]["M"].values()) == [{"S": ids[0]}]
+        # The BM25 index is rebuilt from the same sections
+        bm25_index = BM25IndexStore("test-user").load()
+        assert set(bm25_index.chunks) == set(ids)
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'VECTOR_BUCKET_NAME': 'test-vector-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_outdated_model_version_recreates_index(self, mock_get_vector_store_factory,
+                                                    mock_get_user_config, mock_get_embeddings,
+                                                    mock_embeddings, mock_user_config,
+                                                    sample_document, sample_event):
+        """Test that an index built with older vectors of the model is recreated once"""
+        # Setup DynamoDB
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        for table_name in ['tnn-UserConfig', 'tnn-Vectors']:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        dynamodb.create_table(
+            TableName='tnn-Documents',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'id', 'AttributeType': 'S'},
+                {'AttributeName': 'userId', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST',
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'userId-index',
+                'KeySchema': [{'AttributeName': 'userId', 'KeyType': 'HASH'}],
+                'Projection': {'ProjectionType': 'ALL'}
+            }]
+        )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+        dynamodb.put_item(TableName='tnn-Documents', Item=sample_document)
+
+        # Setup mocks, the index was built with /api/embeddings vectors
+        mock_user_config.embeddingsModel = "Ollama-nomic-embed-text"
+        mock_get_user_config.return_value = mock_user_config
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[0.1, 0.2, 0.3]] * len(texts))
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_vector_store = Mock()
+        mock_get_vector_store_factory.return_value = mock_vector_store
+
+        with patch('rocketnotes_handler.handler_vector_embeddings.main.recreate_index',
+                   wraps=recreate_index) as mock_recreate_index:
+            assert handler(sample_event, {})["statusCode"] == 200
+            mock_recreate_index.assert_called_once()
+            marker = dynamodb.get_item(TableName='tnn-Vectors', Key={'id': {'S': 'index#test-user'}})
+            assert marker["Item"]["embeddingsModel"]["S"] == "Ollama-nomic-embed-text@v2"
+
+            # Once recreated, updates are applied incrementally
+            assert handler(sample_event, {})["statusCode"] == 200
+            mock_recreate_index.assert_called_once()
+        mock_vector_store.add_documents.assert_called_once()
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'VECTOR_BUCKET_NAME': 'test-vector-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_update_document_only_embeds_changed_sections(self, mock_get_vector_store_factory,
+                                                          mock_get_user_config, mock_get_embeddings,
+                                                          mock_embeddings, mock_user_config,
+                                                          sample_document, sample_event):
+        """Test that an update only re-embeds new or changed sections"""
+        # Setup DynamoDB
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        for table_name in ['tnn-UserConfig', 'tnn-Documents', 'tnn-Vectors']:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+        dynamodb.put_item(TableName='tnn-Documents', Item=sample_document)
+
+        # Setup mocks
+        mock_get_user_config.return_value = mock_user_config
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[0.1, 0.2, 0.3]] * len(texts))
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_vector_store = Mock()
+        mock_get_vector_store_factory.return_value = mock_vector_store
+
+        # Initial indexing embeds every section
+        assert handler(sample_event, {})["statusCode"] == 200
+        added_documents = mock_vector_store.add_documents.call_args[0][0]
+        added_ids = mock_vector_store.add_documents.call_args[1]["ids"]
+        assert len(added_documents) == 2
+        assert len(mock_embeddings.embed_documents.call_args[0][0]) == 2
+
+        # Change only the second section
+        sample_document["content"] = {"S": f"# Header 1\n{SECTION_TEXT}\n## Header 2\nChanged content here. {SECTION_TEXT}"}
+        dynamodb.put_item(TableName='tnn-Documents', Item=sample_document)
+        mock_vector_store.reset_mock()
+
+        assert handler(sample_event, {})["statusCode"] == 200
+        added_documents = mock_vector_store.add_documents.call_args[0][0]
+        assert len(added_documents) == 1
+        assert "Changed content here." in added_documents[0].page_content
+        mock_vector_store.delete.assert_called_once_with(ids=[added_ids[1]])
+
+        # Unchanged content does not touch the vector store
+        mock_vector_store.reset_mock()
+        assert handler(sample_event, {})["statusCode"] == 200
+        mock_vector_store.add_documents.assert_not_called()
+        mock_vector_store.delete.assert_not_called()
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'VECTOR_BUCKET_NAME': 'test-vector-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_update_document_maintains_bm25_index(self, mock_get_vector_store_factory,
+                                                  mock_get_user_config, mock_get_embeddings,
+                                                  mock_embeddings, mock_user_config,
+                                                  sample_document, sample_event):
+        """Test that updates and deletes are applied to an existing BM25 index"""
+        # Setup DynamoDB
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        for table_name in ['tnn-UserConfig', 'tnn-Documents', 'tnn-Vectors']:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+        dynamodb.put_item(TableName='tnn-Documents', Item=sample_document)
+
+        # The user's index was built by an earlier reindex
+        store = BM25IndexStore("test-user")
+        store.replace(BM25Index())
+        store.save()
+
+        # Setup mocks
+        mock_get_user_config.return_value = mock_user_config
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[0.1, 0.2, 0.3]] * len(texts))
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_vector_store = Mock()
+        mock_get_vector_store_factory.return_value = mock_vector_store
+
+        assert handler(sample_event, {})["statusCode"] == 200
+        added_ids = mock_vector_store.add_documents.call_args[1]["ids"]
+        assert set(BM25IndexStore("test-user").load().chunks) == set(added_ids)
+
+        # Change only the second section
+        sample_document["content"] = {"S": f"# Header 1\n{SECTION_TEXT}\n## Header 2\nChanged content here. {SECTION_TEXT}"}
+        dynamodb.put_item(TableName='tnn-Documents', Item=sample_document)
+
+        assert handler(sample_event, {})["statusCode"] == 200
+        bm25_index = BM25IndexStore("test-user").load()
+        assert added_ids[0] in bm25_index.chunks
+        assert added_ids[1] not in bm25_index.chunks
+        assert bm25_index.search("changed")[0][0] in bm25_index.chunks
+
+        delete_event = {
+            "Records": [{
+                "body": json.dumps({
+                    "userId": "test-user",
+                    "documentId": "doc-123",
+                    "deleteVectors": True
+                })
+            }]
+        }
+        assert handler(delete_event, {})["statusCode"] == 200
+        assert len(BM25IndexStore("test-user").load()) == 0
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'VECTOR_BUCKET_NAME': 'test-vector-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_update_builds_missing_bm25_index(self, mock_get_vector_store_factory,
+                                              mock_get_user_config, mock_get_embeddings,
+                                              mock_embeddings, mock_user_config,
+                                              sample_document, sample_event):
+        """Test that users without a BM25 index get one built from their documents"""
+        # Setup DynamoDB
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        for table_name in ['tnn-UserConfig', 'tnn-Vectors']:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        dynamodb.create_table(
+            TableName='tnn-Documents',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'id', 'AttributeType': 'S'},
+                {'AttributeName': 'userId', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST',
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'userId-index',
+                'KeySchema': [{'AttributeName': 'userId', 'KeyType': 'HASH'}],
+                'Projection': {'ProjectionType': 'ALL'}
+            }]
+        )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+        dynamodb.put_item(TableName='tnn-Documents', Item={
+            'id': {'S': 'doc-456'},
+            'userId': {'S': 'test-user'},
+            'title': {'S': 'Other Document'},
+            'content': {'S': f"# Notes\nERR_4711 is raised on timeout. {SECTION_TEXT}"},
+        })
+        dynamodb.put_item(TableName='tnn-Documents', Item=sample_document)
+
+        # Setup mocks
+        mock_get_user_config.return_value = mock_user_config
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[0.1, 0.2, 0.3]] * len(texts))
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_vector_store = Mock()
+        mock_get_vector_store_factory.return_value = mock_vector_store
+
+        store = BM25IndexStore("test-user")
+        assert not store.exists()
+
+        assert handler(sample_event, {})["statusCode"] == 200
+
+        # Documents that were not part of the job are indexed as well
+        bm25_index = BM25IndexStore("test-user").load()
+        added_ids = mock_vector_store.add_documents.call_args[1]["ids"]
+        assert set(added_ids) < set(bm25_index.chunks)
+        assert bm25_index.search("ERR_4711")[0][0].startswith("doc-456-")
+
+        # An update without changed sections does not write the index
+        with patch.object(BM25IndexStore, 'save') as mock_save:
+            assert handler(sample_event, {})["statusCode"] == 200
+        mock_save.assert_not_called()
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'VECTOR_BUCKET_NAME': 'test-vector-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.recreate_index_batch_size', 1)
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_recreate_index_in_batches(self, mock_get_vector_store_factory, mock_get_user_config,
+                                       mock_get_embeddings, mock_embeddings, mock_user_config):
+        """Test recreate index embeds and writes documents in bounded batches"""
+        # Setup DynamoDB
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        for table_name in ['tnn-UserConfig', 'tnn-Vectors']:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        dynamodb.create_table(
+            TableName='tnn-Documents',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'id', 'AttributeType': 'S'},
+                {'AttributeName': 'userId', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST',
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'userId-index',
+                'KeySchema': [{'AttributeName': 'userId', 'KeyType': 'HASH'}],
+                'Projection': {'ProjectionType': 'ALL'}
+            }]
+        )
+
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+        for i in range(3):
+            dynamodb.put_item(TableName='tnn-Documents', Item={
+                "id": {"S": f"doc-{i}"},
+                "userId": {"S": "test-user"},
+                "title": {"S": f"Doc {i}"},
+                "content": {"S": f"# Header\nContent for document {i}"}
+            })
+
+        # Setup mocks
+        mock_get_user_config.return_value = mock_user_config
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_vector_store = Mock()
+        mock_get_vector_store_factory.return_value = mock_vector_store
+
+        event = {
+            "Records": [{
+                "body": json.dumps({
+                    "userId": "test-user",
+                    "recreateIndex": True
+                })
+            }]
+        }
+
+        result = handler(event, {})
+
+        assert result["statusCode"] == 200
+        # Every batch is embedded and written on its own
+        assert mock_embeddings.embed_documents.call_count == 3
+        assert mock_vector_store.add_documents.call_count == 3
+        for call in mock_vector_store.add_documents.call_args_list:
+            assert len(call[0][0]) == 1
+            assert len(call[1]["ids"]) == 1
+        # The BM25 index is saved a segment per batch, and one removing the
+        # chunks that were not rewritten
+        store = BM25IndexStore("test-user")
+        assert len(store._list_segments()) == 4
+        assert len(store.load()) == 3
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'VECTOR_BUCKET_NAME': 'test-vector-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_update_multiple_documents_in_one_batch(self, mock_get_vector_store_factory,
+                                                    mock_get_user_config, mock_get_embeddings,
+                                                    mock_embeddings, mock_user_config):
+        """Test that multiple documents share one embedding call and one upsert"""
+        # Setup DynamoDB
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        for table_name in ['tnn-UserConfig', 'tnn-Documents', 'tnn-Vectors']:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+        for i in range(3):
+            dynamodb.put_item(TableName='tnn-Documents', Item={
+                "id": {"S": f"doc-{i}"},
+                "title": {"S": f"Doc {i}"},
+                "content": {"S": f"# Header\nContent for document {i}"}
+            })
+
+        # Setup mocks
+        mock_get_user_config.return_value = mock_user_config
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[0.1, 0.2, 0.3]] * len(texts))
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_vector_store = Mock()
+        mock_get_vector_store_factory.return_value = mock_vector_store
+
+        event = {
+            "Records": [{
+                "body": json.dumps({
+                    "userId": "test-user",
+                    "documentIds": ["doc-0", "doc-1", "doc-2"]
+                })
+            }]
+        }
+
+        result = handler(event, {})
+
+        assert result["statusCode"] == 200
+        mock_embeddings.embed_documents.assert_called_once()
+        assert len(mock_embeddings.embed_documents.call_args[0][0]) == 3
+        mock_vector_store.add_documents.assert_called_once()
+        added_documents = mock_vector_store.add_documents.call_args[0][0]
+        assert [doc.metadata["documentId"] for doc in added_documents] == ["doc-0", "doc-1", "doc-2"]
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'VECTOR_BUCKET_NAME': 'test-vector-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.save_documents_vectors')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_batch_of_messages(self, mock_get_vector_store_factory, mock_get_user_config,
+                               mock_get_embeddings, mock_save_documents_vectors,
+                               mock_embeddings, mock_user_config):
+        """Test that a batch is coalesced per user and only failed messages are reported"""
+        # Setup DynamoDB
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        for table_name in ['tnn-UserConfig', 'tnn-Documents', 'tnn-Vectors']:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        for user_id in ['user-a', 'user-b']:
+            dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': user_id}})
+        for document_id in ['doc-a1', 'doc-a2', 'doc-b1']:
+            dynamodb.put_item(TableName='tnn-Documents', Item={
+                "id": {"S": document_id},
+                "title": {"S": document_id},
+                "content": {"S": "# Header\nSome content"}
+            })
+
+        # Setup mocks
+        mock_get_user_config.return_value = mock_user_config
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_get_vector_store_factory.return_value = Mock()
+
+        def save_documents_vectors(documents, userId, *args):
+            if userId == "user-b":
+                raise Exception("Embedding provider unavailable")
+        mock_save_documents_vectors.side_effect = save_documents_vectors
+
+        messages = [
+            ("msg-1", {"userId": "user-a", "documentId": "doc-a1"}),
+            ("msg-2", {"userId": "user-a", "documentId": "doc-a1"}),
+            ("msg-3", {"userId": "user-a", "documentIds": ["doc-a1", "doc-a2"]}),
+            ("msg-4", {"userId": "user-b", "documentId": "doc-b1"}),
+        ]
+        event = {
+            "Records": [
+                {"messageId": message_id, "body": json.dumps(message)}
+                for message_id, message in messages
+            ]
+        }
+
+        result = handler(event, {})
+
+        # Each user is set up once and duplicate documents are updated once
+        assert mock_get_vector_store_factory.call_count == 2
+        assert mock_save_documents_vectors.call_count == 2
+        documents = mock_save_documents_vectors.call_args_list[0][0][0]
+        assert [document["id"]["S"] for document in documents] == ["doc-a1", "doc-a2"]
+
+        # Only the message of the failed user is redelivered
+        assert result["statusCode"] == 500
+        assert result["batchItemFailures"] == [{"itemIdentifier": "msg-4"}]
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'VECTOR_BUCKET_NAME': 'test-vector-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.save_documents_vectors')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_stale_messages_are_skipped(self, mock_get_vector_store_factory, mock_get_user_config,
+                                        mock_get_embeddings, mock_save_documents_vectors,
+                                        mock_embeddings, mock_user_config, sample_document):
+        """Test that messages for outdated document versions do not trigger a re-embed"""
+        # Setup DynamoDB
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        for table_name in ['tnn-UserConfig', 'tnn-Documents', 'tnn-Vectors']:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+        dynamodb.put_item(TableName='tnn-Documents', Item=sample_document)
+
+        # Setup mocks
+        mock_get_user_config.return_value = mock_user_config
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_get_vector_store_factory.return_value = Mock()
+
+        current_hash = document_content_hash(
+            sample_document["title"]["S"], sample_document["content"]["S"]
+        )
+
+        def event_for(*content_hashes):
+            return {
+                "Records": [
+                    {
+                        "messageId": f"msg-{i}",
+                        "body": json.dumps({
+                            "userId": "test-user",
+                            "documentId": "doc-123",
+                            "contentHash": content_hash,
+                        })
+                    }
+                    for i, content_hash in enumerate(content_hashes)
+                ]
+            }
+
+        # Only outdated versions in the batch
+        assert handler(event_for("old-version-1", "old-version-2"), {})["statusCode"] == 200
+        mock_save_documents_vectors.assert_not_called()
+
+        # A burst of saves results in a single re-embed of the current version
+        assert handler(event_for("old-version-1", current_hash), {})["statusCode"] == 200
+        mock_save_documents_vectors.assert_called_once()
+
+    @mock_aws
+    @patch.dict(os.environ, {
+        'BUCKET_NAME': 'test-bucket',
+        'VECTOR_BUCKET_NAME': 'test-vector-bucket',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_SESSION_TOKEN': 'testing'
+    })
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_embeddings_model')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_vector_store_factory')
+    def test_vectors_are_deleted_by_manifest_ids(self, mock_get_vector_store_factory,
+                                                 mock_get_user_config, mock_get_embeddings,
+                                                 mock_embeddings, mock_user_config,
+                                                 sample_document, sample_event):
+        """Test that chunk ids are deterministic and deletes use the stored chunk list"""
+        # Setup DynamoDB
+        dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+        for table_name in ['tnn-UserConfig', 'tnn-Documents', 'tnn-Vectors']:
+            dynamodb.create_table(
+                TableName=table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        dynamodb.put_item(TableName='tnn-UserConfig', Item={'id': {'S': 'test-user'}})
+        dynamodb.put_item(TableName='tnn-Documents', Item=sample_document)
+
+        # Setup mocks
+        mock_get_user_config.return_value = mock_user_config
+        mock_embeddings.embed_documents = Mock(side_effect=lambda texts: [[0.1, 0.2, 0.3]] * len(texts))
+        mock_get_embeddings.return_value = mock_embeddings
+        mock_vector_store = Mock()
+        mock_get_vector_store_factory.return_value = mock_vector_store
+
+        assert handler(sample_event, {})["statusCode"] == 200
+        added_documents = mock_vector_store.add_documents.call_args[0][0]
+        added_ids = mock_vector_store.add_documents.call_args[1]["ids"]
+        assert added_ids == [
+            chunk_vector_id("doc-123", hash_content(document.page_content))
+            for document in added_documents
+        ]
+
+        mock_vector_store.reset_mock()
+        event = {
+            "Records": [{
+                "body": json.dumps({
+                    "userId": "test-user",
+                    "documentId": "doc-123",
+                    "deleteVectors": True
+                })
+            }]
+        }
+
+        assert handler(event, {})["statusCode"] == 200
+        mock_vector_store.delete.assert_called_once_with(ids=added_ids)
+        assert "Item" not in dynamodb.get_item(TableName='tnn-Vectors', Key={'id': {'S': 'doc-123'}})
 
     def test_error_handling_user_not_found(self, sample_event):
         """Test error handling when user is not found"""
@@ -318,7 +1065,7 @@ class TestVectorEmbeddingsHandler:
         'AWS_SECRET_ACCESS_KEY': 'testing',
         'AWS_SESSION_TOKEN': 'testing'
     })
-    @patch('rocketnotes_handler.handler_vector_embeddings.main.get_user_config')
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
     def test_error_handling_no_embeddings_model(self, mock_get_user_config, sample_event):
         """Test error handling when embeddings model is missing"""
         # Setup
@@ -341,6 +1088,80 @@ class TestVectorEmbeddingsHandler:
         assert result["statusCode"] == 400
         assert "Embeddings model is missing" in result["body"]
 
+    @patch('rocketnotes_handler.handler_vector_embeddings.main.load_user_config')
+    def test_missing_api_key_is_not_retried(self, mock_get_user_config, sample_event):
+        """Test that messages of a user without API key are not returned to the queue"""
+        mock_get_user_config.return_value = UserConfig(
+            id="test-user", embeddingsModel="text-embedding-3-small"
+        )
+
+        with patch('rocketnotes_handler.handler_vector_embeddings.main.get_boto3_clients',
+                   return_value=(Mock(), Mock())):
+            result = handler(sample_event, {})
+
+        assert result["statusCode"] == 400
+        assert "OpenAI API key is missing" in result["body"]
+        assert result["batchItemFailures"] == []
+
+
+@mock_aws
+def test_recreate_index_after_model_switch_replaces_all_vectors(tmp_path):
+    """Test that a recreate with a model of another dimension starts a new index"""
+    dynamodb = boto3.client('dynamodb', region_name='us-east-1')
+    dynamodb.create_table(
+        TableName='tnn-Documents',
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'id', 'AttributeType': 'S'},
+            {'AttributeName': 'userId', 'AttributeType': 'S'}
+        ],
+        BillingMode='PAY_PER_REQUEST',
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'userId-index',
+            'KeySchema': [{'AttributeName': 'userId', 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'ALL'}
+        }]
+    )
+    dynamodb.create_table(
+        TableName='tnn-Vectors',
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    dynamodb.put_item(TableName='tnn-Documents', Item={
+        "id": {"S": "doc-1"},
+        "userId": {"S": "test-user"},
+        "title": {"S": "Doc 1"},
+        "content": {"S": f"# Header\n{SECTION_TEXT}"}
+    })
+
+    def recreate(embeddings, model):
+        vector_store = NumpyVectorStore(embeddings, path=str(tmp_path), auto_flush=False)
+        recreate_index(
+            "test-user", EmbeddingExecutor(embeddings), vector_store, dynamodb,
+            embeddingsModel=model,
+        )
+        vector_store.flush()
+        return vector_store
+
+    # A legacy vector with a random id and a section of a deleted document
+    vector_store = recreate(DeterministicFakeEmbedding(size=3), "model-a")
+    vector_store.add_embeddings(["legacy"], [[0.1, 0.2, 0.3]],
+                                [{"documentId": "doc-1"}], ["random-id"])
+    vector_store.add_embeddings(["gone"], [[0.3, 0.2, 0.1]],
+                                [{"documentId": "doc-deleted"}], ["doc-deleted-a"])
+    vector_store.flush()
+
+    # Same model: vectors that were not rewritten are deleted
+    vector_store = recreate(DeterministicFakeEmbedding(size=3), "model-a")
+    assert [metadata["documentId"] for metadata in vector_store._metadatas] == ["doc-1"]
+
+    # Another model with another dimension
+    vector_store = recreate(DeterministicFakeEmbedding(size=5), "model-b")
+    assert len(vector_store) == 1
+    assert vector_store._vectors.shape == (1, 5)
+    assert vector_store.similarity_search("Header", k=1)[0].metadata["documentId"] == "doc-1"
+
 
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -2,6 +2,8 @@ package main
 
 import (
 	"context"
+	"crypto/sha256"
+	"encoding/hex"
 	"encoding/json"
 	"fmt"
 	"log"
@@ -43,8 +45,16 @@ type Document struct {
 }
 
 type SqsMessage struct {
-	UserId     string `json:"userId"`
-	DocumentId string `json:"documentId"`
+	UserId      string `json:"userId"`
+	DocumentId  string `json:"documentId"`
+	ContentHash string `json:"contentHash"`
+}
+
+// contentHash identifies the document version an embedding message was sent for,
+// it must match document_content_hash in handler-ai
+func contentHash(title string, content string) string {
+	hash := sha256.Sum256([]byte(title + "\n" + content))
+	return hex.EncodeToString(hash[:])
 }
 
 func init() {
@@ -130,7 +140,7 @@ func handleRequest(ctx context.Context, request events.APIGatewayProxyRequest) (
 	if user_config.Item != nil && os.Getenv("USE_LOCAL_DYNAMODB") != "1" {
 		qsvc := sqs.New(sess)
 
-		m := SqsMessage{document.UserId, document.ID}
+		m := SqsMessage{document.UserId, document.ID, contentHash(document.Title, document.Content)}
 		b, err := json.Marshal(m)
 
 		_, err = qsvc.SendMessage(&sqs.SendMessageInput{
@@ -16,14 +16,15 @@ import (
 )
 
 type UserConfig struct {
-	Id                string `json:"id"`
-	EmbeddingModel    string `json:"embeddingModel"`
-	Llm               string `json:"llm"`
-	SpeechToTextModel string `json:"speechToTextModel"`
-	OpenAiApiKey      string `json:"openAiApiKey"`
-	AnthropicApiKey   string `json:"anthropicApiKey"`
-	VoyageApiKey      string `json:"voyageApiKey"`
-	TogetherApiKey    string `json:"togetherApiKey"`
+	Id                 string `json:"id"`
+	EmbeddingModel     string `json:"embeddingModel"`
+	Llm                string `json:"llm"`
+	SpeechToTextModel  string `json:"speechToTextModel"`
+	OpenAiApiKey       string `json:"openAiApiKey"`
+	AnthropicApiKey    string `json:"anthropicApiKey"`
+	VoyageApiKey       string `json:"voyageApiKey"`
+	TogetherApiKey     string `json:"togetherApiKey"`
+	VectorQuantization string `json:"vectorQuantization"`
 }
 
 func init() {
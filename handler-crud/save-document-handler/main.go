@@ -2,6 +2,8 @@ package main
 
 import (
 	"context"
+	"crypto/sha256"
+	"encoding/hex"
 	"encoding/json"
 	"log"
 	"os"
@@ -55,8 +57,16 @@ type DocumentTree struct {
 }
 
 type SqsMessage struct {
-	UserId     string `json:"userId"`
-	DocumentId string `json:"documentId"`
+	UserId      string `json:"userId"`
+	DocumentId  string `json:"documentId"`
+	ContentHash string `json:"contentHash"`
+}
+
+// contentHash identifies the document version an embedding message was sent for,
+// it must match document_content_hash in handler-ai
+func contentHash(title string, content string) string {
+	hash := sha256.Sum256([]byte(title + "\n" + content))
+	return hex.EncodeToString(hash[:])
 }
 
 func init() {
@@ -126,7 +136,7 @@ func handleRequest(ctx context.Context, event events.SQSEvent) {
 	if user_config.Item != nil {
 		qsvc := sqs.New(sess)
 
-		m := SqsMessage{item.Body.Document.UserId, item.Body.Document.ID}
+		m := SqsMessage{item.Body.Document.UserId, item.Body.Document.ID, contentHash(item.Body.Document.Title, item.Body.Document.Content)}
 		b, err := json.Marshal(m)
 
 		_, err = qsvc.SendMessage(&sqs.SendMessageInput{
@@ -24,18 +24,21 @@ type RequestBody struct {
 	AnthropicApiKey   string `json:"anthropicApiKey"`
 	VoyageApiKey      string `json:"voyageApiKey"`
 	TogetherApiKey    string `json:"togetherApiKey"`
-	RecreateIndex     bool   `json:"recreateIndex"`
+	// Quantization of the local vector index: "", "int8" or "binary"
+	VectorQuantization string `json:"vectorQuantization"`
+	RecreateIndex      bool   `json:"recreateIndex"`
 }
 
 type UserConfig struct {
-	Id                string `json:"id"`
-	EmbeddingModel    string `json:"embeddingModel"`
-	Llm               string `json:"llm"`
-	SpeechToTextModel string `json:"speechToTextModel"`
-	OpenAiApiKey      string `json:"openAiApiKey"`
-	AnthropicApiKey   string `json:"anthropicApiKey"`
-	VoyageApiKey      string `json:"voyageApiKey"`
-	TogetherApiKey    string `json:"togetherApiKey"`
+	Id                 string `json:"id"`
+	EmbeddingModel     string `json:"embeddingModel"`
+	Llm                string `json:"llm"`
+	SpeechToTextModel  string `json:"speechToTextModel"`
+	OpenAiApiKey       string `json:"openAiApiKey"`
+	AnthropicApiKey    string `json:"anthropicApiKey"`
+	VoyageApiKey       string `json:"voyageApiKey"`
+	TogetherApiKey     string `json:"togetherApiKey"`
+	VectorQuantization string `json:"vectorQuantization"`
 }
 
 type SqsMessage struct {
@@ -65,7 +68,7 @@ func handleRequest(ctx context.Context, request events.APIGatewayProxyRequest) (
 
 	tableName := "tnn-UserConfig"
 
-	av, err := dynamodbattribute.MarshalMap(UserConfig{item.Id, item.EmbeddingModel, item.Llm, item.SpeechToTextModel, item.OpenAiApiKey, item.AnthropicApiKey, item.VoyageApiKey, item.TogetherApiKey})
+	av, err := dynamodbattribute.MarshalMap(UserConfig{item.Id, item.EmbeddingModel, item.Llm, item.SpeechToTextModel, item.OpenAiApiKey, item.AnthropicApiKey, item.VoyageApiKey, item.TogetherApiKey, item.VectorQuantization})
 	if err != nil {
 		log.Fatalf("Got error marshalling new document item: %s", err)
 	}
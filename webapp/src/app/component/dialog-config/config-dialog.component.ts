@@ -40,6 +40,8 @@ export class ConfigDialogComponent implements OnDestroy, OnInit {
   anthropicApiKey: string;
   voyageApiKey: string;
   togetherApiKey: string;
+  // Not editable in the dialog, kept so saving does not reset it
+  vectorQuantization = '';
   isLocal: boolean = !environment.production;
 
   constructor(
@@ -78,6 +80,7 @@ export class ConfigDialogComponent implements OnDestroy, OnInit {
               this.anthropicApiKey = config['anthropicApiKey'] ?? '';
               this.voyageApiKey = config['voyageApiKey'] ?? '';
               this.togetherApiKey = config['togetherApiKey'] ?? '';
+              this.vectorQuantization = config['vectorQuantization'] ?? '';
             },
             (error) => {
               if (error.status === 404) {
@@ -170,6 +173,7 @@ export class ConfigDialogComponent implements OnDestroy, OnInit {
           anthropicApiKey: this.anthropicApiKey,
           voyageApiKey: this.voyageApiKey,
           togetherApiKey: this.togetherApiKey,
+          vectorQuantization: this.vectorQuantization,
           recreateIndex:
             this.currentEmbeddingModel !== this.selectedEmbeddingModel,
         })